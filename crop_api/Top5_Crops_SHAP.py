@@ -1,9 +1,21 @@
 import os
+import hashlib
+import logging
+import threading
+import time
+from functools import lru_cache
 import pandas as pd
 import numpy as np
 import joblib
 import json
 
+from artifact import file_sha256, load_section
+from fast_svc import FastSVCScorer
+from shap_explainer import ShapleyExplainer
+from observability import stage
+
+logger = logging.getLogger(__name__)
+
 # --- Emoji Mapping ---
 emoji_mapping = {
     'rice': '🍚', 'maize': '🌽', 'chickpea': '🫘', 'kidneybeans': '🫘', 'pigeonpea': '🕊️',
@@ -21,70 +33,380 @@ model_path = os.path.join(BASE_DIR, 'svc_poly_model.pkl')
 scaler_path = os.path.join(BASE_DIR, 'scaler.pkl')
 encoder_path = os.path.join(BASE_DIR, 'label_encoder.pkl')
 dataset_path = os.path.join(BASE_DIR, 'datasets', 'Crop_recommendation.csv')
+# Sidecar with the training feature means, so the training CSV is not parsed at boot
+training_means_path = os.path.join(BASE_DIR, 'training_means.json')
 
-# --- Load Files ---
-try:
-    model = joblib.load(model_path)
-    scaler = joblib.load(scaler_path)
-    le = joblib.load(encoder_path)
-    df_train_data = pd.read_csv(dataset_path)
-    print("✅ All necessary files loaded successfully.")
-except FileNotFoundError as e:
-    print(f"❌ Error loading file: {e}")
-    exit()
+# Score with the NumPy fast path (fast_svc.py) instead of scaler.transform + predict_proba
+FAST_INFERENCE = os.environ.get("FAST_INFERENCE", "1") == "1"
+
+# --- Attribution Settings ---
+# 'shap' reports Shapley attributions (shap_explainer.py); 'mean' compares inputs to the training means
+ATTRIBUTION_MODE = os.environ.get("ATTRIBUTION_MODE", "shap")
+# Number of k-means summaries of the training data used as the SHAP background
+SHAP_BACKGROUND_SIZE = int(os.environ.get("SHAP_BACKGROUND_SIZE", 8))
+# Coalitions evaluated per request; 128 (= 2^7) or more gives exact Shapley values
+SHAP_SAMPLE_BUDGET = int(os.environ.get("SHAP_SAMPLE_BUDGET", 128))
+# Inputs are rounded to this many decimals before explaining, which is also the memo key
+SHAP_ROUND_DECIMALS = int(os.environ.get("SHAP_ROUND_DECIMALS", 2))
+SHAP_CACHE_SIZE = int(os.environ.get("SHAP_CACHE_SIZE", 1024))
+shap_background_path = os.path.join(BASE_DIR, 'shap_background.json')
 
 # --- Feature Setup ---
 features = ['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall']
-X_train = df_train_data[features]
-X_train_mean = X_train.mean().to_dict()
+
+
+def model_version():
+    """
+    sha256 over the model, scaler, label encoder and training CSV (which the means and
+    SHAP background come from). Changes whenever any of them is replaced.
+    """
+    digest = hashlib.sha256()
+    for path in (model_path, scaler_path, encoder_path, dataset_path):
+        digest.update(file_sha256(path).encode())
+    return digest.hexdigest()
+
+
+def load_training_means(path=training_means_path, source_path=dataset_path):
+    """
+    Returns the mean of each feature over the training data. Reads the sidecar file
+    when it matches the training CSV, otherwise recomputes it from the CSV and
+    rewrites the sidecar.
+    """
+    source_sha256 = file_sha256(source_path)
+    try:
+        with open(path, encoding='utf-8') as f:
+            sidecar = json.load(f)
+        if sidecar.get('source_sha256') == source_sha256:
+            return sidecar['means']
+    except (FileNotFoundError, ValueError, KeyError):
+        pass
+
+    df_train_data = pd.read_csv(source_path)
+    means = {feature: float(value) for feature, value in df_train_data[features].mean().items()}
+    try:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'source_sha256': source_sha256, 'means': means}, f, indent=2)
+    except OSError as e:
+        logger.warning("Could not write %s: %s", path, e)
+    return means
+
+
+def load_shap_background(n_clusters=SHAP_BACKGROUND_SIZE, path=shap_background_path, source_path=dataset_path):
+    """
+    Returns (centers, weights): k-means summaries of the training features and the
+    share of training rows in each cluster. Cached in a sidecar file like the means.
+    """
+    source_sha256 = file_sha256(source_path)
+    try:
+        with open(path, encoding='utf-8') as f:
+            sidecar = json.load(f)
+        if sidecar.get('source_sha256') == source_sha256 and sidecar.get('n_clusters') == n_clusters:
+            return np.array(sidecar['centers']), np.array(sidecar['weights'])
+    except (FileNotFoundError, ValueError, KeyError):
+        pass
+
+    from sklearn.cluster import KMeans
+
+    X = pd.read_csv(source_path)[features].to_numpy(dtype=float)
+    # Cluster on standardized features so rainfall does not dominate the distance
+    mean, std = X.mean(axis=0), X.std(axis=0)
+    kmeans = KMeans(n_clusters=n_clusters, n_init=10, random_state=0).fit((X - mean) / std)
+    centers = kmeans.cluster_centers_ * std + mean
+    weights = np.bincount(kmeans.labels_, minlength=n_clusters) / len(X)
+    try:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'source_sha256': source_sha256,
+                'n_clusters': n_clusters,
+                'centers': centers.tolist(),
+                'weights': weights.tolist(),
+            }, f, indent=2)
+    except OSError as e:
+        logger.warning("Could not write %s: %s", path, e)
+    return centers, weights
+
+
+# --- Model Registry ---
+class ModelRegistry:
+    """
+    Holds the model, scaler, label encoder and training means, loaded once per process
+    on first use or by warm_up(). A failed load is recorded instead of exiting, so a bad
+    deploy surfaces on the readiness endpoint rather than killing the worker.
+
+    The fast scorer and class names come from the memory-mapped artifact (artifact.py)
+    when it matches the pickles; the sklearn objects are then only unpickled if
+    something asks for model, scaler or le.
+
+    Loading before gunicorn forks (--preload) lets workers share the arrays copy-on-write.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pickle_lock = threading.Lock()
+        self.state = 'not_loaded'
+        self.error = None
+        self.load_seconds = None
+        self.loaded_at = None
+        self.source = None
+        self.version = None
+        self._model = None
+        self._scaler = None
+        self._le = None
+        self.class_names = None
+        self.X_train_mean = None
+        self.fast_scorer = None
+        self.explainer = None
+
+    def warm_up(self):
+        """Loads all artifacts if they are not loaded yet. Returns True when ready."""
+        if self.state == 'ready':
+            return True
+        with self._lock:
+            if self.state == 'ready':
+                return True
+            self.state = 'loading'
+            start = time.perf_counter()
+            try:
+                artifact = load_section('model', (model_path, scaler_path, encoder_path)) if FAST_INFERENCE else None
+                if artifact is not None:
+                    self.class_names = artifact['class_names']
+                    self.fast_scorer = FastSVCScorer.from_arrays(artifact.with_prefix('svc_'))
+                    self.source = 'artifact'
+                else:
+                    # Class names indexed by model output column, decoded once instead of per prediction
+                    self.class_names = np.asarray(self.le.classes_)
+                    if FAST_INFERENCE:
+                        self.fast_scorer = FastSVCScorer(self.model, self.scaler)
+                    self.source = 'pickle'
+                self.version = model_version()
+                self.X_train_mean = load_training_means()
+                background, background_weights = load_shap_background()
+                self.explainer = ShapleyExplainer(self.predict_proba, background, background_weights, SHAP_SAMPLE_BUDGET)
+            except Exception as e:
+                self.state = 'failed'
+                self.error = str(e)
+                logger.error("Error loading model files: %s", e)
+                return False
+            self.load_seconds = time.perf_counter() - start
+            self.loaded_at = time.time()
+            self.error = None
+            self.state = 'ready'
+            logger.info("All necessary files loaded successfully.", extra={"load_seconds": round(self.load_seconds, 3)})
+            return True
+
+    def _load_pickles(self):
+        with self._pickle_lock:
+            if self._model is None:
+                self._scaler = joblib.load(scaler_path)
+                self._le = joblib.load(encoder_path)
+                self._model = joblib.load(model_path)
+
+    @property
+    def model(self):
+        self._load_pickles()
+        return self._model
+
+    @property
+    def scaler(self):
+        self._load_pickles()
+        return self._scaler
+
+    @property
+    def le(self):
+        self._load_pickles()
+        return self._le
+
+    def predict_proba(self, X):
+        """(N, n_classes) probabilities for an (N, 7) matrix of raw feature rows."""
+        with stage('predict_proba'):
+            if self.fast_scorer is not None:
+                if len(X) == 1:
+                    return self.fast_scorer.predict_proba_one(X[0])[np.newaxis]
+                return self.fast_scorer.predict_proba(X)
+            return self.model.predict_proba(self.scaler.transform(pd.DataFrame(X, columns=features)))
+
+    def get(self):
+        """Returns the loaded registry, loading it if needed."""
+        if self.state != 'ready' and not self.warm_up():
+            raise RuntimeError(f"Model artifacts are unavailable: {self.error}")
+        return self
+
+    def status(self):
+        return {
+            "state": self.state,
+            "source": self.source,
+            "version": self.version,
+            "load_seconds": self.load_seconds,
+            "loaded_at": self.loaded_at,
+            "error": self.error,
+        }
+
+
+model_registry = ModelRegistry()
+
+
+def __getattr__(name):
+    # Keep `Top5_Crops_SHAP.model` etc. working as lazily loaded module attributes
+    if name in ('model', 'scaler', 'le', 'class_names', 'X_train_mean'):
+        return getattr(model_registry.get(), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# --- Batch Scoring ---
+def _as_feature_matrix(samples):
+    """
+    Converts a list of feature dicts or a 2-D array-like into an (N, 7) float matrix
+    with columns in the order of `features`.
+    """
+    if isinstance(samples, np.ndarray):
+        X = samples.astype(float, copy=False)
+    elif len(samples) and isinstance(samples[0], dict):
+        X = np.array([[row[f] for f in features] for row in samples], dtype=float)
+    else:
+        X = np.asarray(samples, dtype=float)
+    if X.ndim == 1:
+        X = X.reshape(1, -1)
+    if X.ndim != 2 or X.shape[1] != len(features):
+        raise ValueError(f"Expected rows of {len(features)} features {features}, got shape {X.shape}.")
+    return X
+
+
+def predict_proba_batch(samples):
+    """
+    Returns the (N, n_classes) probability matrix for N samples in a single
+    scaler/predict_proba pass.
+    """
+    return model_registry.get().predict_proba(_as_feature_matrix(samples))
+
+
+def get_top_k_recommendations_batch(samples, k=5):
+    """
+    Returns the top k crop recommendations for every sample.
+
+    Args:
+        samples: A list of dicts keyed by feature name, or a 2-D array of shape (N, 7)
+            with columns N, P, K, temperature, humidity, ph, rainfall.
+        k (int): Number of crops per sample.
+
+    Returns:
+        list: One list of {"crop", "confidence_score", "emoji"} dicts per sample,
+              ordered by confidence.
+    """
+    if len(samples) == 0:
+        return []
+    probabilities = predict_proba_batch(samples)
+    k = max(1, min(k, probabilities.shape[1]))
+
+    # argpartition finds the k best columns in O(n_classes); only those k are sorted
+    top_k = np.argpartition(probabilities, -k, axis=1)[:, -k:]
+    top_k_probs = np.take_along_axis(probabilities, top_k, axis=1)
+    order = np.argsort(-top_k_probs, axis=1, kind='stable')
+    top_k = np.take_along_axis(top_k, order, axis=1)
+    top_k_probs = np.take_along_axis(top_k_probs, order, axis=1) * 100
+    top_k_names = model_registry.get().class_names[top_k]
+
+    return [
+        [
+            {
+                "crop": crop_name,
+                "confidence_score": float(confidence),
+                "emoji": emoji_mapping.get(crop_name, '🌱')
+            }
+            for crop_name, confidence in zip(names, confidences)
+        ]
+        for names, confidences in zip(top_k_names.tolist(), top_k_probs)
+    ]
+
 
 # --- Top 5 Recommendations ---
 def get_top_5_recommendations(n, p, k, temperature, humidity, ph, rainfall):
     """
     Returns the top 5 crop recommendations and their confidence scores with emojis.
     """
-    input_data = pd.DataFrame([[n, p, k, temperature, humidity, ph, rainfall]], columns=features)
-    probabilities = model.predict_proba(scaler.transform(input_data))[0]
-    top_5_indices = np.argsort(probabilities)[::-1][:5]
-    
-    recommendations = []
-    for i in top_5_indices:
-        crop_name = le.inverse_transform([i])[0]
-        confidence = probabilities[i] * 100
-        emoji = emoji_mapping.get(crop_name, '🌱')
-        recommendations.append({
-            "crop": crop_name,
-            "confidence_score": confidence,
-            "emoji": emoji
-        })
-    return recommendations
+    return get_top_k_recommendations_batch([[n, p, k, temperature, humidity, ph, rainfall]], k=5)[0]
 
 # --- Crop Detail with Explainability ---
-def get_crop_details_with_explainability(n, p, k, temperature, humidity, ph, rainfall, crop_name):
+@lru_cache(maxsize=SHAP_CACHE_SIZE)
+def _explain_rounded(rounded_values):
+    """Memoized Shapley attributions for all classes, keyed on the rounded input."""
+    return model_registry.get().explainer.explain(np.array(rounded_values))
+
+
+def attribution_cache_info():
+    """Hit/miss counters and size of the attribution memo (functools CacheInfo)."""
+    return _explain_rounded.cache_info()
+
+
+def _round_inputs(input_values):
+    return tuple(round(float(v), SHAP_ROUND_DECIMALS) for v in input_values)
+
+
+def _shap_contributions(input_values, crop_index):
     """
-    Returns detailed explainability data for a specific crop with emoji.
+    Shapley attributions of the crop's probability, in percentage points.
+    Returns (details, confidence) where confidence comes from the same batched evaluation.
     """
-    input_data = pd.DataFrame([[n, p, k, temperature, humidity, ph, rainfall]], columns=features)
-    probabilities = model.predict_proba(scaler.transform(input_data))[0]
-    
-    try:
-        crop_index = list(le.classes_).index(crop_name)
-        confidence = probabilities[crop_index] * 100
-    except ValueError:
-        return {"error": f"Crop '{crop_name}' not found in the model's classes."}
-    
+    rounded = _round_inputs(input_values)
+    return _shap_details(rounded, _explain_rounded(rounded), crop_index)
+
+
+def _shap_details(rounded, explanation, crop_index):
+    """Contribution lists and attributions of one crop from an _explain_rounded result."""
+    phi, base_value, prediction = explanation
+    attributions = {feature: float(phi[i, crop_index] * 100) for i, feature in enumerate(features)}
+
+    ranked = sorted(zip(features, rounded), key=lambda item: -abs(attributions[item[0]]))
+    details = {
+        "positive_contributions": [f"{feature} ({value:.2f}, {attributions[feature]:+.2f}%)"
+                                   for feature, value in ranked if attributions[feature] > 0],
+        "negative_contributions": [f"{feature} ({value:.2f}, {attributions[feature]:+.2f}%)"
+                                   for feature, value in ranked if attributions[feature] < 0],
+        "attributions": attributions,
+        "base_value": float(base_value[crop_index] * 100),
+        "attribution_method": model_registry.get().explainer.method
+    }
+    return details, prediction[crop_index] * 100
+
+
+def _mean_contributions(input_values, means):
+    """(positive, negative) lists comparing each input to its training mean."""
     positive_contributions = []
     negative_contributions = []
-    
-    for feature in features:
-        input_value = input_data[feature].iloc[0]
-        mean_value = X_train_mean[feature]
+
+    for feature, input_value in zip(features, input_values):
+        mean_value = means[feature]
         if input_value > mean_value:
             positive_contributions.append(f"{feature} ({input_value:.2f} > avg)")
         elif input_value < mean_value:
             negative_contributions.append(f"{feature} ({input_value:.2f} < avg)")
-    
+    return positive_contributions, negative_contributions
+
+
+def get_crop_details_with_explainability(n, p, k, temperature, humidity, ph, rainfall, crop_name, attribution=None):
+    """
+    Returns detailed explainability data for a specific crop with emoji.
+
+    With attribution='shap' (the default, see ATTRIBUTION_MODE) the contributions are
+    Shapley values of the crop's confidence; with 'mean' they compare each input to
+    the training mean.
+    """
+    registry = model_registry.get()
+    input_values = np.array([[n, p, k, temperature, humidity, ph, rainfall]], dtype=float)
+
+    try:
+        crop_index = list(registry.class_names).index(crop_name)
+    except ValueError:
+        return {"error": f"Crop '{crop_name}' not found in the model's classes."}
+
     emoji = emoji_mapping.get(crop_name, '🌱')
+    if (attribution or ATTRIBUTION_MODE) == 'shap':
+        details, confidence = _shap_contributions(input_values[0], crop_index)
+        return {"crop": crop_name, "confidence_score": confidence, "emoji": emoji, **details}
+
+    probabilities = registry.predict_proba(input_values)[0]
+    confidence = probabilities[crop_index] * 100
+    positive_contributions, negative_contributions = _mean_contributions(input_values[0], registry.X_train_mean)
+
     explanation = {
         "crop": crop_name,
         "confidence_score": confidence,
@@ -94,6 +416,79 @@ def get_crop_details_with_explainability(n, p, k, temperature, humidity, ph, rai
     }
     return explanation
 
+# --- Top K with Details ---
+def get_top_k_with_details(n, p, k, temperature, humidity, ph, rainfall, top_k=5, attribution=None, compact=False):
+    """
+    Returns the top_k crops, each with its confidence and explainability data, from a
+    single evaluation of the model: with 'shap' attribution the Shapley explanation
+    already holds the prediction for every class, otherwise one predict_proba call
+    serves all crops. Replaces one /predict_lab_report plus a /get_crop_details call
+    per crop.
+
+    Args:
+        top_k (int): Number of crops.
+        attribution (str): 'shap' or 'mean'; defaults to ATTRIBUTION_MODE.
+        compact (bool): Return columnar arrays instead of one dict per crop.
+
+    Returns:
+        list: Without compact, one dict per crop, best first, with the same fields as
+              get_crop_details_with_explainability.
+        dict: With compact, "crops" and "confidence_score" lists plus the feature names
+              and inputs once. 'shap' adds "base_value" and "attributions" (one row of
+              percentage points per crop, in feature order); 'mean' adds
+              "relative_to_mean" (1 above, -1 below, 0 equal, per feature), which is the
+              same for every crop. Numbers are rounded to 4 decimals, and emojis and
+              contribution strings are left to the client.
+    """
+    registry = model_registry.get()
+    input_values = np.array([n, p, k, temperature, humidity, ph, rainfall], dtype=float)
+    method = attribution or ATTRIBUTION_MODE
+
+    if method == 'shap':
+        rounded = _round_inputs(input_values)
+        explanation = _explain_rounded(rounded)
+        probabilities = explanation[2]
+    else:
+        probabilities = registry.predict_proba(input_values[np.newaxis])[0]
+
+    top_k = max(1, min(int(top_k), len(probabilities)))
+    order = np.argsort(-probabilities, kind='stable')[:top_k]
+    crop_names = registry.class_names[order].tolist()
+    confidences = probabilities[order] * 100
+
+    if compact:
+        result = {
+            "attribution_method": registry.explainer.method if method == 'shap' else method,
+            "features": features,
+            "crops": crop_names,
+            "confidence_score": np.round(confidences, 4).tolist(),
+        }
+        if method == 'shap':
+            phi, base_value, _ = explanation
+            result["inputs"] = list(rounded)
+            result["base_value"] = np.round(base_value[order] * 100, 4).tolist()
+            result["attributions"] = np.round(phi[:, order].T * 100, 4).tolist()
+        else:
+            means = np.array([registry.X_train_mean[feature] for feature in features])
+            result["inputs"] = input_values.tolist()
+            result["relative_to_mean"] = np.sign(input_values - means).astype(int).tolist()
+        return result
+
+    if method != 'shap':
+        positive_contributions, negative_contributions = _mean_contributions(input_values, registry.X_train_mean)
+
+    recommendations = []
+    for crop_name, crop_index, confidence in zip(crop_names, order.tolist(), confidences.tolist()):
+        entry = {"crop": crop_name, "confidence_score": confidence, "emoji": emoji_mapping.get(crop_name, '🌱')}
+        if method == 'shap':
+            details, _ = _shap_details(rounded, explanation, crop_index)
+            entry.update(details)
+        else:
+            entry["positive_contributions"] = positive_contributions
+            entry["negative_contributions"] = negative_contributions
+        recommendations.append(entry)
+    return recommendations
+
 # --- Example Local Test ---
 if __name__ == "__main__":
     input_n = 50
@@ -1,21 +1,271 @@
 # Save this as crop_api/app.py
 
-from flask import Flask, request, jsonify
-from geopy.geocoders import Nominatim
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS # Import CORS
 # Import your internal modules
-from weather_service import get_weather_data
-from crop_recommender import get_final_recommendation
+from weather_service import get_last_known_weather, get_weather_data, get_weather_cache_stats
+from geocoding_service import reverse_geocode
+from concurrent_io import fan_out, WEATHER_DEADLINE, GEOCODE_DEADLINE
+from crop_recommender import (
+    get_data_store,
+    get_recommendation_records,
+    recommendation_cache_fields,
+    get_recommendation_table,
+    reload_data_store,
+    data_store_status,
+    WEATHER_MATCHER,
+    WEATHER_KNN_K
+)
 from Top5_Crops_SHAP import (
+    model_registry,
     get_top_5_recommendations,
-    get_crop_details_with_explainability
+    get_top_k_recommendations_batch,
+    get_crop_details_with_explainability,
+    get_top_k_with_details,
+    attribution_cache_info,
+    ATTRIBUTION_MODE,
+    FAST_INFERENCE,
+    SHAP_BACKGROUND_SIZE,
+    SHAP_SAMPLE_BUDGET
+)
+from observability import (
+    cache_events,
+    configure_logging,
+    end_trace,
+    http_request_duration,
+    http_requests,
+    register_collector,
+    render_metrics,
+    stage,
+    start_trace
+)
+from response_cache import RESPONSE_CACHE_MAX_AGE, cache_key, canonical_body, make_response_cache
+from streaming import (
+    MAX_STREAM_CHUNK_SIZE,
+    STREAM_CHUNK_SIZE,
+    guard_stream,
+    iter_ndjson,
+    spool_lines,
+    stream_lab_recommendations,
+    stream_no_lab_recommendations
 )
 
+import functools
+import hmac
+import logging
 import os
+import time
+
+configure_logging()
+logger = logging.getLogger(__name__)
+
+# Upper bound on samples per /predict_lab_report/batch request
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", 10000))
+# /yield_observations and /reload_datasets require "Authorization: Bearer <token>";
+# while it is unset they answer 503
+INGEST_TOKEN = os.environ.get("INGEST_TOKEN", "")
 
 app = Flask(__name__)
 CORS(app)  # Initialize CORS for your app
 
+
+def warm_up():
+    """
+    Loads the model and datasets ahead of the first request. This runs at import, so
+    under gunicorn --preload it happens once in the master and forked workers share
+    the loaded objects. Failures are reported on /ready instead of stopping the app.
+    """
+    model_registry.warm_up()
+    try:
+        get_data_store()
+        get_recommendation_table()
+    except Exception:
+        logger.exception("Error loading datasets")
+
+
+if os.environ.get("MODEL_WARMUP", "1") == "1":
+    warm_up()
+
+
+def json_response(payload, status=200):
+    """jsonify() timed as the json_serialization stage."""
+    with stage('json_serialization'):
+        return jsonify(payload), status
+
+
+def weather_or_last_known(results, missing, lat, lon):
+    """
+    The weather from a fan_out() result. When the upstream missed its deadline the last
+    stored forecast for the cell is used instead, and 'weather' is taken off missing.
+    """
+    if 'weather' in missing:
+        last_known = get_last_known_weather(lat, lon)
+        if last_known is not None:
+            missing.remove('weather')
+            return last_known
+    return results['weather']
+
+
+def token_required(view):
+    """Answers 401 unless the request carries the INGEST_TOKEN bearer token, and 503 while none is set."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not INGEST_TOKEN:
+            return jsonify({"error": "This endpoint is disabled: set INGEST_TOKEN to enable it."}), 503
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {INGEST_TOKEN}"):
+            return jsonify({"error": "Unauthorized."}), 401
+        return view(*args, **kwargs)
+
+    return wrapper
+
+
+# ----------------------------------------
+# Response cache for deterministic endpoints
+# ----------------------------------------
+response_cache = make_response_cache()
+
+# Settings that change the answers for the same body, so workers configured
+# differently never share entries through the shared backend
+_RESPONSE_SETTINGS = (f"{ATTRIBUTION_MODE}:{SHAP_SAMPLE_BUDGET}:{SHAP_BACKGROUND_SIZE}:{int(FAST_INFERENCE)}:"
+                      f"{WEATHER_MATCHER}:{WEATHER_KNN_K}")
+
+
+def response_generation():
+    """
+    Everything a cached response depends on besides its request body: the content of
+    the model and dataset files, the number of ingested yield observations and the
+    settings above. Reloading changed datasets, ingesting observations or deploying a
+    new model changes it, which invalidates every earlier entry and ETag.
+    """
+    store = get_data_store()
+    return f"{model_registry.get().version}:{store.fingerprint}:{store.yield_version()}:{_RESPONSE_SETTINGS}"
+
+
+def _cacheable_headers(response, etag):
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f'private, max-age={RESPONSE_CACHE_MAX_AGE}'
+    return response
+
+
+def cached_json_endpoint(view=None, key_body=canonical_body):
+    """
+    Serves a POST endpoint whose answer depends only on its JSON body through the
+    response cache. The view is always called with the body as sent; the key is built
+    from key_body(body), which must hold everything the answer depends on (by default
+    the whole body with numbers as exact floats). Only 200 responses are stored.
+
+    The ETag is derived from the cache key. These POSTs are queries, so a client that
+    sends it back in If-None-Match gets a 304 without the view or the cache running.
+    """
+    if view is None:
+        return functools.partial(cached_json_endpoint, key_body=key_body)
+
+    @functools.wraps(view)
+    def wrapper():
+        data = request.get_json()
+        if response_cache is None or not isinstance(data, dict):
+            return view(data)
+        try:
+            etag = cache_key(request.path, response_generation(), key_body(data))
+        except Exception:
+            etag = None
+        if etag is None:
+            # Invalid body, or model or datasets unavailable; the view reports the error
+            return view(data)
+
+        if request.if_none_match.contains(etag):
+            cache_events.inc(cache='response', result='not_modified')
+            return _cacheable_headers(Response(status=304), etag)
+
+        with stage('response_cache'):
+            body = response_cache.get(etag)
+        if body is not None:
+            return _cacheable_headers(Response(body, mimetype='application/json'), etag)
+
+        response = app.make_response(view(data))
+        if response.status_code == 200:
+            response_cache.set(etag, response.get_data())
+            _cacheable_headers(response, etag)
+        return response
+
+    return wrapper
+
+
+# ----------------------------------------
+# Streaming (NDJSON) helpers
+# ----------------------------------------
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/jsonl')
+
+
+def stream_input_rows(key):
+    """
+    Input rows of a streaming request. An NDJSON body (one row per line) is spooled
+    to disk and parsed line by line as the rows are scored, so it is never held in
+    memory as a whole; a JSON body may carry the rows as a list under key (or be the
+    list). Returns None when there are no rows.
+    """
+    if request.mimetype in NDJSON_MIMETYPES:
+        return iter_ndjson(spool_lines(request.stream))
+    data = request.get_json()
+    rows = data.get(key) if isinstance(data, dict) else data
+    return rows if isinstance(rows, list) and rows else None
+
+
+def ndjson_response(chunks, endpoint):
+    """Streams the chunks as they are produced, keeping the request context alive."""
+    return Response(stream_with_context(guard_stream(chunks, endpoint)), mimetype='application/x-ndjson')
+
+
+def stream_chunk_size():
+    chunk_size = request.args.get('chunk_size', STREAM_CHUNK_SIZE, type=int)
+    return max(1, min(chunk_size, MAX_STREAM_CHUNK_SIZE))
+
+
+# ----------------------------------------
+# Request instrumentation
+# ----------------------------------------
+@app.before_request
+def _start_request_trace():
+    g.request_start = time.perf_counter()
+    g.trace = start_trace()
+
+
+@app.after_request
+def _record_request(response):
+    start = g.pop('request_start', None)
+    if start is None:
+        return response
+    elapsed = time.perf_counter() - start
+    # Label by route pattern rather than raw path, so label cardinality stays bounded.
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    http_requests.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    http_request_duration.observe(elapsed, endpoint=endpoint)
+    logger.debug("request finished", extra={
+        "endpoint": endpoint,
+        "method": request.method,
+        "status": response.status_code,
+        "duration_ms": round(elapsed * 1000, 3),
+        "stages": {name: round(seconds * 1000, 3) for name, seconds in g.pop('trace', [])},
+    })
+    end_trace()
+    return response
+
+
+def _collect_cache_metrics():
+    weather = get_weather_cache_stats()
+    yield ('agropilot_weather_cache_entries', 'gauge', "Entries in the weather cache.", {}, weather['entries'])
+    shap = attribution_cache_info()
+    yield ('agropilot_shap_memo_entries', 'gauge', "Entries in the attribution memo.", {}, shap.currsize)
+    yield ('agropilot_shap_memo_lookups_total', 'counter', "Attribution memo lookups by result.", {'result': 'hit'}, shap.hits)
+    yield ('agropilot_shap_memo_lookups_total', 'counter', "Attribution memo lookups by result.", {'result': 'miss'}, shap.misses)
+    if response_cache is not None:
+        responses = response_cache.stats()
+        yield ('agropilot_response_cache_entries', 'gauge', "Entries in the local response cache.", {}, responses['entries'])
+        yield ('agropilot_response_cache_bytes', 'gauge', "Bytes held by the local response cache.", {}, responses['bytes'])
+
+
+register_collector(_collect_cache_metrics)
+
 # OR, for more specific control:
 # CORS(app, resources={r"/api/*": {"origins": "*"}})
 # ----------------------------------------
@@ -38,17 +288,15 @@ def get_weather_and_location():
         return jsonify({"error": "Latitude and longitude are required."}), 400
 
     try:
-        # Get weather data
-        temp, humidity, rainfall = get_weather_data(lat, lon)
-
-        # Reverse geocoding
-        geolocator = Nominatim(user_agent="agropilot")
-        location = geolocator.reverse((lat, lon), language="en")
-
-        location_data = {
-            'district': location.raw['address'].get('city', '') or location.raw['address'].get('county', ''),
-            'state': location.raw['address'].get('state', '')
-        }
+        # Weather and reverse geocoding are independent, so run them concurrently.
+        # Whichever misses its deadline comes back empty instead of holding up the other.
+        results, missing = fan_out({
+            'weather': (WEATHER_DEADLINE, get_weather_data, lat, lon),
+            'location': (GEOCODE_DEADLINE, reverse_geocode, lat, lon),
+        })
+        results['weather'] = weather_or_last_known(results, missing, lat, lon)
+        temp, humidity, rainfall = results['weather'] or (None, None, None)
+        location_data = results['location'] or {'district': '', 'state': ''}
 
         response_data = {
             "weather": {
@@ -58,10 +306,13 @@ def get_weather_and_location():
             },
             "location": location_data
         }
+        if missing:
+            response_data["partial"] = missing
 
-        return jsonify(response_data), 200
+        return json_response(response_data)
 
     except Exception as e:
+        logger.exception("Error in /get_weather_and_location")
         return jsonify({"error": str(e)}), 500
 
 
@@ -82,16 +333,23 @@ def recommendations():
         return jsonify({"error": "Latitude and longitude are required."}), 400
 
     try:
-        temp, humidity, rainfall = get_weather_data(lat, lon)
+        calls = {'weather': (WEATHER_DEADLINE, get_weather_data, lat, lon)}
+        if not data.get('district'):
+            calls['location'] = (GEOCODE_DEADLINE, reverse_geocode, lat, lon)
+        results, missing = fan_out(calls)
 
-        district = 'Ahmednagar'  # you can change later to dynamic input
-        season = 'kharif'
+        # Without weather the recommender falls back to season-only results.
+        temp, humidity, rainfall = weather_or_last_known(results, missing, lat, lon) or (None, None, None)
+        location = results.get('location') or {}
+        district = data.get('district') or location.get('district') or 'Ahmednagar'
+        season = data.get('season', 'kharif')
 
-        final_recs = get_final_recommendation(district, season, temp, rainfall)
+        final_recs = get_recommendation_records(district, season, temp, rainfall)
 
-        return jsonify(final_recs.to_dict(orient='records')), 200
+        return json_response(final_recs)
 
     except Exception as e:
+        logger.exception("Error in /recommendations")
         return jsonify({"error": str(e)}), 500
 
 
@@ -99,9 +357,8 @@ def recommendations():
 # 3️⃣ With Lab Report
 # ----------------------------------------
 @app.route('/predict_lab_report', methods=['POST'])
-def predict_lab_report():
-    data = request.get_json()
-
+@cached_json_endpoint
+def predict_lab_report(data):
     try:
         n = data['N']
         p = data['P']
@@ -112,48 +369,159 @@ def predict_lab_report():
         rainfall = data['rainfall']
 
         recommendations = get_top_5_recommendations(n, p, k, temperature, humidity, ph, rainfall)
-        return jsonify({"recommendations": recommendations}), 200
+        return json_response({"recommendations": recommendations})
 
     except Exception as e:
+        logger.exception("Error in /predict_lab_report")
         return jsonify({"error": str(e)}), 500
 
 
 # ----------------------------------------
-# 4️⃣ Without Lab Report
-@app.route('/predict_no_lab_report', methods=['POST'])
-def predict_no_lab_report():
+# 3️⃣b With Lab Report (batch)
+# ----------------------------------------
+@app.route('/predict_lab_report/batch', methods=['POST'])
+def predict_lab_report_batch():
     data = request.get_json()
-    print("\n🛰️ Incoming request to /predict_no_lab_report:", data)  # ADD THIS LINE
+
+    samples = data.get('samples') if isinstance(data, dict) else data
+    if not isinstance(samples, list) or not samples:
+        return jsonify({"error": "A non-empty 'samples' list is required."}), 400
+    if len(samples) > MAX_BATCH_SIZE:
+        return jsonify({"error": f"At most {MAX_BATCH_SIZE} samples per request."}), 413
 
     try:
-        district = data['district']
-        season = data['season']
-        temperature = data['temperature']
-        rainfall = data['rainfall']
+        top_k = int(data.get('top_k', 5)) if isinstance(data, dict) else 5
+        recommendations = get_top_k_recommendations_batch(samples, k=top_k)
+        return json_response({"recommendations": recommendations})
+
+    except (KeyError, ValueError, TypeError) as e:
+        return jsonify({"error": f"Invalid sample: {e}"}), 400
+    except Exception as e:
+        logger.exception("Error in /predict_lab_report/batch")
+        return jsonify({"error": str(e)}), 500
 
-        print(f"📊 Inputs → District: {district}, Season: {season}, Temp: {temperature}, Rainfall: {rainfall}")
 
-        final_recs = get_final_recommendation(district, season, temperature, rainfall)
-        print(f"✅ get_final_recommendation returned {len(final_recs)} records")
+# ----------------------------------------
+# 3️⃣c With Lab Report, top crops with their details in one call
+# ----------------------------------------
+@app.route('/predict_lab_report/details', methods=['POST'])
+@cached_json_endpoint
+def predict_lab_report_details(data):
+    if not data:
+        return jsonify({"error": "No data provided."}), 400
+
+    try:
+        n = float(data['N'])
+        p = float(data['P'])
+        k = float(data['K'])
+        ph = float(data['ph'])
+        temperature = float(data['temperature'])
+        humidity = float(data['humidity'])
+        rainfall = float(data['rainfall'])
+        top_k = int(data.get('top_k', 5))
+        # A body field rather than a query parameter, so it is part of the cache key
+        compact = data.get('compact', False)
+    except (KeyError, ValueError, TypeError) as e:
+        return jsonify({"error": f"Invalid lab report: {e}"}), 400
+    if not isinstance(compact, bool):
+        return jsonify({"error": "Invalid lab report: compact must be true or false."}), 400
+
+    try:
+        result = get_top_k_with_details(n, p, k, temperature, humidity, ph, rainfall, top_k=top_k,
+                                        attribution=data.get('attribution'), compact=compact)
+        return json_response(result if compact else {"recommendations": result})
 
-        if final_recs.empty:
+    except Exception as e:
+        logger.exception("Error in /predict_lab_report/details")
+        return jsonify({"error": str(e)}), 500
+
+
+# ----------------------------------------
+# 3️⃣d With Lab Report (streaming NDJSON)
+# ----------------------------------------
+@app.route('/predict_lab_report/stream', methods=['POST'])
+def predict_lab_report_stream():
+    """
+    Like /predict_lab_report/batch without a size limit: send NDJSON (one sample per
+    line) or {"samples": [...]}, and get one NDJSON line per sample back as each chunk
+    is scored. ?top_k= and ?chunk_size= are optional.
+    """
+    rows = stream_input_rows('samples')
+    if rows is None:
+        return jsonify({"error": "A non-empty 'samples' list or an NDJSON body is required."}), 400
+
+    top_k = request.args.get('top_k', 5, type=int)
+    return ndjson_response(stream_lab_recommendations(rows, top_k=top_k, chunk_size=stream_chunk_size()),
+                           '/predict_lab_report/stream')
+
+
+# ----------------------------------------
+# 4️⃣ Without Lab Report
+# ----------------------------------------
+def _no_lab_report_inputs(data):
+    """
+    (district, season, temperature, rainfall) from the body, with the weather values as
+    floats (or None). The view and the cache key both read the body through this, so
+    they always see the same values. Raises KeyError, ValueError or TypeError.
+    """
+    temperature, rainfall = (None if data[field] is None else float(data[field]) for field in ('temperature', 'rainfall'))
+    return data['district'], data['season'], temperature, rainfall
+
+
+def _no_lab_report_cache_body(data):
+    """Response cache key: the answer only depends on the weather through its bins and printed values."""
+    district, season, temperature, rainfall = _no_lab_report_inputs(data)
+    return [district, season, *recommendation_cache_fields(temperature, rainfall)]
+
+
+@app.route('/predict_no_lab_report', methods=['POST'])
+@cached_json_endpoint(key_body=_no_lab_report_cache_body)
+def predict_no_lab_report(data):
+    logger.debug("Incoming request to /predict_no_lab_report", extra={"body": data})
+
+    try:
+        district, season, temperature, rainfall = _no_lab_report_inputs(data)
+    except (KeyError, ValueError, TypeError) as e:
+        return jsonify({"error": f"Invalid scenario: {e}"}), 400
+
+    try:
+        final_recs = get_recommendation_records(district, season, temperature, rainfall)
+        logger.debug("get_recommendation_records returned %d records", len(final_recs))
+
+        if not final_recs:
             return jsonify({"error": "No recommendations available"}), 404
 
-        return jsonify(final_recs.to_dict(orient='records')), 200
+        return json_response(final_recs)
 
     except Exception as e:
-        print(f"❌ Error in /predict_no_lab_report: {e}")
+        logger.exception("Error in /predict_no_lab_report")
         return jsonify({"error": str(e)}), 500
 
+# ----------------------------------------
+# 4️⃣b Without Lab Report (streaming NDJSON), e.g. every district of a region
+# ----------------------------------------
+@app.route('/predict_no_lab_report/stream', methods=['POST'])
+def predict_no_lab_report_stream():
+    """
+    Send NDJSON (one {district, season, temperature, rainfall} scenario per line) or
+    {"scenarios": [...]}, and get one NDJSON line of recommendations per scenario back
+    as each chunk is computed. ?chunk_size= is optional.
+    """
+    rows = stream_input_rows('scenarios')
+    if rows is None:
+        return jsonify({"error": "A non-empty 'scenarios' list or an NDJSON body is required."}), 400
+
+    return ndjson_response(stream_no_lab_recommendations(rows, chunk_size=stream_chunk_size()),
+                           '/predict_no_lab_report/stream')
+
+
 # ----------------------------------------
 # 5️⃣ Crop details explainability
 # ----------------------------------------
 @app.route('/get_crop_details', methods=['POST'])
-def get_crop_details():
+@cached_json_endpoint
+def get_crop_details(data):
     try:
-        data = request.get_json()
-        print(f"\n📥 Detail request for crop: {data.get('crop_name')}")
-
         n = float(data['N'])
         p = float(data['P'])
         k = float(data['K'])
@@ -162,19 +530,117 @@ def get_crop_details():
         humidity = float(data['humidity'])
         rainfall = float(data['rainfall'])
         crop_name = data['crop_name']
+    except (KeyError, ValueError, TypeError) as e:
+        return jsonify({"error": f"Invalid lab report: {e}"}), 400
 
+    try:
         details = get_crop_details_with_explainability(
-            n, p, k, temperature, humidity, ph, rainfall, crop_name
+            n, p, k, temperature, humidity, ph, rainfall, crop_name,
+            attribution=data.get('attribution')
         )
+        if 'error' in details:
+            return jsonify(details), 404
 
-        print(f"📤 Sending details for {crop_name}: {details['confidence_score']:.2f}%")
-        return jsonify(details), 200
+        logger.debug("Sending details for %s: %.2f%%", crop_name, details['confidence_score'])
+        return json_response(details)
 
     except Exception as e:
-        print(f"❌ Error in get_crop_details: {str(e)}")
+        logger.exception("Error in /get_crop_details")
         return jsonify({'error': str(e)}), 500
 
 
+# ----------------------------------------
+# Readiness (model and dataset load state)
+# ----------------------------------------
+@app.route('/ready', methods=['GET'])
+def ready():
+    model_status = model_registry.status()
+    datasets_status = data_store_status()
+    is_ready = model_status['state'] == 'ready' and datasets_status['state'] == 'ready'
+    response_data = {
+        "ready": is_ready,
+        "model": model_status,
+        "datasets": datasets_status
+    }
+    return jsonify(response_data), 200 if is_ready else 503
+
+
+# ----------------------------------------
+# 6️⃣ Reload datasets after they change on disk
+# ----------------------------------------
+@app.route('/reload_datasets', methods=['POST'])
+@token_required
+def reload_datasets():
+    try:
+        previous = data_store_status()['fingerprint']
+        store = reload_data_store(only_if_changed=request.args.get('force') != '1')
+        if response_cache is not None and store.fingerprint != previous:
+            # Old entries can no longer be hit (their keys include the fingerprint); free them
+            response_cache.clear()
+        return jsonify({"message": "Datasets loaded.", "version": list(store.version)}), 200
+
+    except Exception as e:
+        logger.exception("Error in /reload_datasets")
+        return jsonify({"error": str(e)}), 500
+
+
+# ----------------------------------------
+# 6️⃣b Ingest yield observations
+# ----------------------------------------
+@app.route('/yield_observations', methods=['POST'])
+@token_required
+def yield_observations():
+    """
+    Appends {district, season, crop, yield[, observed_at]} observations, given as
+    {"observations": [...]}, a list, or a single object. The season averages and
+    top 5 are updated in every worker without a reload (see yield_stats.py).
+    """
+    data = request.get_json()
+    records = data.get('observations', [data]) if isinstance(data, dict) else data
+    if not isinstance(records, list) or not records:
+        return jsonify({"error": "A non-empty 'observations' list is required."}), 400
+
+    try:
+        stats = get_data_store().yield_stats
+        accepted, errors = stats.append(records)
+        response_data = {
+            "accepted": accepted,
+            "rejected": [{"index": i, "error": error} for i, error in errors],
+            "observations": stats.observations,
+        }
+        return jsonify(response_data), 200 if accepted else 400
+
+    except Exception as e:
+        logger.exception("Error in /yield_observations")
+        return jsonify({"error": str(e)}), 500
+
+
+# ----------------------------------------
+# 7️⃣ Weather cache counters
+# ----------------------------------------
+@app.route('/weather_cache_stats', methods=['GET'])
+def weather_cache_stats():
+    return jsonify(get_weather_cache_stats()), 200
+
+
+# ----------------------------------------
+# 8️⃣ Prometheus metrics (per worker process)
+# ----------------------------------------
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+
+# ----------------------------------------
+# 9️⃣ Response cache counters (per worker process)
+# ----------------------------------------
+@app.route('/response_cache_stats', methods=['GET'])
+def response_cache_stats():
+    if response_cache is None:
+        return jsonify({"enabled": False}), 200
+    return jsonify({"enabled": True, **response_cache.stats()}), 200
+
+
 # ----------------------------------------
 # Run the Flask app
 # ----------------------------------------
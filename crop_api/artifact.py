@@ -0,0 +1,192 @@
+# Versioned, memory-mappable artifact holding the model and datasets
+#
+# The artifact is an uncompressed .npz (a zip of .npy files, readable with np.load)
+# plus a meta.json member. Every array's data is padded to a 64-byte boundary in the
+# file, so open_artifact() maps the file once and returns read-only arrays that are
+# views into the mapping: nothing is unpickled or copied, and gunicorn workers share
+# the pages through the OS page cache. A checksum over all array data is verified on
+# open, and each section records the sha256 of the files it was exported from, so a
+# stale section is ignored in favour of the source files.
+#
+# export_artifact.py writes it.
+
+import hashlib
+import io
+import json
+import logging
+import os
+import struct
+import time
+import zipfile
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# --- Base Directory ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# --- Settings ---
+# Set MODEL_ARTIFACT to an empty string to always load from the pickles and dataset files.
+artifact_path = os.environ.get("MODEL_ARTIFACT", os.path.join(BASE_DIR, 'agropilot_artifact.npz'))
+
+FORMAT_VERSION = 1
+_META_NAME = 'meta.json'
+_ALIGNMENT = 64
+# Extra-field id used for alignment padding (the same one zipalign uses)
+_PADDING_EXTRA_ID = 0xD935
+_LOCAL_HEADER = struct.Struct('<4s5H3L2H')
+
+
+class ArtifactError(Exception):
+    """The artifact is missing, malformed, or fails its checksum."""
+
+
+def file_sha256(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _contiguous(array):
+    # np.ascontiguousarray would turn 0-d arrays into 1-d ones
+    array = np.asarray(array)
+    return array if array.flags.c_contiguous else np.array(array, order='C')
+
+
+def _checksum(arrays):
+    """sha256 over the name, dtype, shape and bytes of every array, in name order."""
+    digest = hashlib.sha256()
+    for name in sorted(arrays):
+        array = arrays[name]
+        digest.update(f"{name}|{array.dtype.str}|{array.shape}|".encode())
+        digest.update(_contiguous(array).reshape(-1).view(np.uint8))
+    return digest.hexdigest()
+
+
+def write_artifact(path, arrays, sections, extra_meta=None):
+    """
+    Writes arrays into an aligned, uncompressed .npz at path (atomically).
+
+    Args:
+        arrays (dict): name -> ndarray. Object dtypes are not allowed.
+        sections (dict): section name -> {source file name: sha256} it was built from.
+        extra_meta (dict): Additional JSON-serializable metadata.
+    """
+    arrays = {name: _contiguous(array) for name, array in arrays.items()}
+    for name, array in arrays.items():
+        if array.dtype.hasobject:
+            raise ValueError(f"{name}: object arrays cannot be memory-mapped")
+
+    meta = {
+        'format': FORMAT_VERSION,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'checksum': _checksum(arrays),
+        'sections': sections,
+        **(extra_meta or {}),
+    }
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f, zipfile.ZipFile(f, 'w', compression=zipfile.ZIP_STORED) as zf:
+        for name in sorted(arrays):
+            buffer = io.BytesIO()
+            np.lib.format.write_array(buffer, arrays[name], allow_pickle=False)
+            member = name + '.npy'
+            # The .npy header already pads the data to 64 bytes from the member start,
+            # so only the member start itself needs aligning.
+            data_start = f.tell() + _LOCAL_HEADER.size + len(member.encode()) + 4
+            padding = -data_start % _ALIGNMENT
+            info = zipfile.ZipInfo(member, date_time=(1980, 1, 1, 0, 0, 0))
+            info.extra = struct.pack('<HH', _PADDING_EXTRA_ID, padding) + b'\0' * padding
+            zf.writestr(info, buffer.getvalue())
+        zf.writestr(zipfile.ZipInfo(_META_NAME, date_time=(1980, 1, 1, 0, 0, 0)), json.dumps(meta, indent=2))
+    os.replace(tmp_path, path)
+    return meta
+
+
+class MappedArtifact:
+    """Read-only arrays mapped from an artifact file, plus its metadata."""
+
+    def __init__(self, path, arrays, meta):
+        self.path = path
+        self.arrays = arrays
+        self.meta = meta
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+    def __contains__(self, name):
+        return name in self.arrays
+
+    def with_prefix(self, prefix):
+        """Arrays whose names start with prefix, with the prefix removed."""
+        return {name[len(prefix):]: array for name, array in self.arrays.items() if name.startswith(prefix)}
+
+    def section_matches(self, section, source_paths):
+        """True when the section was exported from files identical to source_paths."""
+        sources = self.meta.get('sections', {}).get(section)
+        if sources is None:
+            return False
+        try:
+            current = {os.path.basename(path): file_sha256(path) for path in source_paths}
+        except FileNotFoundError:
+            return False
+        return current == sources
+
+
+def open_artifact(path=artifact_path, verify=True):
+    """
+    Maps the artifact at path and returns a MappedArtifact whose arrays are views into
+    the mapping. Raises ArtifactError when it is malformed or the checksum differs.
+    """
+    try:
+        mapping = np.memmap(path, dtype=np.uint8, mode='r')
+        with zipfile.ZipFile(path) as zf:
+            meta = json.loads(zf.read(_META_NAME))
+            members = [info for info in zf.infolist() if info.filename.endswith('.npy')]
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile) as e:
+        raise ArtifactError(f"Cannot read {path}: {e}") from e
+
+    if meta.get('format') != FORMAT_VERSION:
+        raise ArtifactError(f"{path} has format {meta.get('format')}, expected {FORMAT_VERSION}")
+
+    arrays = {}
+    for info in members:
+        if info.compress_type != zipfile.ZIP_STORED:
+            raise ArtifactError(f"{info.filename} is compressed and cannot be mapped")
+        header = _LOCAL_HEADER.unpack_from(mapping, info.header_offset)
+        name_length, extra_length = header[-2], header[-1]
+        start = info.header_offset + _LOCAL_HEADER.size + name_length + extra_length
+
+        npy = io.BytesIO(mapping[start:start + min(info.file_size, 4096)].tobytes())
+        version = np.lib.format.read_magic(npy)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(npy)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(npy)
+        if dtype.hasobject:
+            raise ArtifactError(f"{info.filename} holds objects")
+
+        arrays[info.filename[:-4]] = np.ndarray(shape, dtype=dtype, buffer=mapping, offset=start + npy.tell(),
+                                                order='F' if fortran_order else 'C')
+
+    if verify and _checksum(arrays) != meta.get('checksum'):
+        raise ArtifactError(f"Checksum mismatch in {path}")
+    return MappedArtifact(path, arrays, meta)
+
+
+def load_section(section, source_paths, path=artifact_path):
+    """
+    Returns the artifact when its section matches the current source files, otherwise
+    None (no artifact configured, missing, corrupt, or exported from other files).
+    """
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        artifact = open_artifact(path)
+    except ArtifactError as e:
+        logger.warning("Ignoring model artifact: %s", e)
+        return None
+    if not artifact.section_matches(section, source_paths):
+        logger.warning("%s section of %s is stale; loading from the source files.", section, path)
+        return None
+    return artifact
@@ -0,0 +1,251 @@
+# Microbenchmarks for the crop_api hot paths
+#
+# Usage:
+#   python benchmark.py [--iterations N] [--output PATH]
+#   python benchmark.py --compare OLD.json NEW.json
+#
+# Times the recommenders and the weather client in-process, with OpenWeatherMap
+# replaced by a local stub server, and writes the results as JSON (tagged with the
+# git commit) so runs from different commits can be compared. The report also
+# compares the 'bins' and 'knn' weather matchers (latency and top-5 agreement).
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(BASE_DIR, 'benchmark_results')
+
+# Representative inputs
+LAB_REPORT_INPUTS = [
+    (90, 42, 43, 20.88, 82.0, 6.5, 202.9),
+    (50, 51, 36, 22.69, 20.0, 6.0, 70.0),
+    (20, 67, 20, 27.0, 60.0, 7.0, 140.0),
+    (120, 30, 30, 25.0, 80.0, 6.8, 90.0),
+]
+NO_LAB_REPORT_INPUTS = [
+    ('Ahmednagar', 'kharif', 26.0, 200.0),
+    ('Pune', 'rabi', 18.5, 40.0),
+    ('Nagpur', 'kharif', 31.2, 260.0),
+    ('Kolhapur', 'summer', 35.0, 320.0),
+]
+COORDINATES = [(19.23, 72.86), (18.52, 73.85), (21.15, 79.09), (16.70, 74.24)]
+# Weather grid for the matcher comparison; it extends past the bin edges (0-50 °C, 0-300 mm).
+MATCHER_TEMPERATURES = range(-4, 56, 4)
+MATCHER_RAINFALLS = range(0, 420, 20)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def summarize(samples_seconds):
+    """Latency percentiles (ms) and throughput for a list of per-call durations."""
+    ms = np.asarray(samples_seconds) * 1e3
+    return {
+        "calls": int(len(ms)),
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "ops_per_sec": float(1e3 / ms.mean()) if ms.mean() else float('inf'),
+    }
+
+
+def time_calls(fn, inputs, iterations, setup=None, warmup=3):
+    """Calls fn(*args) `iterations` times cycling through inputs, timing each call."""
+    for args in inputs[:warmup]:
+        if setup:
+            setup()
+        fn(*args)
+    samples = []
+    for i in range(iterations):
+        args = inputs[i % len(inputs)]
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn(*args)
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def run_benchmarks(iterations):
+    from weather_snapshots import WeatherSnapshotStore
+    from weather_stub import WeatherStubServer
+    import weather_service
+    import crop_recommender
+    import Top5_Crops_SHAP
+
+    results = {}
+    Top5_Crops_SHAP.model_registry.warm_up()
+    crop_recommender.get_data_store()
+
+    results['get_top_5_recommendations'] = time_calls(
+        Top5_Crops_SHAP.get_top_5_recommendations, LAB_REPORT_INPUTS, iterations)
+
+    detail_inputs = [args + ('rice',) for args in LAB_REPORT_INPUTS]
+    results['get_crop_details_with_explainability[mean]'] = time_calls(
+        lambda *a: Top5_Crops_SHAP.get_crop_details_with_explainability(*a, attribution='mean'),
+        detail_inputs, iterations)
+    results['get_crop_details_with_explainability[shap,cold]'] = time_calls(
+        lambda *a: Top5_Crops_SHAP.get_crop_details_with_explainability(*a, attribution='shap'),
+        detail_inputs, max(iterations // 20, 10), setup=Top5_Crops_SHAP._explain_rounded.cache_clear)
+    results['get_crop_details_with_explainability[shap,memo]'] = time_calls(
+        lambda *a: Top5_Crops_SHAP.get_crop_details_with_explainability(*a, attribution='shap'),
+        detail_inputs, iterations)
+
+    # The browse-the-top-5 flow: one combined call versus the list plus five detail calls
+    def list_then_details(*a):
+        for rec in Top5_Crops_SHAP.get_top_5_recommendations(*a):
+            Top5_Crops_SHAP.get_crop_details_with_explainability(*a, rec['crop'], attribution='shap')
+
+    results['list_then_5_details[shap,cold]'] = time_calls(
+        list_then_details, LAB_REPORT_INPUTS, max(iterations // 20, 10),
+        setup=Top5_Crops_SHAP._explain_rounded.cache_clear)
+    results['get_top_k_with_details[shap,cold]'] = time_calls(
+        lambda *a: Top5_Crops_SHAP.get_top_k_with_details(*a, attribution='shap'),
+        LAB_REPORT_INPUTS, max(iterations // 20, 10), setup=Top5_Crops_SHAP._explain_rounded.cache_clear)
+    results['list_then_5_details[mean]'] = time_calls(
+        lambda *a: [Top5_Crops_SHAP.get_crop_details_with_explainability(*a, rec['crop'], attribution='mean')
+                    for rec in Top5_Crops_SHAP.get_top_5_recommendations(*a)],
+        LAB_REPORT_INPUTS, iterations)
+    results['get_top_k_with_details[mean]'] = time_calls(
+        lambda *a: Top5_Crops_SHAP.get_top_k_with_details(*a, attribution='mean'), LAB_REPORT_INPUTS, iterations)
+
+    results['get_final_recommendation'] = time_calls(
+        crop_recommender.get_final_recommendation, NO_LAB_REPORT_INPUTS, iterations)
+    results['get_recommendation_records'] = time_calls(
+        crop_recommender.get_recommendation_records, NO_LAB_REPORT_INPUTS, iterations)
+
+    store = crop_recommender.get_data_store()
+    weather_inputs = [args[2:] for args in NO_LAB_REPORT_INPUTS]
+    for matcher in ('bins', 'knn'):
+        results[f'weather_crops[{matcher}]'] = time_calls(
+            lambda t, r: store.weather_crops(t, r, matcher), weather_inputs, iterations)
+        results[f'get_final_recommendation[{matcher},records]'] = time_calls(
+            lambda *a: crop_recommender.get_final_recommendation(*a, as_records=True, weather_matcher=matcher),
+            NO_LAB_REPORT_INPUTS, iterations)
+
+    stub = WeatherStubServer().start()
+    original_url, original_snapshots = weather_service.FORECAST_URL, weather_service.weather_snapshots
+    weather_service.FORECAST_URL = stub.forecast_url
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        snapshots = weather_service.weather_snapshots = WeatherSnapshotStore(os.path.join(tmp_dir, 'snapshots.sqlite3'))
+        try:
+            def clear_weather():
+                weather_service.weather_cache.clear()
+                snapshots.clear()
+
+            results['get_weather_data[miss]'] = time_calls(
+                weather_service.get_weather_data, COORDINATES, max(iterations // 10, 20), setup=clear_weather)
+            results['get_weather_data[snapshot]'] = time_calls(
+                weather_service.get_weather_data, COORDINATES, iterations,
+                setup=weather_service.weather_cache.clear)
+            results['get_weather_data[hit]'] = time_calls(
+                weather_service.get_weather_data, COORDINATES, iterations)
+        finally:
+            weather_service.FORECAST_URL, weather_service.weather_snapshots = original_url, original_snapshots
+            stub.stop()
+
+    return results
+
+
+def compare_weather_matchers(temperatures=MATCHER_TEMPERATURES, rainfalls=MATCHER_RAINFALLS):
+    """
+    Runs get_final_recommendation with both weather matchers for every district and
+    season over a weather grid, and reports how often their top 5 agree and how often
+    each falls back to season-only results (no weather match).
+    """
+    import crop_recommender
+
+    store = crop_recommender.get_data_store()
+    overlap, same_order, fallbacks = [], [], {'bins': 0, 'knn': 0}
+    for district, season in store.yield_index:
+        for temp in temperatures:
+            for rainfall in rainfalls:
+                top = {}
+                for matcher in ('bins', 'knn'):
+                    records = crop_recommender.get_final_recommendation(
+                        district, season, temp, rainfall, as_records=True, weather_matcher=matcher)
+                    top[matcher] = [record['crop'] for record in records]
+                    fallbacks[matcher] += bool(records) and 'explanation' not in records[0]
+                overlap.append(len(set(top['bins']) & set(top['knn'])) / max(len(top['bins']), 1))
+                same_order.append(top['bins'] == top['knn'])
+
+    scenarios = len(overlap)
+    return {
+        "scenarios": scenarios,
+        "knn_k": store.weather_neighbours.k,
+        "mean_top5_overlap": float(np.mean(overlap)),
+        "identical_top5_rate": float(np.mean(same_order)),
+        "season_only_fallback_rate": {matcher: count / scenarios for matcher, count in fallbacks.items()},
+    }
+
+
+def compare(old_path, new_path):
+    with open(old_path, encoding='utf-8') as f:
+        old = json.load(f)
+    with open(new_path, encoding='utf-8') as f:
+        new = json.load(f)
+
+    print(f"{'benchmark':<52} {old.get('commit', '?'):>10} {new.get('commit', '?'):>10}   change (p50)")
+    for name in sorted(set(old['results']) | set(new['results'])):
+        before = old['results'].get(name, {}).get('p50_ms')
+        after = new['results'].get(name, {}).get('p50_ms')
+        if before is None or after is None:
+            print(f"{name:<52} {before or '-':>10} {after or '-':>10}")
+            continue
+        print(f"{name:<52} {before:>9.3f}ms {after:>9.3f}ms   {(after - before) / before:+.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks for crop_api.")
+    parser.add_argument('--iterations', type=int, default=500)
+    parser.add_argument('--output', help="JSON results path (default: benchmark_results/micro-<commit>.json)")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help="Compare two results files")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    commit = git_commit()
+    results = run_benchmarks(args.iterations)
+    matcher_agreement = compare_weather_matchers()
+    report = {
+        "suite": "micro",
+        "commit": commit,
+        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "iterations": args.iterations,
+        "results": results,
+        "weather_matcher_agreement": matcher_agreement,
+    }
+
+    output = args.output or os.path.join(RESULTS_DIR, f"micro-{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+    for name, stats in results.items():
+        print(f"{name:<52} p50 {stats['p50_ms']:8.3f} ms  p99 {stats['p99_ms']:8.3f} ms  {stats['ops_per_sec']:10.0f} ops/s")
+    print(f"Weather matchers over {matcher_agreement['scenarios']} scenarios: "
+          f"top-5 overlap {matcher_agreement['mean_top5_overlap']:.1%}, "
+          f"identical {matcher_agreement['identical_top5_rate']:.1%}, "
+          f"season-only fallback {matcher_agreement['season_only_fallback_rate']}")
+    print(f"Wrote {output}")
+
+
+if __name__ == "__main__":
+    main()
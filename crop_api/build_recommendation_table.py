@@ -0,0 +1,139 @@
+# Offline build step for recommendation_table.json.gz
+#
+# Usage: python build_recommendation_table.py [--output PATH] [--skip-verify]
+#
+# Precomputes get_final_recommendation for every (district, season, temp_bin,
+# rainfall_bin) combination, then checks that table lookups reproduce the live
+# pandas implementation exactly across the full grid before writing the artifact.
+
+import argparse
+import gzip
+import json
+
+from crop_recommender import (
+    RecommendationTable,
+    dataset_fingerprint,
+    get_data_store,
+    get_final_recommendation,
+    rainfall_bins,
+    rainfall_labels,
+    recommendation_table_path,
+    temp_bins,
+    temp_labels,
+    weather_explanation_template,
+)
+
+
+def _bin_samples(bins, labels, below, above):
+    """
+    (label, representative value) for every bin, plus the out-of-range bin (None).
+    """
+    samples = [(label, (left + right) / 2) for label, left, right in zip(labels, bins, bins[1:])]
+    return samples + [(None, below), (None, above)]
+
+
+def _check_values(bins, below, above):
+    """Values at and around every bin edge, used to verify the table."""
+    values = [below, above, None]
+    for edge in bins:
+        values += [edge, edge - 1e-6, edge + 1e-6]
+    return values
+
+
+def build_table():
+    store = get_data_store()
+    strings, string_index = [], {}
+
+    def intern(template):
+        if template not in string_index:
+            string_index[template] = len(strings)
+            strings.append(template)
+        return string_index[template]
+
+    table = {}
+    temp_samples = _bin_samples(temp_bins, temp_labels, -5.0, 55.0)
+    rainfall_samples = _bin_samples(rainfall_bins, rainfall_labels, -5.0, 400.0)
+
+    for district, season in store.yield_index:
+        for temp_bin, temp in temp_samples:
+            for rainfall_bin, rainfall in rainfall_samples:
+                key = RecommendationTable.key(district, season, temp_bin, rainfall_bin)
+                if key in table:
+                    continue
+                result = get_final_recommendation(district, season, temp, rainfall, as_records=True)
+                weather_explanation = weather_explanation_template.format(temp=temp, rainfall=rainfall)
+
+                rows = []
+                for record in result:
+                    if 'explanation' not in record:
+                        rows.append([record['crop'], record['final_score']])
+                        continue
+                    if record['explanation'] == weather_explanation:
+                        template = weather_explanation_template
+                    else:
+                        template = record['explanation'].replace('{', '{{').replace('}', '}}')
+                    rows.append([record['crop'], record['final_score'], intern(template), record['emoji']])
+                table[key] = rows
+
+    return {
+        'format': RecommendationTable.FORMAT_VERSION,
+        'fingerprint': dataset_fingerprint(),
+        'strings': strings,
+        'table': table,
+    }
+
+
+def _same(a, b):
+    # NaN emojis (crops missing from the emoji mapping) compare unequal to themselves
+    return json.dumps(a, sort_keys=True) == json.dumps(b, sort_keys=True)
+
+
+def verify_table(table):
+    """
+    Compares table lookups against get_final_recommendation over every district and
+    season and values on both sides of every bin edge. Returns the mismatches.
+    """
+    store = get_data_store()
+    mismatches = []
+    temps = _check_values(temp_bins, -5.0, 55.0)
+    rainfalls = _check_values(rainfall_bins, -5.0, 400.0)
+
+    for district, season in list(store.yield_index) + [('Unknown', 'kharif')]:
+        for temp in temps:
+            for rainfall in rainfalls:
+                expected = get_final_recommendation(district, season, temp, rainfall, as_records=True)
+                actual = table.lookup(district, season, temp, rainfall)
+                if not _same(expected, actual):
+                    mismatches.append((district, season, temp, rainfall))
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the precomputed no-lab-report recommendation table.")
+    parser.add_argument('--output', default=recommendation_table_path)
+    parser.add_argument('--skip-verify', action='store_true')
+    args = parser.parse_args()
+
+    if get_data_store().yield_version():
+        # The table is tied to the dataset files only, and is skipped while observations are ingested
+        raise SystemExit("Ingested yield observations are loaded (see yield_stats.py); build the table "
+                         "with YIELD_OBSERVATIONS_PATH pointing at an empty or missing log.")
+
+    payload = build_table()
+    print(f"Built {len(payload['table'])} entries.")
+
+    if not args.skip_verify:
+        mismatches = verify_table(RecommendationTable(json.loads(json.dumps(payload))))
+        if mismatches:
+            for mismatch in mismatches[:10]:
+                print(f"❌ Mismatch for {mismatch}")
+            raise SystemExit(f"{len(mismatches)} lookups differ from get_final_recommendation; not writing table.")
+        print("✅ Table matches get_final_recommendation across the full grid.")
+
+    with gzip.open(args.output, 'wt', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False, separators=(',', ':'))
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
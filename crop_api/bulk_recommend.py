@@ -0,0 +1,270 @@
+# Bulk recommendation runner
+#
+# Usage:
+#   python bulk_recommend.py INPUT OUTPUT_DIR [--mode auto|lab|no-lab] [--workers W]
+#                            [--chunk-size N] [--format csv|parquet] [--top-k K] [--restart]
+#
+# INPUT is a CSV or Parquet file of scenarios:
+#   no-lab: district, season, temperature, rainfall  -> get_recommendation_records
+#   lab:    N, P, K, temperature, humidity, ph, rainfall -> get_top_k_recommendations_batch
+#
+# The input is read in chunks and the chunks are sharded across a process pool. Each
+# worker loads the model and datasets once and writes its chunk straight to
+# OUTPUT_DIR/part-<chunk>.<format>, so at most a few chunks are in memory at a time.
+# Output is in long format: one line per (input row, rank), keyed on the input row
+# number. A no-lab row without recommendations (unknown district or season) gets one
+# line with an empty rank and the reason in the error column. Finished parts are kept,
+# so rerunning the same command after an interruption only processes the missing chunks.
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import pandas as pd
+
+from Top5_Crops_SHAP import features, get_top_k_recommendations_batch, model_registry
+from crop_recommender import get_data_store, get_recommendation_records, get_recommendation_table
+
+NO_LAB_COLUMNS = ['district', 'season', 'temperature', 'rainfall']
+LAB_COLUMNS = list(features)
+
+# Output columns after the input columns, fixed so every part has the same schema
+NO_LAB_RESULT_COLUMNS = ['rank', 'crop', 'final_score', 'explanation', 'emoji', 'error']
+LAB_RESULT_COLUMNS = ['rank', 'crop', 'confidence_score', 'emoji']
+
+JOB_FILE = '_job.json'
+SUCCESS_FILE = '_SUCCESS'
+
+
+# --- Input ---
+def detect_mode(columns):
+    """'lab' or 'no-lab' from the input columns."""
+    if set(LAB_COLUMNS) <= set(columns):
+        return 'lab'
+    if set(NO_LAB_COLUMNS) <= set(columns):
+        return 'no-lab'
+    raise ValueError(f"Input needs the columns {NO_LAB_COLUMNS} (no lab report) or {LAB_COLUMNS} (lab report).")
+
+
+def _is_parquet(path):
+    return path.lower().endswith(('.parquet', '.pq'))
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        sys.exit("Parquet input/output needs pyarrow (pip install pyarrow).")
+    return pq
+
+
+def part_schema(mode):
+    """
+    The pyarrow schema of a parquet part. Parts are written with these exact types, so
+    a chunk where a column is all missing (e.g. no explanations because no row has
+    weather) does not get a null-typed column.
+    """
+    import pyarrow as pa
+
+    if mode == 'lab':
+        columns = [(feature, pa.float64()) for feature in LAB_COLUMNS] + [
+            ('rank', pa.int64()), ('crop', pa.string()), ('confidence_score', pa.float64()), ('emoji', pa.string())]
+    else:
+        columns = [('district', pa.string()), ('season', pa.string()), ('temperature', pa.float64()),
+                   ('rainfall', pa.float64()), ('rank', pa.int64()), ('crop', pa.string()),
+                   ('final_score', pa.float64()), ('explanation', pa.string()), ('emoji', pa.string()),
+                   ('error', pa.string())]
+    return pa.schema([('row', pa.int64())] + columns)
+
+
+def input_columns(path):
+    if _is_parquet(path):
+        return _require_pyarrow().ParquetFile(path).schema_arrow.names
+    return pd.read_csv(path, nrows=0).columns.tolist()
+
+
+def iter_chunks(path, chunk_size):
+    """Yields DataFrames of at most chunk_size input rows."""
+    if _is_parquet(path):
+        for batch in _require_pyarrow().ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_size)
+
+
+# --- Workers ---
+def _init_worker(mode):
+    """Loads what the mode needs once per worker process."""
+    if mode == 'lab':
+        model_registry.get()
+    else:
+        get_data_store()
+        get_recommendation_table()
+
+
+def recommend_no_lab(chunk):
+    rows = []
+    for row_id, district, season, temperature, rainfall in chunk[['row'] + NO_LAB_COLUMNS].itertuples(index=False):
+        temperature = None if pd.isna(temperature) else float(temperature)
+        rainfall = None if pd.isna(rainfall) else float(rainfall)
+        records = get_recommendation_records(district, season, temperature, rainfall)
+        if not records:
+            rows.append((row_id, district, season, temperature, rainfall, None, None, None, None, None,
+                         "No recommendations available"))
+        for rank, record in enumerate(records, start=1):
+            rows.append((row_id, district, season, temperature, rainfall, rank, record['crop'],
+                         record['final_score'], record.get('explanation'), record.get('emoji'), None))
+    return pd.DataFrame(rows, columns=['row'] + NO_LAB_COLUMNS + NO_LAB_RESULT_COLUMNS).astype({'rank': 'Int64'})
+
+
+def recommend_lab(chunk, top_k):
+    X = chunk[LAB_COLUMNS].to_numpy(dtype=float)
+    recommendations = get_top_k_recommendations_batch(X, k=top_k)
+    rows = []
+    for row_id, values, recs in zip(chunk['row'].tolist(), X.tolist(), recommendations):
+        for rank, rec in enumerate(recs, start=1):
+            rows.append((row_id, *values, rank, rec['crop'], rec['confidence_score'], rec['emoji']))
+    return pd.DataFrame(rows, columns=['row'] + LAB_COLUMNS + LAB_RESULT_COLUMNS)
+
+
+def part_path(output_dir, chunk_id, fmt):
+    return os.path.join(output_dir, f"part-{chunk_id:05d}.{fmt}")
+
+
+def process_chunk(chunk_id, chunk, mode, top_k, output_dir, fmt):
+    """
+    Scores one chunk and writes its part file. The file is written under a temporary
+    name and renamed, so an interrupted run never leaves a partial part behind.
+
+    Returns:
+        tuple: (chunk_id, input rows, output rows, seconds)
+    """
+    start = time.perf_counter()
+    result = recommend_lab(chunk, top_k) if mode == 'lab' else recommend_no_lab(chunk)
+
+    path = part_path(output_dir, chunk_id, fmt)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    if fmt == 'parquet':
+        result.to_parquet(tmp_path, index=False, schema=part_schema(mode))
+    else:
+        result.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    return chunk_id, len(chunk), len(result), time.perf_counter() - start
+
+
+# --- Job ---
+def job_spec(args, mode):
+    """Settings that must match for a rerun to resume from existing parts."""
+    stat = os.stat(args.input)
+    return {
+        "input": os.path.abspath(args.input),
+        "input_size": stat.st_size,
+        "input_mtime_ns": stat.st_mtime_ns,
+        "mode": mode,
+        "chunk_size": args.chunk_size,
+        "format": args.format,
+        "top_k": args.top_k if mode == 'lab' else None,
+    }
+
+
+def prepare_output_dir(output_dir, spec, restart):
+    """
+    Creates output_dir and records the job spec. Returns the ids of chunks that are
+    already done; a directory left by a different job is refused unless restart is set.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    job_path = os.path.join(output_dir, JOB_FILE)
+    existing = [name for name in os.listdir(output_dir) if name.startswith('part-') or name == SUCCESS_FILE]
+
+    if restart:
+        for name in existing:
+            os.remove(os.path.join(output_dir, name))
+        existing = []
+    elif existing and os.path.exists(job_path):
+        with open(job_path, encoding='utf-8') as f:
+            previous = json.load(f)
+        if previous != spec:
+            sys.exit(f"{output_dir} holds results of a different job ({job_path}); use --restart to overwrite.")
+
+    with open(job_path, 'w', encoding='utf-8') as f:
+        json.dump(spec, f, indent=2)
+
+    suffix = '.' + spec['format']
+    return {int(name[5:-len(suffix)]) for name in existing if name.endswith(suffix)}
+
+
+def run(args):
+    mode = detect_mode(input_columns(args.input)) if args.mode == 'auto' else args.mode
+    spec = job_spec(args, mode)
+    done = prepare_output_dir(args.output_dir, spec, args.restart)
+    if done:
+        print(f"Resuming: {len(done)} chunks already written.")
+
+    started = time.perf_counter()
+    total_rows = total_out = 0
+    pending = set()
+
+    def collect(futures):
+        nonlocal total_rows, total_out
+        for future in futures:
+            chunk_id, rows, out_rows, seconds = future.result()
+            total_rows += rows
+            total_out += out_rows
+            elapsed = time.perf_counter() - started
+            print(f"part {chunk_id:05d}: {rows} rows in {seconds:.2f}s  "
+                  f"total {total_rows} rows, {total_rows / elapsed:,.0f} rows/s")
+
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker, initargs=(mode,)) as pool:
+        # Row numbers are global across chunks so resumed parts line up with the input.
+        row_offset = 0
+        for chunk_id, chunk in enumerate(iter_chunks(args.input, args.chunk_size)):
+            chunk = chunk.reset_index(drop=True)
+            chunk.insert(0, 'row', range(row_offset, row_offset + len(chunk)))
+            row_offset += len(chunk)
+            if chunk_id in done:
+                continue
+
+            # Keep at most two chunks per worker in flight to bound memory.
+            if len(pending) >= 2 * args.workers:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(finished)
+            pending.add(pool.submit(process_chunk, chunk_id, chunk, mode, args.top_k, args.output_dir, args.format))
+        collect(wait(pending).done)
+
+    elapsed = time.perf_counter() - started
+    summary = {
+        "mode": mode,
+        "input_rows": row_offset,
+        "processed_rows": total_rows,
+        "output_rows": total_out,
+        "seconds": round(elapsed, 3),
+        "rows_per_sec": round(total_rows / elapsed, 1) if elapsed else None,
+    }
+    with open(os.path.join(args.output_dir, SUCCESS_FILE), 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2)
+    print(f"Processed {total_rows} of {row_offset} rows in {elapsed:.2f}s "
+          f"({summary['rows_per_sec']} rows/s); output in {args.output_dir}")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run crop recommendations for a file of scenarios.")
+    parser.add_argument('input', help="CSV or Parquet file of scenarios")
+    parser.add_argument('output_dir', help="Directory for part files; reused to resume")
+    parser.add_argument('--mode', choices=['auto', 'lab', 'no-lab'], default='auto')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--chunk-size', type=int, default=5000, help="Input rows per part file")
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv')
+    parser.add_argument('--top-k', type=int, default=5, help="Crops per sample in lab mode")
+    parser.add_argument('--restart', action='store_true', help="Discard existing parts and start over")
+    args = parser.parse_args()
+    if args.format == 'parquet':
+        _require_pyarrow()
+    run(args)
+
+
+if __name__ == "__main__":
+    main()
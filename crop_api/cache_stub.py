@@ -0,0 +1,138 @@
+# Local stand-in for a Redis server, for the shared response cache
+#
+# Speaks enough of the Redis protocol (RESP) for response_cache.py and redis-py:
+# HELLO, PING, GET, SET (with EX/PX), DEL, EXISTS, DBSIZE, FLUSHDB and SELECT. Data is kept
+# in memory with per-key expiry. Handy for running several gunicorn workers locally
+# with a shared cache:
+#
+#   python cache_stub.py --port 6399
+#   RESPONSE_CACHE_URL=redis://127.0.0.1:6399/0 gunicorn app:app --workers 4 --preload
+
+import argparse
+import socketserver
+import threading
+import time
+
+
+class CacheStubServer:
+    """
+    Threaded RESP server. Runs in a background thread until stop() is called.
+
+    Args:
+        host (str): Interface to bind.
+        port (int): Port to bind; 0 picks a free port.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self._data = {}  # key -> (expires_at or None, value)
+        self._lock = threading.Lock()
+        self.commands = 0
+        stub = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                protocol = 2
+                while True:
+                    try:
+                        command = stub._read_command(self.rfile)
+                    except (ConnectionError, ValueError):
+                        return
+                    if command is None:
+                        return
+                    if command and command[0].upper() == b'HELLO' and len(command) > 1:
+                        protocol = int(command[1])
+                    self.wfile.write(stub.execute(command, protocol))
+                    self.wfile.flush()
+
+        self._server = socketserver.ThreadingTCPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"redis://{host}:{port}/0"
+
+    @staticmethod
+    def _read_command(rfile):
+        """One command as a list of bytes, from a RESP array or an inline command."""
+        line = rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b'*'):
+            return line.split()
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(rfile.readline()[1:])
+            args.append(rfile.read(length + 2)[:-2])
+        return args
+
+    def _live(self, key):
+        entry = self._data.get(key)
+        if entry is not None and entry[0] is not None and entry[0] <= time.monotonic():
+            del self._data[key]
+            return None
+        return entry
+
+    def execute(self, command, protocol=2):
+        """Runs one command and returns the reply encoded for RESP2 or RESP3."""
+        self.commands += 1
+        name = command[0].upper().decode() if command else ''
+        args = command[1:]
+        with self._lock:
+            if name == 'PING':
+                return b'+PONG\r\n'
+            if name == 'HELLO':
+                fields = b'$6\r\nserver\r\n$10\r\ncache_stub\r\n$5\r\nproto\r\n:%d\r\n' % protocol
+                return (b'%2\r\n' if protocol == 3 else b'*4\r\n') + fields
+            if name == 'GET' and len(args) == 1:
+                entry = self._live(args[0])
+                if entry is None:
+                    return b'_\r\n' if protocol == 3 else b'$-1\r\n'
+                return b'$%d\r\n%s\r\n' % (len(entry[1]), entry[1])
+            if name == 'SET' and len(args) >= 2:
+                expires_at = None
+                options = [arg.upper() for arg in args[2:]]
+                if b'EX' in options:
+                    expires_at = time.monotonic() + int(args[2 + options.index(b'EX') + 1])
+                elif b'PX' in options:
+                    expires_at = time.monotonic() + int(args[2 + options.index(b'PX') + 1]) / 1000
+                self._data[args[0]] = (expires_at, args[1])
+                return b'+OK\r\n'
+            if name in ('DEL', 'EXISTS'):
+                found = [key for key in args if self._live(key) is not None]
+                if name == 'DEL':
+                    for key in found:
+                        del self._data[key]
+                return b':%d\r\n' % len(found)
+            if name == 'DBSIZE':
+                return b':%d\r\n' % sum(self._live(key) is not None for key in list(self._data))
+            if name == 'FLUSHDB':
+                self._data.clear()
+                return b'+OK\r\n'
+            if name == 'SELECT':
+                return b'+OK\r\n'
+        return b'-ERR unknown command %s\r\n' % name.encode()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a local Redis-compatible cache stub.")
+    parser.add_argument('--port', type=int, default=6399)
+    args = parser.parse_args()
+
+    server = CacheStubServer(port=args.port).start()
+    print(f"Serving cache stub at {server.url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
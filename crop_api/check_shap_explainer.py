@@ -0,0 +1,80 @@
+# Accuracy check of Kernel SHAP against the exact Shapley values
+#
+# Usage: python check_shap_explainer.py [--samples N] [--tolerance T]
+#
+# Compares ShapleyExplainer with a sample budget below 2^7 (Kernel SHAP) against the
+# exact explainer (budget 128), on a synthetic model with strong feature interactions
+# and on the crop model with its SHAP background, and checks that:
+#   - the kernel weights of the evaluated coalitions add up to 1 (no weight is lost)
+#   - base value + sum of attributions equals the prediction at every budget
+#   - a near-full budget (127) reproduces the exact values within the tolerance
+# Exits non-zero on the first check that fails. The maximum error at each budget is
+# printed, for comparing sampling changes.
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from shap_explainer import ShapleyExplainer
+
+BUDGETS = (32, 64, 93, 100, 120, 127)
+NEAR_FULL_BUDGET = 127
+
+
+def check(condition, message):
+    if not condition:
+        raise SystemExit(f"❌ {message}")
+    print(f"✅ {message}")
+
+
+def interaction_model(X):
+    """Two-class probabilities driven by pairwise and three-way feature interactions."""
+    z = X[:, 0] * X[:, 1] + X[:, 2] * X[:, 3] * X[:, 4] - X[:, 5] + np.sin(X[:, 6] * X[:, 0])
+    p = 1 / (1 + np.exp(-z))
+    return np.column_stack([p, 1 - p])
+
+
+def check_model(name, predict_proba, background, background_weights, samples, tolerance):
+    exact = ShapleyExplainer(predict_proba, background, background_weights, sample_budget=128)
+    expected = [exact.explain(x)[0] for x in samples]
+
+    errors = {}
+    for budget in BUDGETS:
+        explainer = ShapleyExplainer(predict_proba, background, background_weights, sample_budget=budget)
+        check(abs(explainer._sample_weights.sum() - 1) < 1e-9,
+              f"{name}, budget {budget}: kernel weights of the {len(explainer._masks)} coalitions add up to 1")
+        error, efficiency = 0.0, 0.0
+        for x, phi_exact in zip(samples, expected):
+            phi, base_value, prediction = explainer.explain(x)
+            error = max(error, np.abs(phi - phi_exact).max())
+            efficiency = max(efficiency, np.abs(base_value + phi.sum(axis=0) - prediction).max())
+        check(efficiency < 1e-9, f"{name}, budget {budget}: base value + attributions == prediction")
+        errors[budget] = error
+        print(f"   max |phi - exact| = {error:.4f}")
+
+    check(errors[NEAR_FULL_BUDGET] <= tolerance,
+          f"{name}: budget {NEAR_FULL_BUDGET} is within {tolerance} of the exact values ({errors[NEAR_FULL_BUDGET]:.4f})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check Kernel SHAP against the exact Shapley values.")
+    parser.add_argument('--samples', type=int, default=20, help="Inputs explained per model")
+    parser.add_argument('--tolerance', type=float, default=0.005, help="Largest error allowed at budget 127")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    check_model('interaction model', interaction_model, rng.normal(size=(10, 7)), None,
+                rng.normal(size=(args.samples, 7)) * 1.5, args.tolerance)
+
+    import Top5_Crops_SHAP
+
+    registry = Top5_Crops_SHAP.model_registry.get()
+    rows = pd.read_csv(Top5_Crops_SHAP.dataset_path)[Top5_Crops_SHAP.features].to_numpy(dtype=float)
+    samples = rows[rng.choice(len(rows), size=args.samples, replace=False)]
+    check_model('crop model', registry.predict_proba, registry.explainer.background,
+                registry.explainer.background_weights, samples, args.tolerance)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# Behaviour check of the weather cache against the local forecast stub
+#
+# Usage: python check_weather_cache.py [--clients N] [--latency S]
+#
+# Runs get_weather_data against weather_stub.py with a small WeatherCache (short TTL,
+# two entries) and a throwaway snapshot store, and checks that:
+#   - N concurrent misses on one grid cell make a single upstream call and share its value
+#   - repeats and nearby coordinates in the same cell are hits, counted as such
+#   - an entry is fetched again once its TTL has passed
+#   - the least recently used entry is evicted beyond max_entries
+#   - failed fetches are not cached
+# Exits non-zero on the first check that fails.
+
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+import weather_service
+from weather_service import WeatherCache, get_weather_data
+from weather_snapshots import WeatherSnapshotStore
+from weather_stub import WeatherStubServer
+
+TTL_SECONDS = 0.5
+CELL = (19.23, 72.86)
+SAME_CELL = (19.24, 72.87)
+OTHER_CELLS = [(18.52, 73.85), (21.15, 79.09)]
+
+
+def check(condition, message):
+    if not condition:
+        raise SystemExit(f"❌ {message}")
+    print(f"✅ {message}")
+
+
+def run_checks(stub, clients):
+    cache = weather_service.weather_cache
+
+    # Concurrent misses on one cell
+    barrier = threading.Barrier(clients)
+    values = []
+
+    def client():
+        barrier.wait()
+        values.append(get_weather_data(*CELL))
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    stats = cache.stats()
+    check(stub.requests == 1, f"{clients} concurrent misses on one cell made {stub.requests} upstream call(s)")
+    check(len(set(values)) == 1 and values[0][0] is not None, "every concurrent caller got the same weather")
+    check(stats['misses'] == 1 and stats['coalesced'] == clients - 1,
+          f"counted 1 miss and {clients - 1} coalesced ({stats['misses']}, {stats['coalesced']})")
+
+    # Hits
+    get_weather_data(*CELL)
+    get_weather_data(*SAME_CELL)
+    stats = cache.stats()
+    check(stub.requests == 1 and stats['hits'] == 2, f"repeat and same-cell lookups were hits ({stats['hits']})")
+
+    # TTL expiry
+    time.sleep(TTL_SECONDS + 0.1)
+    get_weather_data(*CELL)
+    stats = cache.stats()
+    check(stub.requests == 2 and stats['misses'] == 2, "an expired entry was fetched again")
+
+    # LRU eviction: CELL is the oldest entry once two more cells are loaded
+    for cell in OTHER_CELLS:
+        get_weather_data(*cell)
+    stats = cache.stats()
+    check(stats['entries'] == 2 and stats['evictions'] == 1,
+          f"max_entries=2 kept 2 entries and evicted 1 ({stats['entries']}, {stats['evictions']})")
+    misses = stats['misses']
+    get_weather_data(*CELL)
+    check(cache.stats()['misses'] == misses + 1, "the evicted cell was a miss")
+
+    # Failures
+    stub.fail = True
+    entries = cache.stats()['entries']
+    result = get_weather_data(10.0, 10.0)
+    check(result == (None, None, None) and cache.stats()['entries'] == entries, "a failed fetch was not cached")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the weather cache against the local forecast stub.")
+    parser.add_argument('--clients', type=int, default=16, help="Concurrent callers for the coalescing check")
+    parser.add_argument('--latency', type=float, default=0.3, help="Stub response delay, so the misses overlap")
+    args = parser.parse_args()
+
+    stub = WeatherStubServer(latency=args.latency).start()
+    original = weather_service.FORECAST_URL, weather_service.weather_cache, weather_service.weather_snapshots
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        weather_service.FORECAST_URL = stub.forecast_url
+        weather_service.weather_cache = WeatherCache(ttl_seconds=TTL_SECONDS, max_entries=2)
+        weather_service.weather_snapshots = WeatherSnapshotStore(os.path.join(tmp_dir, 'snapshots.sqlite3'))
+        try:
+            run_checks(stub, args.clients)
+        finally:
+            weather_service.FORECAST_URL, weather_service.weather_cache, weather_service.weather_snapshots = original
+            stub.stop()
+
+
+if __name__ == "__main__":
+    main()
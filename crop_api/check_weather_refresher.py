@@ -0,0 +1,148 @@
+# Behaviour check of the forecast refresher and the stale-snapshot fallback against the
+# local forecast stub
+#
+# Usage: python check_weather_refresher.py [--workers N]
+#
+# Builds a ForecastRefresher over a throwaway snapshot store in this process, forks N
+# workers the way gunicorn --preload does, and checks that:
+#   - the lock on the store elects exactly one worker to refresh, and one pass fills
+#     the store with one upstream call per cell
+#   - once the leader has exited another process takes over, and skips cells that are
+#     still fresh
+#   - a pass stops after WEATHER_REFRESH_MAX_FAILURES failures in a row
+# Then, with the stub failing, checks that get_weather_data and get_last_known_weather:
+#   - serve a stored snapshot younger than WEATHER_MAX_STALENESS, with one upstream try
+#   - do not call the upstream again for that cell within WEATHER_RETRY_SECONDS
+#   - answer nothing for a snapshot older than WEATHER_MAX_STALENESS
+# Exits non-zero on the first check that fails.
+
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+import weather_service
+import weather_snapshots
+from weather_service import WeatherCache, get_last_known_weather, get_weather_data
+from weather_snapshots import ForecastRefresher, WeatherSnapshotStore
+from weather_stub import WeatherStubServer
+
+COORDINATES = [(19.23, 72.86), (18.52, 73.85), (21.15, 79.09), (20.70, 77.01), (19.09, 74.75)]
+STALE_CELL = (16.70, 74.24)
+EXPIRED_CELL = (17.68, 75.91)
+STALE_VALUES = (21.5, 64, 12.25)
+WORKER_SECONDS = 2.0
+
+
+def check(condition, message):
+    if not condition:
+        raise SystemExit(f"❌ {message}")
+    print(f"✅ {message}")
+
+
+def cell_center(lat, lon):
+    return weather_service._cell_center(lat, lon)[1:]
+
+
+def worker(refresher, barrier, statuses):
+    """A forked worker: starts the refresher like a first weather lookup does, then reports."""
+    barrier.wait()
+    refresher.ensure_running()
+    time.sleep(WORKER_SECONDS)
+    statuses.put((os.getpid(), refresher.status()))
+    barrier.wait()
+
+
+def check_refresher(stub, store, workers):
+    cells = [cell_center(lat, lon) for lat, lon in COORDINATES]
+    refresher = ForecastRefresher(cells, weather_service._fetch_forecast, store, interval=60, rate_per_minute=0)
+
+    # Election between forked workers
+    context = multiprocessing.get_context('fork')
+    barrier = context.Barrier(workers)
+    statuses = context.Queue()
+    processes = [context.Process(target=worker, args=(refresher, barrier, statuses)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    reports = [statuses.get(timeout=30) for _ in processes]
+    for process in processes:
+        process.join()
+
+    leaders = [status for _, status in reports if status['refreshing_in_this_process']]
+    check(all(status['running_in_this_process'] for _, status in reports),
+          f"the refresher thread started in all {workers} workers")
+    check(len(leaders) == 1, f"exactly one of {workers} workers was elected to refresh ({len(leaders)})")
+    check(leaders[0]['passes'] == 1 and leaders[0]['refreshed'] == len(cells),
+          f"the leader refreshed {leaders[0]['refreshed']} of {len(cells)} cells in one pass")
+    check(stub.requests == len(cells), f"one upstream call per cell ({stub.requests})")
+    check(all(store.latest(lat, lon) is not None for lat, lon in cells), "every cell has a snapshot in the store")
+
+    # Takeover once the leader has exited
+    successor = ForecastRefresher(cells, weather_service._fetch_forecast, store, interval=60, rate_per_minute=0)
+    check(successor._is_leader(), "another process took the lock after the leader exited")
+    requests = stub.requests
+    check(successor.refresh_once() == 0 and stub.requests == requests, "the successor skipped cells that are still fresh")
+
+    # A failing upstream stops the pass
+    stale = time.time() - 120
+    store.clear()
+    for lat, lon in cells:
+        store.put(lat, lon, STALE_VALUES, fetched_at=stale)
+    stub.fail = True
+    successor.refresh_once()
+    failures = weather_snapshots.WEATHER_REFRESH_MAX_FAILURES
+    check(successor.failed == failures and stub.requests == requests + failures,
+          f"the pass stopped after {failures} failures in a row ({stub.requests - requests} calls)")
+    stub.fail = False
+
+
+def check_stale_fallback(stub, store):
+    stub.fail = True
+    stale_cell = cell_center(*STALE_CELL)
+    store.put(*stale_cell, STALE_VALUES, fetched_at=time.time() - 3600)
+
+    # A snapshot an hour old is served when the upstream fails
+    requests = stub.requests
+    stale_served = weather_service._stats['stale_served']
+    check(get_weather_data(*STALE_CELL) == STALE_VALUES, "get_weather_data served the hour-old snapshot")
+    check(stub.requests == requests + 1, "after one upstream try")
+    check(weather_service._stats['stale_served'] == stale_served + 1, "counted as stale_served")
+    check(get_last_known_weather(*STALE_CELL) == STALE_VALUES, "get_last_known_weather returned the same snapshot")
+
+    # The failed cell is not retried within WEATHER_RETRY_SECONDS, even on a cache miss
+    weather_service.weather_cache.clear()
+    check(get_weather_data(*STALE_CELL) == STALE_VALUES and stub.requests == requests + 1,
+          "a cache miss within the retry delay served the snapshot without calling the upstream")
+
+    # Too old to serve
+    store.put(*cell_center(*EXPIRED_CELL), STALE_VALUES,
+              fetched_at=time.time() - weather_service.WEATHER_MAX_STALENESS - 60)
+    check(get_weather_data(*EXPIRED_CELL) == (None, None, None), "a snapshot past WEATHER_MAX_STALENESS was not served")
+    check(get_last_known_weather(*EXPIRED_CELL) is None, "nor returned by get_last_known_weather")
+    stub.fail = False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the forecast refresher and the stale fallback.")
+    parser.add_argument('--workers', type=int, default=4, help="Forked workers competing for the refresh lock")
+    args = parser.parse_args()
+
+    stub = WeatherStubServer().start()
+    original = weather_service.FORECAST_URL, weather_service.weather_cache, weather_service.weather_snapshots
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = WeatherSnapshotStore(os.path.join(tmp_dir, 'snapshots.sqlite3'))
+        weather_service.FORECAST_URL = stub.forecast_url
+        weather_service.weather_cache = WeatherCache(ttl_seconds=60)
+        weather_service.weather_snapshots = store
+        try:
+            check_refresher(stub, store, args.workers)
+            check_stale_fallback(stub, store)
+        finally:
+            weather_service.FORECAST_URL, weather_service.weather_cache, weather_service.weather_snapshots = original
+            weather_service._upstream_retry_at.clear()
+            stub.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import contextvars
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+logger = logging.getLogger(__name__)
+
+# --- Settings ---
+# Threads shared by all requests in a worker process for outbound I/O (weather, geocoding).
+IO_POOL_SIZE = int(os.environ.get("IO_POOL_SIZE", 16))
+# Per-call deadlines in seconds; a call that misses its deadline is reported as missing.
+WEATHER_DEADLINE = float(os.environ.get("WEATHER_DEADLINE", 8))
+GEOCODE_DEADLINE = float(os.environ.get("GEOCODE_DEADLINE", 3))
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Returns the bounded thread pool for this process. Threads do not survive a
+    fork, so gunicorn workers forked from a preloaded master each create their own.
+    """
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor is None or _executor_pid != os.getpid():
+                _executor = ThreadPoolExecutor(max_workers=IO_POOL_SIZE, thread_name_prefix="agropilot-io")
+                _executor_pid = os.getpid()
+    return _executor
+
+
+def fan_out(calls):
+    """
+    Runs independent I/O calls concurrently on the shared pool.
+
+    Args:
+        calls (dict): name -> (deadline_seconds, fn, *args). Deadlines are measured
+            from when fan_out is called.
+
+    Returns:
+        tuple: (results, missing) where results maps every name to the call's return
+               value (None if it failed or missed its deadline) and missing lists the
+               names that did not complete in time or raised.
+    """
+    executor = get_executor()
+    start = time.monotonic()
+    # Each call runs in a copy of the caller's context, so request tracing follows it
+    futures = {
+        name: (deadline, executor.submit(contextvars.copy_context().run, fn, *args))
+        for name, (deadline, fn, *args) in calls.items()
+    }
+
+    results, missing = {}, []
+    for name, (deadline, future) in futures.items():
+        try:
+            results[name] = future.result(timeout=max(0.0, start + deadline - time.monotonic()))
+        except TimeoutError:
+            # The call keeps running in the background; services with caches keep its result.
+            logger.warning("%s missed its %.1fs deadline", name, deadline)
+            results[name] = None
+            missing.append(name)
+        except Exception as e:
+            logger.warning("%s failed: %s", name, e)
+            results[name] = None
+            missing.append(name)
+    return results, missing
@@ -1,9 +1,394 @@
 # Save this code as 'crop_recommender.py'
 
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_right
+
 import pandas as pd
 import numpy as np
+from scipy.spatial import cKDTree
+
+from artifact import file_sha256, load_section
+from observability import stage
+from yield_stats import YieldStats
+
+logger = logging.getLogger(__name__)
+
+# --- Base Directory ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# --- Dataset Paths (relative to this script) ---
+season_dataset_path = os.path.join(BASE_DIR, 'datasets', 'season-wise-crop.csv')
+weather_dataset_path = os.path.join(BASE_DIR, 'datasets', 'weather-wise-crop.xlsx')
+recommendation_table_path = os.path.join(BASE_DIR, 'recommendation_table.json.gz')
+
+# --- Crop Name Standardization ---
+season_mapping = {'arhar/tur': 'pigeonpea', 'gram': 'chickpea', 'moong': 'mungbean', 'urad': 'blackgram'}
+weather_mapping = {'chickpea': 'chickpea', 'pigeonpea': 'pigeonpea', 'mungbean': 'mungbean', 'blackgram': 'blackgram'}
+
+# --- Weather Bins ---
+temp_bins = [0, 10, 20, 30, 40, 50]
+temp_labels = ['0-10C', '10-20C', '20-30C', '30-40C', '40-50C']
+rainfall_bins = [0, 50, 100, 150, 200, 250, 300]
+rainfall_labels = ['0-50mm', '50-100mm', '100-150mm', '150-200mm', '200-250mm', '250-300mm']
+
+# --- Weather Matching ---
+# 'bins' counts labels in the fixed temperature/rainfall cell above (and can use the
+# precomputed table); 'knn' weights the nearest rows of the weather dataset by distance.
+WEATHER_MATCHER = os.environ.get("WEATHER_MATCHER", "bins")
+WEATHER_KNN_K = int(os.environ.get("WEATHER_KNN_K", 50))
+# Floor on the normalized distance, so an exact match does not take all the weight.
+WEATHER_KNN_MIN_DISTANCE = 0.05
+
+# --- Explanation Templates ---
+# Only this explanation depends on the raw weather values; the rest are fixed per bin.
+weather_explanation_template = "This crop has a strong historical success rate in conditions with a temperature of {temp:.1f}°C and rainfall of {rainfall:.1f}mm."
+season_explanation_template = "This crop is a top performer in your district with an average yield of {:.2f} tonnes/hectare."
+overlap_explanation = "The model highly recommends this crop because it has both high historical yield AND a high success rate in current weather conditions."
+
+# --- Combined Scoring ---
+# final_score = weather % + 10 x average yield, plus a bonus for crops found by both stages
+season_score_weight = 10
+overlap_bonus = 50
+
+# --- Emojis ---
+emoji_mapping = {
+    'rice': '🍚', 'maize': '🌽', 'chickpea': '🫘', 'kidneybean': '🫘', 'pigeonpea': '🕊️', 'mothbeans': '🫘',
+    'mungbean': '🌱', 'blackgram': '⚫', 'lentil': '🥣', 'pomegranate': '🍎', 'banana': '🍌', 'mango': '🥭',
+    'grapes': '🍇', 'watermelon': '🍉', 'muskmelon': '🍈', 'apple': '🍎', 'orange': '🍊', 'papaya': '🍈',
+    'coconut': '🥥', 'cotton': '☁️', 'jute': '🌿', 'coffee': '☕', 'bajra': '🌾', 'groundnut': '🥜',
+    'jowar': '🌽', 'niger seed': '🌻', 'ragi': '🌾', 'sesamum': '🫘', 'soyabean': '🫘', 'sunflower': '🌻',
+    'wheat': '🌾', 'other pulses': '🫘', 'other cere': '🌾', 'other oilse': '🫘'
+}
+
+
+def _bin_label(value, bins, labels):
+    """
+    Scalar equivalent of pd.cut(..., right=False): returns the label of the
+    [left, right) bin holding value, or None when it falls outside all bins.
+    """
+    if value is None or pd.isna(value):
+        return None
+    i = bisect_right(bins, value) - 1
+    if 0 <= i < len(labels):
+        return labels[i]
+    return None
+
+
+class WeatherNeighbours:
+    """
+    Distance-weighted k-nearest-neighbour label confidence over the rows of the
+    weather dataset. Temperature and rainfall are z-scored so both count equally,
+    and a KD-tree built once at load answers every query in O(k log n), including
+    inputs outside the range of the fixed bins.
+    """
+
+    def __init__(self, temperature, rainfall, labels, k=WEATHER_KNN_K, min_distance=WEATHER_KNN_MIN_DISTANCE):
+        points = np.column_stack([temperature, rainfall]).astype(float)
+        self.mean = points.mean(axis=0)
+        self.scale = points.std(axis=0)
+        self.tree = cKDTree((points - self.mean) / self.scale)
+        self.crops, self.label_codes = np.unique(np.asarray(labels), return_inverse=True)
+        self.k = min(k, len(points))
+        self.min_distance = min_distance
+
+    def query(self, current_temp, current_rainfall):
+        """DataFrame of crop and confidence (%) among the k nearest rows, best first."""
+        point = (np.array([current_temp, current_rainfall], dtype=float) - self.mean) / self.scale
+        # With k=1 the tree returns scalars
+        distances, rows = (np.atleast_1d(values) for values in self.tree.query(point, k=self.k))
+        weights = 1.0 / np.maximum(distances, self.min_distance)
+        scores = np.bincount(self.label_codes[rows], weights=weights, minlength=len(self.crops))
+        scores *= 100 / scores.sum()
+        order = np.argsort(-scores, kind='stable')
+        order = order[scores[order] > 0]
+        return pd.DataFrame({'crop': self.crops[order], 'score': scores[order]})
+
+
+class CropDataStore:
+    """
+    In-memory index over the season and weather datasets.
+
+    Yield averages are kept as running sums per (district, season, crop) with a
+    ranked top 5 per (district, season), updated as yield observations are
+    ingested (see yield_stats.py), and weather label confidence is pre-counted per
+    (temp_bin, rainfall_bin) cell, so a recommendation request only needs two
+    dictionary lookups. The weather rows are also indexed for the 'knn' matcher
+    (see WeatherNeighbours).
+    """
+
+    def __init__(self, season_path=season_dataset_path, weather_path=weather_dataset_path):
+        self.season_path = season_path
+        self.weather_path = weather_path
+        self.version = self._file_version()
+        # Content hash of the source files, for keys that must change when the data does
+        self.fingerprint = dataset_fingerprint((season_path, weather_path))
+        start = time.perf_counter()
+
+        df_season, df_weather = self._read_sources()
+
+        # Standardize crop names
+        df_season['crop_name'] = df_season['crop_name'].map(season_mapping).fillna(df_season['crop_name'])
+        df_weather['label'] = df_weather['label'].map(weather_mapping).fillna(df_weather['label'])
+
+        self.yield_stats = YieldStats.load(df_season, file_sha256(season_path), crop_mapping=season_mapping)
+        self.weather_neighbours = WeatherNeighbours(df_weather['temperature'], df_weather['rainfall'], df_weather['label'])
+        self.weather_index = self._build_weather_index(df_weather)
+        self.load_seconds = time.perf_counter() - start
+
+    def _read_sources(self):
+        """
+        The raw season and weather tables, from the memory-mapped artifact when it was
+        exported from the current files (no CSV/xlsx parsing), otherwise from the files.
+        """
+        artifact = load_section('datasets', (self.season_path, self.weather_path))
+        if artifact is not None:
+            self.source = 'artifact'
+            frames = artifact.meta['frames']
+            return tuple(
+                pd.DataFrame({column: artifact[f'{name}_{column}'] for column in frames[name]})
+                for name in ('season', 'weather')
+            )
+        self.source = 'files'
+        return pd.read_csv(self.season_path), pd.read_excel(self.weather_path)
+
+    def _file_version(self):
+        """Modification times of the source files, used to detect changes on disk."""
+        return tuple(os.stat(path).st_mtime_ns for path in (self.season_path, self.weather_path))
+
+    def is_stale(self):
+        try:
+            return self._file_version() != self.version
+        except FileNotFoundError:
+            return False
+
+    @property
+    def yield_index(self):
+        """(district, season) -> DataFrame of the top mean yields, best first."""
+        return self.yield_stats.view
+
+    def yield_version(self):
+        """Applies newly logged yield observations and returns how many are included."""
+        self.yield_stats.refresh()
+        return self.yield_stats.observations
+
+    @staticmethod
+    def _build_weather_index(df_weather):
+        """(temp_bin, rainfall_bin) -> DataFrame of label confidence (%) in that cell."""
+        df_weather['temp_bin'] = pd.cut(df_weather['temperature'], bins=temp_bins, labels=temp_labels, right=False)
+        df_weather['rainfall_bin'] = pd.cut(df_weather['rainfall'], bins=rainfall_bins, labels=rainfall_labels, right=False)
+
+        index = {}
+        for (temp_bin, rainfall_bin), group in df_weather.groupby(['temp_bin', 'rainfall_bin'], observed=True, sort=False):
+            weather_counts = group['label'].value_counts()
+            weather_confidence = (weather_counts / len(group)) * 100
+            index[(temp_bin, rainfall_bin)] = pd.DataFrame({
+                'crop': weather_confidence.index,
+                'score': weather_confidence.values
+            })
+        return index
+
+    def top_season_crops(self, district, season, n=5):
+        self.yield_stats.refresh()
+        yield_by_crop = self.yield_stats.top(district, season, n)
+        if yield_by_crop is None:
+            return pd.DataFrame()
+        return yield_by_crop
 
-def get_final_recommendation(district_name_input, season_name_input, current_temp, current_rainfall):
+    def weather_crops(self, current_temp, current_rainfall, matcher=None):
+        """Crop confidence (%) for the weather, from the 'bins' or 'knn' matcher."""
+        if (matcher or WEATHER_MATCHER) == 'knn':
+            if current_temp is None or current_rainfall is None or pd.isna(current_temp) or pd.isna(current_rainfall):
+                return pd.DataFrame()
+            return self.weather_neighbours.query(current_temp, current_rainfall)
+        key = (_bin_label(current_temp, temp_bins, temp_labels),
+               _bin_label(current_rainfall, rainfall_bins, rainfall_labels))
+        return self.weather_index.get(key, pd.DataFrame())
+
+
+# --- Process-wide Data Store ---
+_data_store = None
+_data_store_lock = threading.Lock()
+
+
+def get_data_store():
+    """
+    Returns the shared CropDataStore, loading the datasets on first use.
+    """
+    global _data_store
+    if _data_store is None:
+        with _data_store_lock:
+            if _data_store is None:
+                _data_store = CropDataStore()
+    return _data_store
+
+
+def reload_data_store(only_if_changed=False):
+    """
+    Rebuilds the data store from the dataset files and swaps it in.
+    Requests already running keep using the old store until they finish.
+
+    Args:
+        only_if_changed (bool): Skip the rebuild when the files on disk have
+            not been modified since the current store was loaded.
+
+    Returns:
+        The active CropDataStore.
+    """
+    global _data_store, _recommendation_table
+    current = _data_store
+    if only_if_changed and current is not None and not current.is_stale():
+        return current
+    store = CropDataStore()
+    with _data_store_lock:
+        _data_store = store
+        # Re-validate the precomputed table against the new files on next use
+        _recommendation_table = None
+    return store
+
+
+def dataset_fingerprint(paths=(season_dataset_path, weather_dataset_path)):
+    """SHA-256 over the dataset files' hashes, used to tie derived artifacts to their sources."""
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(file_sha256(path).encode())
+    return digest.hexdigest()
+
+
+# --- Precomputed Recommendation Table ---
+class RecommendationTable:
+    """
+    Ranked top-5 results for every (district, season, temp_bin, rainfall_bin), as
+    produced by build_recommendation_table.py. A lookup only has to format the
+    weather explanation with the raw temperature and rainfall.
+
+    Rows are [crop, final_score] when the weather cell is empty (season-only
+    results), otherwise [crop, final_score, explanation_index, emoji].
+    Explanations are format templates in `strings`.
+    """
+
+    FORMAT_VERSION = 1
+
+    def __init__(self, payload):
+        if payload.get('format') != self.FORMAT_VERSION:
+            raise ValueError(f"Unsupported recommendation table format {payload.get('format')!r}.")
+        self.fingerprint = payload['fingerprint']
+        self.strings = payload['strings']
+        self.rows = payload['table']
+
+    @classmethod
+    def load(cls, path=recommendation_table_path):
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    @staticmethod
+    def key(district, season, temp_bin, rainfall_bin):
+        return f"{district}|{season}|{temp_bin or ''}|{rainfall_bin or ''}"
+
+    def lookup(self, district_name_input, season_name_input, current_temp, current_rainfall):
+        """Same records as get_final_recommendation(...).to_dict(orient='records')."""
+        rows = self.rows.get(self.key(
+            district_name_input, season_name_input,
+            _bin_label(current_temp, temp_bins, temp_labels),
+            _bin_label(current_rainfall, rainfall_bins, rainfall_labels),
+        ))
+        if rows is None:
+            return []
+
+        records = []
+        for row in rows:
+            if len(row) == 2:
+                records.append({'crop': row[0], 'final_score': row[1]})
+            else:
+                records.append({
+                    'crop': row[0],
+                    'final_score': row[1],
+                    'explanation': self.strings[row[2]].format(temp=current_temp, rainfall=current_rainfall),
+                    'emoji': row[3],
+                })
+        return records
+
+
+_recommendation_table = None
+
+
+def get_recommendation_table():
+    """
+    Returns the precomputed table, or None when it is missing or was built from
+    different dataset files than the ones on disk.
+    """
+    global _recommendation_table
+    if _recommendation_table is None:
+        table = False
+        try:
+            loaded = RecommendationTable.load()
+            if loaded.fingerprint == dataset_fingerprint():
+                table = loaded
+            else:
+                logger.warning("recommendation_table.json.gz is stale; using the live recommender.")
+        except (FileNotFoundError, ValueError, KeyError) as e:
+            logger.warning("recommendation_table.json.gz could not be loaded (%s: %s); using the live recommender.",
+                           type(e).__name__, e)
+        _recommendation_table = table
+    return _recommendation_table or None
+
+
+def data_store_status():
+    """Load state of the datasets, for the readiness endpoint."""
+    store = _data_store
+    return {
+        "state": 'ready' if store is not None else 'not_loaded',
+        "load_seconds": store.load_seconds if store is not None else None,
+        "source": store.source if store is not None else None,
+        "fingerprint": store.fingerprint if store is not None else None,
+        "yield_observations": store.yield_stats.status() if store is not None else None,
+        "precomputed_table": bool(_recommendation_table),
+        "weather_matcher": WEATHER_MATCHER,
+    }
+
+
+def recommendation_cache_fields(current_temp, current_rainfall):
+    """
+    The parts of the weather a get_recommendation_records answer depends on, for the
+    response cache key. With the 'bins' matcher that is the two bins and the values as
+    the weather explanation prints them, so requests that cannot get different answers
+    share an entry; with 'knn' it is the exact values.
+    """
+    values = [None if value is None else float(value) for value in (current_temp, current_rainfall)]
+    if WEATHER_MATCHER != 'bins':
+        return values
+    temp, rainfall = values
+    return [
+        _bin_label(temp, temp_bins, temp_labels),
+        _bin_label(rainfall, rainfall_bins, rainfall_labels),
+        None if temp is None else f"{temp:.1f}",
+        None if rainfall is None else f"{rainfall:.1f}",
+    ]
+
+
+def get_recommendation_records(district_name_input, season_name_input, current_temp, current_rainfall):
+    """
+    Final top 5 recommendations as a list of dicts, served from the precomputed
+    table when available and from get_final_recommendation otherwise. The table is
+    keyed on the weather bins, so it is only used with the 'bins' matcher, and it is
+    built from the dataset files alone, so it is skipped once yield observations
+    have been ingested.
+    """
+    with stage('dataset_access'):
+        table = get_recommendation_table() if WEATHER_MATCHER == 'bins' else None
+        if table is not None and get_data_store().yield_version() == 0:
+            return table.lookup(district_name_input, season_name_input, current_temp, current_rainfall)
+        return get_final_recommendation(district_name_input, season_name_input, current_temp, current_rainfall,
+                                        as_records=True)
+
+
+def get_final_recommendation(district_name_input, season_name_input, current_temp, current_rainfall,
+                             as_records=False, weather_matcher=None):
     """
     Provides a final crop recommendation by combining historical yield and real-time
     weather data.
@@ -13,93 +398,78 @@ def get_final_recommendation(district_name_input, season_name_input, current_tem
         season_name_input (str): The name of the season.
         current_temp (float): The current temperature in Celsius.
         current_rainfall (float): The current rainfall in mm.
+        as_records (bool): Return the rows as a list of dicts, skipping the DataFrame.
+        weather_matcher (str): 'bins' or 'knn'; defaults to the WEATHER_MATCHER setting.
     
     Returns:
-        A pandas DataFrame of the final top 5 recommended crops with a combined score.
+        A pandas DataFrame of the final top 5 recommended crops with a combined score,
+        or the same rows as get_final_recommendation(...).to_dict(orient='records').
     """
-    
-    # --- Step 1: Load and standardize datasets ---
-    # The paths are relative to where the script is run.
+    columns = _final_recommendation_columns(district_name_input, season_name_input, current_temp, current_rainfall,
+                                            weather_matcher)
+    if as_records:
+        return [dict(zip(columns, row)) for row in zip(*columns.values())]
+    return pd.DataFrame(columns)
+
+
+def _final_recommendation_columns(district_name_input, season_name_input, current_temp, current_rainfall,
+                                  weather_matcher=None):
+    """The final top 5 as a dict of column name -> list, empty when nothing matches."""
+
+    # --- Step 1: Load the indexed datasets ---
     try:
-        df_season = pd.read_csv('datasets/season-wise-crop.csv')
-        df_weather = pd.read_excel('datasets/weather-wise-crop.xlsx')
+        store = get_data_store()
     except (FileNotFoundError, pd.errors.ParserError) as e:
-        # Return an empty DataFrame on error, so it can be handled by the caller
-        return pd.DataFrame()
-
-    # Standardize crop names
-    season_mapping = {'arhar/tur': 'pigeonpea', 'gram': 'chickpea', 'moong': 'mungbean', 'urad': 'blackgram'}
-    df_season['crop_name'] = df_season['crop_name'].map(season_mapping).fillna(df_season['crop_name'])
-    weather_mapping = {'chickpea': 'chickpea', 'pigeonpea': 'pigeonpea', 'mungbean': 'mungbean', 'blackgram': 'blackgram'}
-    df_weather['label'] = df_weather['label'].map(weather_mapping).fillna(df_weather['label'])
+        # Return no columns on error, so it can be handled by the caller
+        return {}
 
     # --- Step 2: Stage 1 - Get top 5 crops from the season dataset ---
-    filtered_season_df = df_season[(df_season['district_name'] == district_name_input) & (df_season['season'] == season_name_input)]
-    if filtered_season_df.empty:
-        # If no season data is found, return an empty DataFrame
-        return pd.DataFrame()
-        
-    yield_by_crop = filtered_season_df.groupby('crop_name')['yield'].mean().reset_index()
-    top_5_season_crops = yield_by_crop.sort_values(by='yield', ascending=False).head(5).rename(columns={'crop_name': 'crop', 'yield': 'score'})
+    top_5_season_crops = store.top_season_crops(district_name_input, season_name_input)
+    if top_5_season_crops.empty:
+        # If no season data is found, there is nothing to recommend
+        return {}
 
     # --- Step 3: Stage 2 - Get top crops from the weather dataset ---
-    temp_bins = [0, 10, 20, 30, 40, 50]
-    temp_labels = ['0-10C', '10-20C', '20-30C', '30-40C', '40-50C']
-    rainfall_bins = [0, 50, 100, 150, 200, 250, 300]
-    rainfall_labels = ['0-50mm', '50-100mm', '100-150mm', '150-200mm', '200-250mm', '250-300mm']
+    top_weather_crops = store.weather_crops(current_temp, current_rainfall, weather_matcher)
 
-    df_weather['temp_bin'] = pd.cut(df_weather['temperature'], bins=temp_bins, labels=temp_labels, right=False)
-    df_weather['rainfall_bin'] = pd.cut(df_weather['rainfall'], bins=rainfall_bins, labels=rainfall_labels, right=False)
+    if top_weather_crops.empty:
+        return {'crop': top_5_season_crops['crop'].tolist(), 'final_score': top_5_season_crops['score'].tolist()}
 
-    current_temp_bin = pd.cut([current_temp], bins=temp_bins, labels=temp_labels, right=False)[0]
-    current_rainfall_bin = pd.cut([current_rainfall], bins=rainfall_bins, labels=rainfall_labels, right=False)[0]
+    # --- Step 4: Combine and rank final results ---
+    # Columnar outer join on crop. Rows are the weather crops in weather-stage order,
+    # then the season-only crops in yield order, which is also the tie-break order.
+    weather_crops = top_weather_crops['crop'].to_numpy()
+    weather_score = top_weather_crops['score'].to_numpy(dtype=float)
+    season_crops = top_5_season_crops['crop'].to_numpy()
+    season_yield = top_5_season_crops['score'].to_numpy(dtype=float)
 
-    filtered_weather_df = df_weather[(df_weather['temp_bin'] == current_temp_bin) & (df_weather['rainfall_bin'] == current_rainfall_bin)]
-    
-    if filtered_weather_df.empty:
-        return top_5_season_crops.rename(columns={'score': 'final_score'})
-        
-    weather_counts = filtered_weather_df['label'].value_counts()
-    total_count = len(filtered_weather_df)
-    weather_confidence = (weather_counts / total_count) * 100
-    
-    top_weather_crops = pd.DataFrame({
-        'crop': weather_confidence.index,
-        'score': weather_confidence.values
-    })
+    match = weather_crops[:, np.newaxis] == season_crops[np.newaxis, :]
+    season_only = ~match.any(axis=0)
+    crops = np.concatenate([weather_crops, season_crops[season_only]])
+    in_weather = np.arange(len(crops)) < len(weather_crops)
+    in_both = np.concatenate([match.any(axis=1), np.zeros(season_only.sum(), dtype=bool)])
+    avg_yield = np.concatenate([season_yield[match.argmax(axis=1)], season_yield[season_only]])
 
-    # --- Step 4: Combine and rank final results ---
-    combined_scores = {}
-    explanations = {}
-    
-    for index, row in top_weather_crops.iterrows():
-        crop = row['crop']
-        combined_scores[crop] = row['score']
-        explanations[crop] = f"This crop has a strong historical success rate in conditions with a temperature of {current_temp:.1f}°C and rainfall of {current_rainfall:.1f}mm."
-
-    for index, row in top_5_season_crops.iterrows():
-        crop = row['crop']
-        season_score = row['score'] * 10 
-        
-        if crop in combined_scores:
-            combined_scores[crop] += season_score + 50
-            explanations[crop] = f"The model highly recommends this crop because it has both high historical yield AND a high success rate in current weather conditions."
-        else:
-            combined_scores[crop] = season_score
-            explanations[crop] = f"This crop is a top performer in your district with an average yield of {row['score']:.2f} tonnes/hectare."
-    
-    final_results = pd.DataFrame(combined_scores.items(), columns=['crop', 'final_score'])
-    final_results['explanation'] = final_results['crop'].map(explanations)
-    
-    # --- Adding Emojis ---
-    emoji_mapping = {
-        'rice': '🍚', 'maize': '🌽', 'chickpea': '🫘', 'kidneybean': '🫘', 'pigeonpea': '🕊️', 'mothbeans': '🫘',
-        'mungbean': '🌱', 'blackgram': '⚫', 'lentil': '🥣', 'pomegranate': '🍎', 'banana': '🍌', 'mango': '🥭',
-        'grapes': '🍇', 'watermelon': '🍉', 'muskmelon': '🍈', 'apple': '🍎', 'orange': '🍊', 'papaya': '🍈',
-        'coconut': '🥥', 'cotton': '☁️', 'jute': '🌿', 'coffee': '☕', 'bajra': '🌾', 'groundnut': '🥜',
-        'jowar': '🌽', 'niger seed': '🌻', 'ragi': '🌾', 'sesamum': '🫘', 'soyabean': '🫘', 'sunflower': '🌻',
-        'wheat': '🌾', 'other pulses': '🫘', 'other cere': '🌾', 'other oilse': '🫘'
-    }
-    final_results['emoji'] = final_results['crop'].map(emoji_mapping)
+    # Season points (with the overlap bonus) are summed before being added to the weather score.
+    season_points = avg_yield * season_score_weight + np.where(in_both, overlap_bonus, 0)
+    final_score = np.concatenate([
+        weather_score + np.where(in_both[in_weather], season_points[in_weather], 0),
+        season_points[~in_weather],
+    ])
+
+    # Stable top 5, i.e. nlargest(5, keep='first') over the join order.
+    top = np.argsort(-final_score, kind='stable')[:5]
 
-    return final_results.sort_values(by='final_score', ascending=False).head(5)
\ No newline at end of file
+    weather_explanation = weather_explanation_template.format(temp=current_temp, rainfall=current_rainfall)
+    explanations = [
+        overlap_explanation if in_both[i]
+        else weather_explanation if in_weather[i]
+        else season_explanation_template.format(avg_yield[i])
+        for i in top
+    ]
+    return {
+        'crop': crops[top].tolist(),
+        'final_score': final_score[top].tolist(),
+        'explanation': explanations,
+        'emoji': [emoji_mapping.get(crop, np.nan) for crop in crops[top]],
+    }
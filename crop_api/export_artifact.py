@@ -0,0 +1,111 @@
+# Offline export of the model and datasets into agropilot_artifact.npz
+#
+# Usage: python export_artifact.py [--output PATH] [--skip-verify]
+#
+# Converts svc_poly_model.pkl, scaler.pkl and label_encoder.pkl into the fast scorer's
+# arrays, and season-wise-crop.csv / weather-wise-crop.xlsx into columnar arrays, then
+# writes them as one memory-mappable artifact (see artifact.py). Before keeping the
+# file it is reopened and checked against the pickles and the parsed source files.
+# Rerun after retraining the model or editing a dataset; until then the service
+# notices the changed sha256 and loads from the source files.
+
+import argparse
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from artifact import artifact_path, file_sha256, open_artifact, write_artifact
+from crop_recommender import season_dataset_path, weather_dataset_path
+from fast_svc import FastSVCScorer, verify_parity
+from Top5_Crops_SHAP import dataset_path, encoder_path, features, model_path, scaler_path
+
+MODEL_SOURCES = (model_path, scaler_path, encoder_path)
+DATASET_SOURCES = (season_dataset_path, weather_dataset_path)
+
+
+def _column_array(series):
+    """A column as a fixed-width unicode array for text, otherwise its NumPy values."""
+    if series.dtype.kind in 'biuf':
+        return series.to_numpy()
+    return series.to_numpy(dtype=str)
+
+
+def read_datasets():
+    return {
+        'season': pd.read_csv(season_dataset_path),
+        'weather': pd.read_excel(weather_dataset_path),
+    }
+
+
+def build_arrays():
+    """Returns (arrays, sections, extra_meta) for write_artifact."""
+    model = joblib.load(model_path)
+    scaler = joblib.load(scaler_path)
+    le = joblib.load(encoder_path)
+
+    arrays = {'class_names': np.asarray(le.classes_).astype(str)}
+    arrays.update({f'svc_{name}': array for name, array in FastSVCScorer.arrays_from_model(model, scaler).items()})
+
+    frames = {}
+    for name, df in read_datasets().items():
+        frames[name] = df.columns.tolist()
+        for column in df.columns:
+            arrays[f'{name}_{column}'] = _column_array(df[column])
+
+    sections = {
+        'model': {os.path.basename(path): file_sha256(path) for path in MODEL_SOURCES},
+        'datasets': {os.path.basename(path): file_sha256(path) for path in DATASET_SOURCES},
+    }
+    return arrays, sections, {'frames': frames}
+
+
+def verify_artifact(path):
+    """
+    Reopens the artifact and checks the scorer against predict_proba and the mapped
+    tables against the parsed source files. Raises AssertionError on a difference.
+    """
+    artifact = open_artifact(path)
+    model = joblib.load(model_path)
+    scaler = joblib.load(scaler_path)
+
+    assert np.array_equal(artifact['class_names'], joblib.load(encoder_path).classes_.astype(str))
+    scorer = FastSVCScorer.from_arrays(artifact.with_prefix('svc_'))
+    X = pd.read_csv(dataset_path)[features].to_numpy(dtype=float)
+    max_diff = verify_parity(scorer, model, scaler, X, features)
+
+    for name, df in read_datasets().items():
+        assert artifact.meta['frames'][name] == df.columns.tolist(), f"{name} columns differ"
+        for column in df.columns:
+            expected = _column_array(df[column])
+            actual = artifact[f'{name}_{column}']
+            assert actual.dtype == expected.dtype and np.array_equal(actual, expected), f"{name}.{column} differs"
+    return max_diff
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the model and datasets as a memory-mappable artifact.")
+    parser.add_argument('--output', default=artifact_path)
+    parser.add_argument('--skip-verify', action='store_true')
+    args = parser.parse_args()
+
+    arrays, sections, extra_meta = build_arrays()
+    tmp_output = f"{args.output}.new"
+    meta = write_artifact(tmp_output, arrays, sections, extra_meta)
+    print(f"Exported {len(arrays)} arrays ({os.path.getsize(tmp_output) / 1024:.0f} KiB), checksum {meta['checksum'][:12]}")
+
+    if not args.skip_verify:
+        try:
+            max_diff = verify_artifact(tmp_output)
+        except AssertionError as e:
+            os.remove(tmp_output)
+            raise SystemExit(f"❌ Artifact does not match the sources: {e}")
+        print(f"✅ Artifact matches the pickles (max |Δp| = {max_diff:.2e}) and the dataset files.")
+
+    os.replace(tmp_output, args.output)
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
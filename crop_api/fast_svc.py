@@ -0,0 +1,283 @@
+# NumPy fast path for the polynomial-kernel SVC in svc_poly_model.pkl
+#
+# Reproduces scaler.transform + model.predict_proba without pandas or sklearn input
+# validation: one-vs-one decision values come from a single kernel matmul, pairwise
+# Platt probabilities are coupled into class probabilities with libsvm's iterative
+# method (Wu, Lin & Weng 2004, as in libsvm's multiclass_probability).
+#
+# Run `python fast_svc.py` to check parity against model.predict_proba over
+# Crop_recommendation.csv and print per-request latency before and after.
+
+import threading
+import time
+
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:  # numba is optional; the NumPy coupling below is used instead
+    njit = None
+
+# libsvm clips pairwise probabilities to [min_prob, 1 - min_prob]
+_MIN_PROB = 1e-7
+# Batches at least this large compute decision values per class block
+_BLOCKWISE_MIN_ROWS = 32
+
+
+def _couple_loop(Q, p, max_iter, eps):
+    """
+    libsvm multiclass_probability, row by row. Q has shape (N, k, k) and p holds the
+    (N, k) starting point, updated in place. Compiled with numba when available.
+    """
+    n, k = p.shape
+    Qp = np.empty(k)
+    for row in range(n):
+        Qr = Q[row]
+        pr = p[row]
+        for _ in range(max_iter):
+            pQp = 0.0
+            for t in range(k):
+                s = 0.0
+                for j in range(k):
+                    s += Qr[t, j] * pr[j]
+                Qp[t] = s
+                pQp += pr[t] * s
+            max_error = 0.0
+            for t in range(k):
+                error = abs(Qp[t] - pQp)
+                if error > max_error:
+                    max_error = error
+            if max_error < eps:
+                break
+            for t in range(k):
+                diff = (-Qp[t] + pQp) / Qr[t, t]
+                pr[t] += diff
+                pQp = (pQp + diff * (diff * Qr[t, t] + 2 * Qp[t])) / (1 + diff) / (1 + diff)
+                for j in range(k):
+                    Qp[j] = (Qp[j] + diff * Qr[t, j]) / (1 + diff)
+                    pr[j] /= (1 + diff)
+    return p
+
+
+_couple_loop_jit = njit(cache=True)(_couple_loop) if njit is not None else None
+
+
+class FastSVCScorer:
+    """
+    Precomputed parameters of a fitted StandardScaler + poly-kernel SVC(probability=True).
+    """
+
+    def __init__(self, model, scaler):
+        self._setup(self.arrays_from_model(model, scaler))
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """Builds a scorer from arrays_from_model() output, e.g. mapped from artifact.py."""
+        scorer = cls.__new__(cls)
+        scorer._setup(arrays)
+        return scorer
+
+    @staticmethod
+    def arrays_from_model(model, scaler):
+        """
+        Everything the scorer needs from the fitted model and scaler, as plain arrays.
+        """
+        if model.kernel != 'poly' or not model.probability:
+            raise ValueError("FastSVCScorer supports poly-kernel SVCs trained with probability=True.")
+
+        n_features = model.support_vectors_.shape[1]
+        gamma = float(model._gamma)
+        k = len(model.classes_)
+        starts = np.concatenate([[0], np.cumsum(model.n_support_)])
+        dual_coef = model._dual_coef_
+
+        # One column of dual coefficients per one-vs-one pair, in libsvm's (i, j), i < j order,
+        # so all decision values come from one matmul.
+        pairs = [(i, j) for i in range(k) for j in range(i + 1, k)]
+        weights = np.zeros((model.support_vectors_.shape[0], len(pairs)))
+        for p, (i, j) in enumerate(pairs):
+            weights[starts[i]:starts[i + 1], p] = dual_coef[j - 1, starts[i]:starts[i + 1]]
+            weights[starts[j]:starts[j + 1], p] = dual_coef[i, starts[j]:starts[j + 1]]
+
+        return {
+            'mean': np.asarray(scaler.mean_, dtype=float) if scaler.with_mean else np.zeros(n_features),
+            'scale': np.asarray(scaler.scale_, dtype=float) if scaler.with_std else np.ones(n_features),
+            # gamma is folded into the support vectors so the kernel is (x @ sv.T + coef0) ** degree
+            'support_vectors_t': np.ascontiguousarray((model.support_vectors_ * gamma).T),
+            'pair_weights': weights,
+            # Rows s:e are the coefficients of class c's support vectors against the other classes
+            'dual_coef_t': np.ascontiguousarray(dual_coef.T),
+            'n_support': np.asarray(model.n_support_, dtype=np.int64),
+            'intercept': np.asarray(model._intercept_, dtype=float),
+            'prob_a': np.asarray(model._probA, dtype=float),
+            'prob_b': np.asarray(model._probB, dtype=float),
+            'gamma': np.array(gamma),
+            'coef0': np.array(float(model.coef0)),
+            'degree': np.array(int(model.degree)),
+        }
+
+    def _setup(self, arrays):
+        self.mean = arrays['mean']
+        self.scale = arrays['scale']
+        self.support_vectors_t = arrays['support_vectors_t']
+        self.pair_weights = arrays['pair_weights']
+        self.intercept = arrays['intercept']
+        self.prob_a = arrays['prob_a']
+        self.prob_b = arrays['prob_b']
+        self.gamma = float(arrays['gamma'])
+        self.coef0 = float(arrays['coef0'])
+        self.degree = int(arrays['degree'])
+        self.n_features = self.support_vectors_t.shape[0]
+
+        n_support = arrays['n_support']
+        k = self.n_classes = len(n_support)
+        self.pair_i, self.pair_j = np.triu_indices(k, 1)
+        # For large batches the dense pair matmul does ~k/2 times more work than needed;
+        # per-class blocks give each class's SVs against all k-1 coefficient rows instead.
+        starts = np.concatenate([[0], np.cumsum(n_support)])
+        self.class_slices = [(starts[c], starts[c + 1]) for c in range(k)]
+        self.class_coef_t = [arrays['dual_coef_t'][s:e] for s, e in self.class_slices]
+
+        # Preallocated single-row buffers, one set per thread (gunicorn gthread workers)
+        self._buffers = threading.local()
+
+        # Trigger numba compilation now rather than on the first request
+        self.predict_proba_one(self.mean)
+
+    def decision_values(self, X_scaled, kernel_out=None):
+        """One-vs-one decision values, shape (N, n_pairs)."""
+        kernel = np.matmul(X_scaled, self.support_vectors_t, out=kernel_out)
+        if self.coef0:
+            kernel += self.coef0
+        # Integer power by repeated multiplication; np.power on floats is much slower
+        if self.degree > 1:
+            base = kernel.copy()
+            for _ in range(self.degree - 1):
+                kernel *= base
+
+        if kernel.shape[0] < _BLOCKWISE_MIN_ROWS:
+            return kernel @ self.pair_weights + self.intercept
+
+        blocks = np.stack([kernel[:, s:e] @ coef_t for (s, e), coef_t in zip(self.class_slices, self.class_coef_t)], axis=1)
+        return blocks[:, self.pair_i, self.pair_j - 1] + blocks[:, self.pair_j, self.pair_i] + self.intercept
+
+    def _pairwise_probabilities(self, decision):
+        f = decision * self.prob_a + self.prob_b
+        # Numerically stable 1 / (1 + exp(f)), as in libsvm's sigmoid_predict
+        e = np.exp(-np.abs(f))
+        prob = np.where(f >= 0, e / (1.0 + e), 1.0 / (1.0 + e))
+        prob = np.clip(prob, _MIN_PROB, 1 - _MIN_PROB)
+
+        r = np.zeros((decision.shape[0], self.n_classes, self.n_classes))
+        r[:, self.pair_i, self.pair_j] = prob
+        r[:, self.pair_j, self.pair_i] = 1 - prob
+        return r
+
+    def _couple(self, r):
+        """libsvm multiclass_probability: pairwise probabilities (N, k, k) -> (N, k)."""
+        n, k = r.shape[0], self.n_classes
+        Q = np.ascontiguousarray(-r.transpose(0, 2, 1) * r)
+        diag = (r ** 2).sum(axis=1)
+        Q[:, np.arange(k), np.arange(k)] = diag
+        p = np.full((n, k), 1.0 / k)
+        eps = 0.005 / k
+        max_iter = max(100, k)
+
+        if _couple_loop_jit is not None:
+            return _couple_loop_jit(Q, p, max_iter, eps)
+
+        # NumPy fallback: the same iteration vectorized over rows
+        active = np.ones(n, dtype=bool)
+        for _ in range(max_iter):
+            Qp = np.einsum('nij,nj->ni', Q, p)
+            pQp = np.einsum('ni,ni->n', p, Qp)
+            max_error = np.abs(Qp - pQp[:, None]).max(axis=1)
+            active &= max_error >= eps
+            if not active.any():
+                break
+            for t in range(k):
+                diff = np.where(active, (pQp - Qp[:, t]) / diag[:, t], 0.0)
+                p[:, t] += diff
+                scale = 1.0 + diff
+                pQp = (pQp + diff * (diff * diag[:, t] + 2 * Qp[:, t])) / scale / scale
+                Qp = (Qp + diff[:, None] * Q[:, t, :]) / scale[:, None]
+                p /= scale[:, None]
+        return p
+
+    def predict_proba(self, X):
+        """
+        Class probabilities for raw (unscaled) feature rows, shape (N, n_classes),
+        in the model's classes_ order.
+        """
+        X = np.asarray(X, dtype=float)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        X_scaled = (X - self.mean) / self.scale
+        return self._couple(self._pairwise_probabilities(self.decision_values(X_scaled)))
+
+    def predict_proba_one(self, values):
+        """Class probabilities for a single raw feature row, using preallocated buffers."""
+        buffers = self._buffers
+        if not hasattr(buffers, 'row'):
+            buffers.row = np.empty((1, self.n_features))
+            buffers.kernel = np.empty((1, self.support_vectors_t.shape[1]))
+        row = buffers.row
+        row[0] = values
+        row -= self.mean
+        row /= self.scale
+        decision = self.decision_values(row, kernel_out=buffers.kernel)
+        return self._couple(self._pairwise_probabilities(decision))[0]
+
+
+def verify_parity(scorer, model, scaler, X, feature_names, atol=1e-9):
+    """
+    Largest absolute difference between the fast path and scaler + predict_proba.
+    Raises AssertionError if it exceeds atol.
+    """
+    import pandas as pd
+
+    expected = model.predict_proba(scaler.transform(pd.DataFrame(X, columns=feature_names)))
+    actual = scorer.predict_proba(X)
+    max_diff = float(np.abs(expected - actual).max())
+    single_diff = max(
+        float(np.abs(scorer.predict_proba_one(row) - expected[i]).max())
+        for i, row in enumerate(X[:200])
+    )
+    max_diff = max(max_diff, single_diff)
+    if max_diff > atol:
+        raise AssertionError(f"Fast path differs from predict_proba by {max_diff:.3g} (> {atol:g}).")
+    if not np.array_equal(expected.argmax(axis=1), actual.argmax(axis=1)):
+        raise AssertionError("Fast path changes the top-ranked crop for some rows.")
+    return max_diff
+
+
+def _time_per_call(fn, rows, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for row in rows:
+            fn(row)
+        best = min(best, (time.perf_counter() - start) / len(rows))
+    return best
+
+
+if __name__ == "__main__":
+    import pandas as pd
+
+    from Top5_Crops_SHAP import dataset_path, features, model_registry
+
+    registry = model_registry.get()
+    scorer = FastSVCScorer(registry.model, registry.scaler)
+    X = pd.read_csv(dataset_path)[features].to_numpy(dtype=float)
+
+    max_diff = verify_parity(scorer, registry.model, registry.scaler, X, features)
+    print(f"✅ Parity over {len(X)} rows of Crop_recommendation.csv, max |Δp| = {max_diff:.2e}")
+
+    rows = X[:500]
+    baseline = _time_per_call(
+        lambda row: registry.model.predict_proba(registry.scaler.transform(pd.DataFrame([row], columns=features))),
+        rows,
+    )
+    fast = _time_per_call(scorer.predict_proba_one, rows)
+    print(f"Per-request latency: predict_proba {baseline * 1e3:.3f} ms, fast path {fast * 1e3:.3f} ms "
+          f"({baseline / fast:.1f}x)")
@@ -0,0 +1,244 @@
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+from geopy.exc import GeopyError
+from geopy.geocoders import Nominatim
+from scipy.spatial import cKDTree
+
+from observability import cache_events, stage, upstream_errors
+
+logger = logging.getLogger(__name__)
+
+# --- Base Directory ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# --- Settings ---
+# 'remote' resolves through Nominatim behind the on-disk cache;
+# 'offline' resolves from the local district centroid file only.
+GEOCODER_MODE = os.environ.get("GEOCODER_MODE", "remote")
+GEOCODE_CACHE_PATH = os.environ.get("GEOCODE_CACHE_PATH", os.path.join(BASE_DIR, 'geocode_cache.sqlite3'))
+# Coordinates are rounded to this many decimals for the cache key (2 decimals is roughly 1 km).
+GEOCODE_CACHE_DECIMALS = int(os.environ.get("GEOCODE_CACHE_DECIMALS", 2))
+GEOCODE_TIMEOUT = float(os.environ.get("GEOCODE_TIMEOUT", 5))
+centroids_path = os.path.join(BASE_DIR, 'datasets', 'district-centroids.csv')
+
+# Points farther than this (in degrees) from every known district are left unresolved offline.
+OFFLINE_MAX_DISTANCE_DEGREES = 1.0
+
+# Names returned by the geocoder that differ from the district_name values in season-wise-crop.csv.
+# Keep in sync with lib/services/district_mapping.dart.
+district_aliases = {
+    'ahilyanagar': 'Ahmednagar',
+    'chhatrapati sambhajinagar': 'Aurangabad',
+    'dharashiv': 'Osmanabad',
+    'bid': 'Beed',
+    'buldana': 'Buldhana',
+    'gondiya': 'Gondia',
+    'nasik': 'Nashik',
+    'sholapur': 'Solapur',
+    'yeotmal': 'Yavatmal',
+    'vasai-virar': 'Palghar',
+    'mumbai suburban': 'Thane',
+    'mumbai city': 'Thane',
+    'mumbai': 'Thane',
+}
+
+_name_suffixes = (' district', ' city', ' taluka', ' division')
+
+
+def _load_centroids(path=centroids_path):
+    return pd.read_csv(path)
+
+
+_known_districts = None
+
+
+def normalize_district(name):
+    """
+    Maps a geocoder district/city name onto a district_name from season-wise-crop.csv.
+    Returns None when the name does not correspond to a known district.
+    """
+    global _known_districts
+    if not name:
+        return None
+    if _known_districts is None:
+        _known_districts = {d.lower(): d for d in _load_centroids()['district_name']}
+
+    key = name.strip().lower()
+    for suffix in _name_suffixes:
+        if key.endswith(suffix):
+            key = key[:-len(suffix)].strip()
+    return _known_districts.get(key) or district_aliases.get(key)
+
+
+def _location(district, state):
+    return {'district': district or '', 'state': state or ''}
+
+
+class GeocodeCache:
+    """
+    Persistent SQLite cache of reverse geocoding results keyed on rounded coordinates.
+    Each process opens its own connection, so it is safe to use after a gunicorn fork.
+    """
+
+    def __init__(self, path=GEOCODE_CACHE_PATH, decimals=GEOCODE_CACHE_DECIMALS):
+        self.path = path
+        self.decimals = decimals
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    def _connection(self):
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS reverse_geocode ("
+                " lat_key REAL NOT NULL, lon_key REAL NOT NULL,"
+                " district TEXT, state TEXT, created_at REAL,"
+                " PRIMARY KEY (lat_key, lon_key))"
+            )
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def key(self, lat, lon):
+        return round(float(lat), self.decimals), round(float(lon), self.decimals)
+
+    def get(self, lat, lon):
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT district, state FROM reverse_geocode WHERE lat_key = ? AND lon_key = ?",
+                self.key(lat, lon),
+            ).fetchone()
+        return _location(*row) if row else None
+
+    def put(self, lat, lon, location):
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO reverse_geocode VALUES (?, ?, ?, ?, ?)",
+                (*self.key(lat, lon), location['district'], location['state'], time.time()),
+            )
+            conn.commit()
+
+
+class OfflineGeocoder:
+    """
+    Resolves the nearest district from the local centroid file with a KD-tree.
+    """
+
+    def __init__(self, path=centroids_path, max_distance=OFFLINE_MAX_DISTANCE_DEGREES):
+        df = _load_centroids(path)
+        self.districts = df['district_name'].tolist()
+        self.states = df['state'].tolist()
+        self.max_distance = max_distance
+        # Scale longitude so distances are roughly isotropic at this latitude.
+        self._lon_scale = math.cos(math.radians(df['latitude'].mean()))
+        self._tree = cKDTree(list(zip(df['latitude'], df['longitude'] * self._lon_scale)))
+
+    def reverse(self, lat, lon):
+        distance, i = self._tree.query((lat, lon * self._lon_scale))
+        if distance > self.max_distance:
+            return _location(None, None)
+        return _location(self.districts[i], self.states[i])
+
+
+class NominatimGeocoder:
+    """
+    Remote reverse geocoding through a single shared Nominatim client.
+    """
+
+    def __init__(self, timeout=GEOCODE_TIMEOUT):
+        self._client = Nominatim(user_agent="agropilot", timeout=timeout)
+
+    def reverse(self, lat, lon):
+        location = self._client.reverse((lat, lon), language="en")
+        if location is None:
+            return _location(None, None)
+        address = location.raw.get('address', {})
+
+        district = None
+        for field in ('state_district', 'county', 'city'):
+            district = normalize_district(address.get(field))
+            if district:
+                break
+        if not district:
+            district = address.get('city', '') or address.get('county', '')
+        return _location(district, address.get('state', ''))
+
+
+class ReverseGeocoder:
+    """
+    Pluggable reverse geocoder: an optional persistent cache in front of a backend,
+    with an optional fallback backend when the primary one fails.
+    """
+
+    def __init__(self, backend, cache=None, fallback=None):
+        self.backend = backend
+        self.cache = cache
+        self.fallback = fallback
+
+    def reverse(self, lat, lon):
+        """
+        Returns {'district': str, 'state': str} for the coordinate.
+        """
+        if self.cache is not None:
+            cached = self.cache.get(lat, lon)
+            cache_events.inc(cache='geocode', result='hit' if cached is not None else 'miss')
+            if cached is not None:
+                return cached
+
+        try:
+            with stage('geocode'):
+                location = self.backend.reverse(lat, lon)
+        except GeopyError as e:
+            upstream_errors.inc(service='geocoder')
+            if self.fallback is None:
+                raise
+            logger.warning("Reverse geocoding failed, using offline fallback: %s", e)
+            # Fallback answers are approximate, so they are not written to the cache.
+            return self.fallback.reverse(lat, lon)
+
+        if self.cache is not None:
+            self.cache.put(lat, lon, location)
+        return location
+
+
+_geocoder = None
+_geocoder_lock = threading.Lock()
+
+
+def get_reverse_geocoder():
+    """
+    Returns the process-wide ReverseGeocoder configured by GEOCODER_MODE.
+    """
+    global _geocoder
+    if _geocoder is None:
+        with _geocoder_lock:
+            if _geocoder is None:
+                offline = OfflineGeocoder() if os.path.exists(centroids_path) else None
+                if GEOCODER_MODE == 'offline':
+                    _geocoder = ReverseGeocoder(offline)
+                else:
+                    _geocoder = ReverseGeocoder(NominatimGeocoder(), cache=GeocodeCache(), fallback=offline)
+    return _geocoder
+
+
+def reverse_geocode(lat: float, lon: float):
+    """
+    Resolves a coordinate to the district and state used by the recommenders.
+
+    Args:
+        lat (float): Latitude of the location.
+        lon (float): Longitude of the location.
+
+    Returns:
+        dict: {'district': str, 'state': str}. The district matches a district_name
+              in season-wise-crop.csv whenever the location is in a known district.
+    """
+    return get_reverse_geocoder().reverse(float(lat), float(lon))
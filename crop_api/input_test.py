@@ -1,5 +1,5 @@
 # Import the function from your model file
-from crop_recommendor import get_final_recommendation
+from crop_recommender import get_final_recommendation
 
 # --- Assume these are the inputs from your UI/API ---
 district_input = 'Ahmednagar'
@@ -0,0 +1,203 @@
+# End-to-end load test for the Flask app under gunicorn
+#
+# Usage:
+#   python load_test.py [--duration S] [--concurrency C] [--workers W] [--threads T]
+#                       [--cache {off,on,both}] [--output PATH]
+#   python load_test.py --url http://127.0.0.1:5000   # against an already running server
+#
+# Starts gunicorn on a free local port (OpenWeatherMap replaced by weather_stub.py,
+# geocoding in offline mode), drives each endpoint with C concurrent clients for S
+# seconds, and reports p50/p95/p99 latency and throughput per endpoint as JSON.
+#
+# Every request sends a different payload (and weather lookups a different grid cell)
+# to a server started with RESPONSE_CACHE=0, so the figures measure the endpoints
+# themselves. With --cache on/both, a second server with the response cache enabled
+# is driven with one fixed payload per endpoint, reported as '<endpoint>[cached]'.
+
+import argparse
+import itertools
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+from benchmark import RESULTS_DIR, git_commit, summarize
+from weather_stub import WeatherStubServer
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DISTRICTS = ['Ahmednagar', 'Pune', 'Nagpur', 'Kolhapur', 'Nashik', 'Solapur', 'Satara', 'Jalgaon']
+SEASONS = ['kharif', 'rabi', 'summer']
+
+
+# --- Payloads ---
+# Request i gets its own payload; the values stay within realistic ranges.
+def lab_report(i):
+    return {"N": 40 + i % 97, "P": 20 + (i * 7) % 61, "K": 15 + (i * 13) % 41,
+            "temperature": round(15 + (i * 0.37) % 20, 2), "humidity": round(40 + (i * 0.53) % 50, 2),
+            "ph": round(5.5 + (i * 0.011) % 2.5, 3), "rainfall": round(60 + (i * 1.7) % 200, 2)}
+
+
+def no_lab_report(i):
+    return {"district": DISTRICTS[i % len(DISTRICTS)], "season": SEASONS[(i // len(DISTRICTS)) % len(SEASONS)],
+            "temperature": round(10 + (i * 0.1) % 30, 1), "rainfall": round((i * 0.7) % 290, 1)}
+
+
+def coordinates(i):
+    """A different 0.05° weather grid cell for each i (19600 of them) around Maharashtra."""
+    return round(15.5 + (i % 140) * 0.05, 2), round(72.8 + (i // 140 % 140) * 0.05, 2)
+
+
+# (name, method, request(i) -> (path, payload))
+SCENARIOS = [
+    ('predict_lab_report', 'POST', lambda i: ('/predict_lab_report', lab_report(i))),
+    ('get_crop_details', 'POST', lambda i: ('/get_crop_details', {**lab_report(i), "crop_name": "rice"})),
+    ('predict_no_lab_report', 'POST', lambda i: ('/predict_no_lab_report', no_lab_report(i))),
+    ('get_weather_and_location', 'GET',
+     lambda i: ('/get_weather_and_location?lat={}&lon={}'.format(*coordinates(i)), None)),
+    ('recommendations', 'POST',
+     lambda i: ('/recommendations', dict(zip(('latitude', 'longitude'), coordinates(i))))),
+    ('predict_lab_report_batch_100', 'POST',
+     lambda i: ('/predict_lab_report/batch', {"samples": [lab_report(i * 100 + j) for j in range(100)]})),
+]
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_gunicorn(workers, threads, forecast_url, response_cache, snapshot_dir):
+    port = _free_port()
+    env = dict(os.environ, OPENWEATHER_FORECAST_URL=forecast_url, GEOCODER_MODE='offline',
+               RESPONSE_CACHE='1' if response_cache else '0',
+               WEATHER_SNAPSHOT_PATH=os.path.join(snapshot_dir, f'weather-{port}.sqlite3'))
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'app:app', '--chdir', BASE_DIR,
+         '--bind', f'127.0.0.1:{port}', '--workers', str(workers), '--threads', str(threads),
+         '--preload', '--log-level', 'warning'],
+        env=env, stdout=subprocess.DEVNULL,
+    )
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with code {process.returncode}")
+        try:
+            if requests.get(f'{url}/ready', timeout=1).status_code == 200:
+                return process, url
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("gunicorn did not become ready within 60s")
+
+
+def run_scenario(url, method, make_request, duration, concurrency, vary=True):
+    """Drives one endpoint; with vary every call sends make_request(i) for a new i, else make_request(0)."""
+    latencies, errors = [], 0
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+    # next() on a shared count is atomic under the GIL, so no two calls get the same i
+    counter = itertools.count()
+
+    def client():
+        nonlocal errors
+        session = requests.Session()
+        local, local_errors = [], 0
+        while time.monotonic() < stop_at:
+            path, payload = make_request(next(counter) if vary else 0)
+            start = time.perf_counter()
+            try:
+                response = session.request(method, url + path, json=payload, timeout=30)
+                ok = response.status_code < 400
+            except requests.RequestException:
+                ok = False
+            local.append(time.perf_counter() - start)
+            local_errors += not ok
+        with lock:
+            latencies.extend(local)
+            errors += local_errors
+
+    started = time.perf_counter()
+    clients = [threading.Thread(target=client) for _ in range(concurrency)]
+    for t in clients:
+        t.start()
+    for t in clients:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    stats = summarize(latencies) if latencies else {"calls": 0}
+    stats.update({"errors": errors, "throughput_rps": len(latencies) / elapsed, "concurrency": concurrency,
+                  "payloads": "varied" if vary else "fixed"})
+    stats.pop('ops_per_sec', None)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the crop_api endpoints under gunicorn.")
+    parser.add_argument('--duration', type=float, default=10.0, help="Seconds per endpoint")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--url', help="Target an already running server instead of starting gunicorn")
+    parser.add_argument('--cache', choices=('off', 'on', 'both'), default='both',
+                        help="Run with the response cache off (varied payloads), on (fixed payloads) or both")
+    parser.add_argument('--only', nargs='*', help="Run only these scenarios")
+    parser.add_argument('--output', help="JSON results path (default: benchmark_results/load-<commit>.json)")
+    args = parser.parse_args()
+
+    # (response cache on, suffix): uncached runs send varied payloads, cached runs a fixed one
+    runs = [(False, ''), (True, '[cached]')]
+    runs = [run for run in runs if args.cache == 'both' or run[0] == (args.cache == 'on')]
+
+    results = {}
+    stub = WeatherStubServer().start() if args.url is None else None
+    try:
+        with tempfile.TemporaryDirectory() as snapshot_dir:
+            for cached, suffix in runs:
+                process, url = None, args.url
+                if url is None:
+                    process, url = start_gunicorn(args.workers, args.threads, stub.forecast_url, cached, snapshot_dir)
+                try:
+                    for name, method, make_request in SCENARIOS:
+                        if args.only and name not in args.only:
+                            continue
+                        stats = results[name + suffix] = run_scenario(
+                            url, method, make_request, args.duration, args.concurrency, vary=not cached)
+                        print(f"{name + suffix:<40} {stats['throughput_rps']:8.1f} req/s  "
+                              f"p50 {stats.get('p50_ms', 0):8.2f} ms  p95 {stats.get('p95_ms', 0):8.2f} ms  "
+                              f"p99 {stats.get('p99_ms', 0):8.2f} ms  errors {stats['errors']}")
+                finally:
+                    if process is not None:
+                        process.terminate()
+                        process.wait(timeout=30)
+    finally:
+        if stub is not None:
+            stub.stop()
+
+    commit = git_commit()
+    report = {
+        "suite": "load",
+        "commit": commit,
+        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        "target": args.url or f"gunicorn --workers {args.workers} --threads {args.threads}",
+        "duration_per_endpoint_s": args.duration,
+        "results": results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"load-{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+# Metrics, per-request stage tracing and logging setup for the crop_api service
+#
+# Metrics are kept in-process and rendered in the Prometheus text format on /metrics.
+# Under gunicorn each worker keeps its own counters, so scrape each worker or sum
+# across scrapes. stage() times a named step (weather fetch, geocode, dataset access,
+# predict_proba, JSON serialization) into a histogram and into the current request's
+# trace, which is logged at DEBUG when the request finishes.
+
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+# --- Settings ---
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+# 'json' for one JSON object per line, 'text' for plain lines
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json")
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _label_key(labelnames, labels):
+    return tuple(str(labels.get(name, '')) for name in labelnames)
+
+
+def _format_labels(labelnames, key, extra=()):
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, key)] + list(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # key -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[i] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, entry in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, entry):
+                    labels = _format_labels(self.labelnames, key, ['le="%s"' % bound])
+                    lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _format_labels(self.labelnames, key, ['le="+Inf"'])
+                lines.append(f"{self.name}_bucket{labels} {entry[-1]}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {entry[-2]}")
+                lines.append(f"{self.name}_count{labels} {entry[-1]}")
+        return lines
+
+
+# --- Metrics ---
+http_requests = Counter(
+    'agropilot_http_requests_total', "HTTP requests by endpoint, method and status.",
+    ('endpoint', 'method', 'status'))
+http_request_duration = Histogram(
+    'agropilot_http_request_duration_seconds', "HTTP request latency by endpoint.", ('endpoint',))
+stage_duration = Histogram(
+    'agropilot_stage_duration_seconds', "Time spent in each request stage.", ('stage',))
+upstream_errors = Counter(
+    'agropilot_upstream_errors_total', "Failed calls to upstream services.", ('service',))
+cache_events = Counter(
+    'agropilot_cache_events_total', "Cache lookups by cache and result (hit, miss, coalesced).",
+    ('cache', 'result'))
+
+_metrics = [http_requests, http_request_duration, stage_duration, upstream_errors, cache_events]
+_collectors = []
+
+
+def register_collector(collect):
+    """
+    Adds a callable returning [(name, type, help, labels_dict, value), ...] that is
+    evaluated at scrape time, for values owned by other components (cache sizes etc.).
+    """
+    _collectors.append(collect)
+
+
+def render_metrics():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    seen = set()
+    for collect in _collectors:
+        for name, kind, documentation, labels, value in collect():
+            if name not in seen:
+                seen.add(name)
+                lines += [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}"]
+            lines.append(f"{name}{_format_labels(tuple(labels), tuple(labels.values()))} {value}")
+    return '\n'.join(lines) + '\n'
+
+
+# --- Request Tracing ---
+# Stage timings of the current request; fan_out copies the context into pool threads.
+_current_trace = contextvars.ContextVar('agropilot_trace', default=None)
+
+
+def start_trace():
+    trace = []
+    _current_trace.set(trace)
+    return trace
+
+
+def end_trace():
+    _current_trace.set(None)
+
+
+@contextmanager
+def stage(name):
+    """Times a block as request stage `name`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_duration.observe(elapsed, stage=name)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.append((name, elapsed))
+
+
+# --- Logging ---
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with the message, level, logger and any `extra` fields."""
+
+    _reserved = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+    def format(self, record):
+        payload = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in self._reserved:
+                payload[key] = value
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str, ensure_ascii=False)
+
+
+_log_queue = None
+_listener = None
+
+
+def _start_listener(handler):
+    global _listener
+    _listener = logging.handlers.QueueListener(_log_queue, handler, respect_handler_level=True)
+    _listener.start()
+
+
+def configure_logging(level=LOG_LEVEL, fmt=LOG_FORMAT):
+    """
+    Routes the root logger through a queue so request threads never block on stderr;
+    a background listener does the writing. The listener is restarted in forked
+    gunicorn workers, since threads do not survive fork.
+    """
+    global _log_queue
+    if _log_queue is not None:
+        return
+
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter() if fmt == 'json' else logging.Formatter(
+        '%(asctime)s %(levelname)s %(name)s: %(message)s'))
+
+    _log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.handlers[:] = [logging.handlers.QueueHandler(_log_queue)]
+    root.setLevel(level)
+
+    _start_listener(handler)
+    os.register_at_fork(after_in_child=lambda: _start_listener(handler))
@@ -0,0 +1,217 @@
+# Response cache for the deterministic prediction endpoints
+#
+# /predict_lab_report, /predict_no_lab_report and /get_crop_details are pure functions
+# of their JSON body and of the loaded model and datasets. Bodies are canonicalized
+# (numbers as exact floats, keys sorted) and hashed together with the endpoint and a
+# generation string that changes whenever the model or dataset files change, so a
+# reload or redeploy never serves an old answer. An endpoint may key on a reduced body
+# instead, holding only what its answer depends on (see cached_json_endpoint in app.py).
+#
+# Entries live in a per-process LRU bounded by entry count and total bytes. With
+# RESPONSE_CACHE_URL set (redis://host:port/db) a shared Redis-compatible store sits
+# behind it, so a response computed by one gunicorn worker is a hit in the others.
+# cache_stub.py is a local stand-in for Redis.
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from observability import cache_events, upstream_errors
+
+logger = logging.getLogger(__name__)
+
+# --- Settings ---
+RESPONSE_CACHE_ENABLED = os.environ.get("RESPONSE_CACHE", "1") == "1"
+RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", 4096))
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+# Shared backend, e.g. redis://127.0.0.1:6379/0; empty for the per-process cache only
+RESPONSE_CACHE_URL = os.environ.get("RESPONSE_CACHE_URL", "")
+RESPONSE_CACHE_TTL = int(os.environ.get("RESPONSE_CACHE_TTL", 24 * 60 * 60))
+# Socket timeout for the shared backend; a slow or missing backend must not hold up requests
+RESPONSE_CACHE_SHARED_TIMEOUT = float(os.environ.get("RESPONSE_CACHE_SHARED_TIMEOUT", 0.1))
+# Cache-Control max-age sent to clients
+RESPONSE_CACHE_MAX_AGE = int(os.environ.get("RESPONSE_CACHE_MAX_AGE", 300))
+
+_KEY_PREFIX = 'agropilot:response:'
+# After a shared backend error, skip it for this many seconds
+_SHARED_RETRY_SECONDS = 30
+
+
+def canonical_body(data):
+    """
+    Returns the body with every number as a float (so 50 and 50.0 are the same request),
+    recursively through dicts and lists. Numbers are not rounded: a rounded value can
+    land on the other side of a decision boundary and get a different answer.
+    """
+    if isinstance(data, bool) or data is None or isinstance(data, str):
+        return data
+    if isinstance(data, (int, float)):
+        return float(data)
+    if isinstance(data, dict):
+        return {str(key): canonical_body(value) for key, value in data.items()}
+    if isinstance(data, list):
+        return [canonical_body(value) for value in data]
+    return data
+
+
+def cache_key(endpoint, generation, body):
+    """sha256 hex digest over the endpoint, the generation and the canonical JSON body."""
+    canonical = json.dumps(body, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(f"{endpoint}\n{generation}\n{canonical}".encode()).hexdigest()
+
+
+class LocalResponseCache:
+    """
+    Thread-safe LRU of response bodies (bytes), bounded by entry count and total size.
+    A body larger than max_bytes on its own is not stored.
+    """
+
+    def __init__(self, max_entries=RESPONSE_CACHE_SIZE, max_bytes=RESPONSE_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> body
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+            return body
+
+    def set(self, key, body):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= len(previous)
+            self._entries[key] = body
+            self.bytes += len(body)
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= len(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisResponseStore:
+    """
+    Shared store on a Redis-compatible server (GET and SET with EX). Needs the redis
+    package. Errors are logged and treated as misses, and the store is skipped for a
+    while afterwards, so the service keeps answering without it.
+    """
+
+    def __init__(self, url, ttl_seconds=RESPONSE_CACHE_TTL, timeout=RESPONSE_CACHE_SHARED_TIMEOUT):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("RESPONSE_CACHE_URL needs the redis package (pip install redis).") from e
+        self.url = url
+        self.ttl_seconds = ttl_seconds
+        self._errors = (redis.RedisError, OSError)
+        # redis-py's connection pool reconnects after a fork, so workers do not share sockets
+        self._client = redis.Redis.from_url(url, socket_timeout=timeout, socket_connect_timeout=timeout)
+        self._retry_at = 0.0
+
+    def _available(self):
+        return time.monotonic() >= self._retry_at
+
+    def _failed(self, operation, error):
+        upstream_errors.inc(service='response_cache')
+        logger.warning("Shared response cache %s failed, skipping it for %ss: %s",
+                       operation, _SHARED_RETRY_SECONDS, error)
+        self._retry_at = time.monotonic() + _SHARED_RETRY_SECONDS
+
+    def get(self, key):
+        if not self._available():
+            return None
+        try:
+            return self._client.get(_KEY_PREFIX + key)
+        except self._errors as e:
+            self._failed('get', e)
+            return None
+
+    def set(self, key, body):
+        if not self._available():
+            return
+        try:
+            self._client.set(_KEY_PREFIX + key, body, ex=self.ttl_seconds)
+        except self._errors as e:
+            self._failed('set', e)
+
+
+class ResponseCache:
+    """
+    The per-process LRU, optionally backed by a shared store. A shared hit is copied
+    into the local LRU so repeats are served without a network round trip.
+    """
+
+    def __init__(self, local=None, shared=None):
+        self.local = local if local is not None else LocalResponseCache()
+        self.shared = shared
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        body = self.local.get(key)
+        if body is not None:
+            self.hits += 1
+            cache_events.inc(cache='response', result='hit')
+            return body
+        if self.shared is not None:
+            body = self.shared.get(key)
+            if body is not None:
+                self.local.set(key, body)
+                self.shared_hits += 1
+                cache_events.inc(cache='response', result='shared_hit')
+                return body
+        self.misses += 1
+        cache_events.inc(cache='response', result='miss')
+        return None
+
+    def set(self, key, body):
+        self.local.set(key, body)
+        if self.shared is not None:
+            self.shared.set(key, body)
+
+    def clear(self):
+        """Drops the local entries; shared entries of an old generation expire by TTL."""
+        self.local.clear()
+
+    def stats(self):
+        lookups = self.hits + self.shared_hits + self.misses
+        return {
+            "entries": len(self.local),
+            "bytes": self.local.bytes,
+            "max_entries": self.local.max_entries,
+            "max_bytes": self.local.max_bytes,
+            "evictions": self.local.evictions,
+            "shared_backend": self.shared.url if self.shared is not None else None,
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits + self.shared_hits) / lookups if lookups else 0.0,
+        }
+
+
+def make_response_cache():
+    """The ResponseCache configured by the RESPONSE_CACHE_* settings, or None when disabled."""
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+    shared = RedisResponseStore(RESPONSE_CACHE_URL) if RESPONSE_CACHE_URL else None
+    return ResponseCache(LocalResponseCache(), shared)
@@ -0,0 +1,166 @@
+# Shapley-value attributions for the crop SVC
+#
+# Interventional SHAP over the 7 input features against a small weighted background
+# set (k-means summaries of the training data). The value of a coalition S is the
+# background-weighted mean of f(x_S, b_rest). With 7 features there are only 128
+# coalitions, so by default all of them are evaluated and the attributions are exact
+# Shapley values. A smaller sample budget switches to Kernel SHAP: sampled coalitions
+# plus a constrained weighted least-squares fit. Either way, every model evaluation
+# for a request goes through one batched predict_proba call.
+
+import math
+from itertools import combinations
+
+import numpy as np
+
+
+def _shapley_weight_matrix(n_features):
+    """
+    (M, 2^M) matrix W with phi = W @ v for coalition values v indexed by bitmask.
+    """
+    n_coalitions = 1 << n_features
+    W = np.zeros((n_features, n_coalitions))
+    for mask in range(n_coalitions):
+        size = bin(mask).count('1')
+        for i in range(n_features):
+            if mask & (1 << i):
+                continue
+            weight = math.factorial(size) * math.factorial(n_features - size - 1) / math.factorial(n_features)
+            W[i, mask | (1 << i)] += weight
+            W[i, mask] -= weight
+    return W
+
+
+def _all_masks(n_features):
+    masks = np.arange(1 << n_features)
+    return ((masks[:, None] >> np.arange(n_features)) & 1).astype(bool)
+
+
+class ShapleyExplainer:
+    """
+    Attributions of every class probability to each input feature.
+
+    Args:
+        predict_proba (callable): (N, M) raw feature rows -> (N, C) probabilities.
+        background (ndarray): (B, M) background rows.
+        background_weights (ndarray): (B,) weights, normalized internally.
+        sample_budget (int): Maximum number of coalitions to evaluate per request.
+            At or above 2^M the exact Shapley values are computed.
+        seed (int): Seed for coalition sampling, so results are reproducible.
+    """
+
+    def __init__(self, predict_proba, background, background_weights=None, sample_budget=128, seed=0):
+        self.predict_proba = predict_proba
+        self.background = np.asarray(background, dtype=float)
+        self.n_features = self.background.shape[1]
+        weights = np.ones(len(self.background)) if background_weights is None else np.asarray(background_weights, dtype=float)
+        self.background_weights = weights / weights.sum()
+        self.sample_budget = sample_budget
+        self.seed = seed
+
+        self.exact = sample_budget >= (1 << self.n_features)
+        if self.exact:
+            self._masks = _all_masks(self.n_features)
+            self._weights = _shapley_weight_matrix(self.n_features)
+        else:
+            self._masks = self._sample_masks(max(sample_budget - 2, 1))
+
+    @property
+    def method(self):
+        return 'shap-exact' if self.exact else 'kernel-shap'
+
+    def _sample_masks(self, n_samples):
+        """
+        Empty and full coalitions, then the rest of the budget over the Shapley kernel,
+        where size s carries weight proportional to (M - 1) / (s (M - s)).
+
+        Sizes are taken in complementary pairs (s, M - s), smallest first since they
+        carry the most kernel weight, and a pair is enumerated completely when its share
+        of the kernel weight, applied to the remaining budget, covers every one of its
+        coalitions (the rule Kernel SHAP uses). The remaining budget goes to distinct coalitions drawn from the
+        other sizes, each together with its complement. Each drawn coalition of size s
+        gets an equal share of that size's kernel weight, so no weight is lost and a
+        budget that covers every coalition gives the exact Shapley values.
+        """
+        M = self.n_features
+        rng = np.random.default_rng(self.seed)
+        masks = [np.zeros(M, dtype=bool), np.ones(M, dtype=bool)]
+        self._sample_weights = [0.0, 0.0]
+
+        size_weights = np.array([0.0] + [(M - 1) / (s * (M - s)) for s in range(1, M)])
+        size_weights /= size_weights.sum()
+
+        remaining = n_samples
+        pairs = [sorted({s, M - s}) for s in range(1, M // 2 + 1)]
+        while pairs:
+            count = sum(math.comb(M, s) for s in pairs[0])
+            share = sum(size_weights[s] for s in pairs[0]) / sum(size_weights[s] for pair in pairs for s in pair)
+            if remaining * share < count - 1e-8:
+                break
+            for s in pairs.pop(0):
+                for members in combinations(range(M), s):
+                    mask = np.zeros(M, dtype=bool)
+                    mask[list(members)] = True
+                    masks.append(mask)
+                    self._sample_weights.append(size_weights[s] / math.comb(M, s))
+            remaining -= count
+
+        left = [s for pair in pairs for s in pair]
+        if left and remaining >= 2:
+            # Draw distinct (coalition, complement) pairs; a size and its complement
+            # have the same kernel weight, so drawing the smaller size of each pair suffices
+            small = [pair[0] for pair in pairs]
+            p = np.array([size_weights[s] * len(pair) for s, pair in zip(small, pairs)])
+            target = min(remaining // 2, sum(math.comb(M, s) * len(pair) // 2 for s, pair in zip(small, pairs)))
+            drawn, sizes = set(), []
+            for _ in range(100 * target):
+                if len(sizes) >= 2 * target:
+                    break
+                s = small[rng.choice(len(small), p=p / p.sum())]
+                mask = np.zeros(M, dtype=bool)
+                mask[rng.choice(M, size=s, replace=False)] = True
+                if mask.tobytes() in drawn:
+                    continue
+                drawn.update((mask.tobytes(), (~mask).tobytes()))
+                masks.extend((mask, ~mask))
+                sizes.extend((s, M - s))
+            per_size = {s: sizes.count(s) for s in set(sizes)}
+            self._sample_weights.extend(size_weights[s] / per_size[s] for s in sizes)
+
+        self._sample_weights = np.array(self._sample_weights)
+        return np.array(masks)
+
+    def explain(self, x):
+        """
+        Returns (phi, base_value, prediction): phi has shape (M, C), base_value and
+        prediction have shape (C,), and base_value + phi.sum(axis=0) == prediction.
+        """
+        x = np.asarray(x, dtype=float)
+        masks = self._masks
+        n_masks, n_background = len(masks), len(self.background)
+
+        # One row per (coalition, background sample): features in the coalition come from x
+        rows = np.where(masks[:, None, :], x[None, None, :], self.background[None, :, :])
+        probabilities = self.predict_proba(rows.reshape(n_masks * n_background, self.n_features))
+        values = np.einsum('mbc,b->mc', probabilities.reshape(n_masks, n_background, -1), self.background_weights)
+
+        if self.exact:
+            base_value, prediction = values[0], values[-1]
+            return self._weights @ values, base_value, prediction
+
+        base_value, prediction = values[0], values[1]
+        return self._kernel_shap(values, base_value, prediction), base_value, prediction
+
+    def _kernel_shap(self, values, base_value, prediction):
+        """Weighted least squares subject to sum(phi) == prediction - base_value."""
+        Z = self._masks[2:].astype(float)
+        w = self._sample_weights[2:]
+        delta = prediction - base_value
+
+        # Eliminate the last feature through the efficiency constraint
+        y = values[2:] - base_value - Z[:, -1:] * delta
+        A = Z[:, :-1] - Z[:, -1:]
+        sqrt_w = np.sqrt(w)[:, None]
+        phi_head, *_ = np.linalg.lstsq(A * sqrt_w, y * sqrt_w, rcond=None)
+        phi_last = delta - phi_head.sum(axis=0)
+        return np.vstack([phi_head, phi_last])
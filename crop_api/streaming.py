@@ -0,0 +1,147 @@
+# Streaming (NDJSON) scoring and recommendation
+#
+# The generators here read input rows lazily, score them STREAM_CHUNK_SIZE at a time
+# and yield each chunk's results as newline-delimited JSON, one line per input row:
+#
+#   {"row": 0, "recommendations": [...]}
+#   {"row": 1, "error": "..."}
+#
+# Nothing is computed ahead of what the consumer has asked for, so when the WSGI
+# server blocks on a slow client the generator simply is not resumed, and memory stays
+# bounded by one chunk however many rows are sent.
+
+import json
+import logging
+import os
+import shutil
+import tempfile
+from itertools import islice
+
+from Top5_Crops_SHAP import features, get_top_k_recommendations_batch
+from crop_recommender import get_recommendation_records
+from observability import stage
+
+logger = logging.getLogger(__name__)
+
+# --- Settings ---
+# Input rows scored per chunk (and per write to the client)
+STREAM_CHUNK_SIZE = int(os.environ.get("STREAM_CHUNK_SIZE", 256))
+MAX_STREAM_CHUNK_SIZE = 10000
+# NDJSON uploads are spooled to a temporary file; up to this many bytes stay in memory
+STREAM_SPOOL_MEMORY = int(os.environ.get("STREAM_SPOOL_MEMORY", 1024 * 1024))
+
+
+def spool_lines(stream, max_memory=STREAM_SPOOL_MEMORY):
+    """
+    Copies an upload into a temporary file and yields its lines. Most HTTP clients only
+    read the response once their upload is sent, so answering while still reading
+    would deadlock once both socket buffers fill; spooling avoids that without
+    holding the upload in memory.
+    """
+    with tempfile.SpooledTemporaryFile(max_size=max_memory) as spool:
+        shutil.copyfileobj(stream, spool, 64 * 1024)
+        spool.seek(0)
+        yield from spool
+
+
+def iter_ndjson(lines):
+    """
+    Parses newline-delimited JSON lazily, skipping blank lines. A line that is not
+    valid JSON is yielded as a ValueError, so it is reported against its row.
+    """
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield ValueError(f"not valid JSON ({e})")
+
+
+def iter_chunks(rows, chunk_size):
+    """Yields lists of at most chunk_size (row number, row) pairs."""
+    numbered = enumerate(rows)
+    while True:
+        chunk = list(islice(numbered, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _line(payload):
+    return json.dumps(payload, separators=(',', ':')) + '\n'
+
+
+def _lab_features(row):
+    """The row as 7 floats in feature order, from a dict or a list."""
+    if isinstance(row, Exception):
+        raise row
+    values = [row[feature] for feature in features] if isinstance(row, dict) else list(row)
+    if len(values) != len(features):
+        raise ValueError(f"Expected {len(features)} features {features}, got {len(values)}.")
+    return [float(value) for value in values]
+
+
+def stream_lab_recommendations(rows, top_k=5, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Yields NDJSON text, one chunk at a time, with the top_k crops for every lab report
+    row. Each chunk is scored with one get_top_k_recommendations_batch call; rows that
+    cannot be read get an error line and do not stop the stream.
+
+    Args:
+        rows: Iterable of feature dicts or 7-value lists (or exceptions from iter_ndjson).
+        top_k (int): Crops per row.
+        chunk_size (int): Rows scored per batch.
+    """
+    for chunk in iter_chunks(rows, chunk_size):
+        lines = {}
+        valid_rows, X = [], []
+        for row_id, row in chunk:
+            try:
+                X.append(_lab_features(row))
+                valid_rows.append(row_id)
+            except (KeyError, ValueError, TypeError) as e:
+                lines[row_id] = _line({"row": row_id, "error": f"Invalid sample: {e}"})
+
+        if X:
+            for row_id, recommendations in zip(valid_rows, get_top_k_recommendations_batch(X, k=top_k)):
+                lines[row_id] = _line({"row": row_id, "recommendations": recommendations})
+
+        with stage('json_serialization'):
+            yield ''.join(lines[row_id] for row_id, _ in chunk)
+
+
+def stream_no_lab_recommendations(rows, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Yields NDJSON text, one chunk at a time, with the top 5 season/weather
+    recommendations for every {district, season, temperature, rainfall} row.
+    """
+    for chunk in iter_chunks(rows, chunk_size):
+        lines = []
+        for row_id, row in chunk:
+            try:
+                if isinstance(row, Exception):
+                    raise row
+                temperature, rainfall = row.get('temperature'), row.get('rainfall')
+                records = get_recommendation_records(
+                    row['district'], row['season'],
+                    None if temperature is None else float(temperature),
+                    None if rainfall is None else float(rainfall),
+                )
+                lines.append(_line({"row": row_id, "recommendations": records}))
+            except (KeyError, ValueError, TypeError, AttributeError) as e:
+                lines.append(_line({"row": row_id, "error": f"Invalid scenario: {e}"}))
+        yield ''.join(lines)
+
+
+def guard_stream(chunks, endpoint):
+    """
+    Passes chunks through, turning an unexpected failure into a final error line: the
+    200 status has already been sent, so this is the only way to tell the client.
+    """
+    try:
+        yield from chunks
+    except Exception as e:
+        logger.exception("Error in %s", endpoint)
+        yield _line({"error": str(e)})
@@ -1,94 +1,319 @@
-import requests
+import logging
 import os
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from observability import cache_events, stage, upstream_errors
+from weather_snapshots import ForecastRefresher, WeatherSnapshotStore, load_refresh_cells
+
+logger = logging.getLogger(__name__)
 
 # Your OpenWeatherMap API key
 # Best practice is to load this from an environment variable.
-API_KEY = "4dbc41b812e09d7531fc17cdcbec7082"
+API_KEY = os.environ.get("OPENWEATHER_API_KEY", "4dbc41b812e09d7531fc17cdcbec7082")
+
+# Free 5 Day / 3 Hour Forecast API endpoint. Override to point at a local stub server.
+FORECAST_URL = os.environ.get("OPENWEATHER_FORECAST_URL", "https://api.openweathermap.org/data/2.5/forecast")
+
+# (connect, read) timeouts in seconds for the upstream call
+REQUEST_TIMEOUT = (
+    float(os.environ.get("WEATHER_CONNECT_TIMEOUT", 3.05)),
+    float(os.environ.get("WEATHER_READ_TIMEOUT", 10)),
+)
+
+# --- Cache Settings ---
+# Coordinates are snapped to a grid of this many degrees (0.05° is roughly 5 km),
+# so farmers in the same village share one cache entry.
+CACHE_GRID_DEGREES = float(os.environ.get("WEATHER_CACHE_GRID", 0.05))
+# The forecast is published in 3-hour steps, so anything newer is still current.
+CACHE_TTL_SECONDS = float(os.environ.get("WEATHER_CACHE_TTL", 3 * 60 * 60))
+CACHE_MAX_ENTRIES = int(os.environ.get("WEATHER_CACHE_SIZE", 4096))
+
+# --- Snapshot Settings ---
+# When the upstream fails, the last stored forecast of a cell is served if it is at most
+# this old. Such stale values are cached for WEATHER_STALE_TTL seconds only, so the
+# upstream is tried again soon.
+WEATHER_MAX_STALENESS = float(os.environ.get("WEATHER_MAX_STALENESS", 24 * 60 * 60))
+WEATHER_STALE_TTL = float(os.environ.get("WEATHER_STALE_TTL", 60))
+# After an upstream failure for a cell, requests for that cell skip the upstream for this many seconds
+WEATHER_RETRY_SECONDS = float(os.environ.get("WEATHER_RETRY_SECONDS", 30))
+
+
+def _make_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+# Shared pooled session, so repeated calls reuse the TLS connection to the API.
+_session = _make_session()
+
+
+class _InFlight:
+    """A pending upstream fetch that concurrent callers for the same cell wait on."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+
+
+class WeatherCache:
+    """
+    Thread-safe LRU cache with a per-entry TTL, keyed on coordinates snapped to a grid.
+
+    Concurrent misses for the same grid cell are coalesced: the first caller fetches
+    from upstream while the others wait for its result instead of issuing their own
+    request. Each entry expires after the TTL the loader returns with it; failed
+    fetches (a None value) are not cached.
+    """
+
+    def __init__(self, grid_degrees=CACHE_GRID_DEGREES, ttl_seconds=CACHE_TTL_SECONDS,
+                 max_entries=CACHE_MAX_ENTRIES):
+        self.grid_degrees = grid_degrees
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def cell(self, lat, lon):
+        """Returns the grid cell key for a coordinate."""
+        return round(lat / self.grid_degrees), round(lon / self.grid_degrees)
+
+    def cell_center(self, key):
+        return key[0] * self.grid_degrees, key[1] * self.grid_degrees
+
+    def get_or_load(self, key, loader, wait_timeout=None):
+        """
+        Returns the cached value for key, calling loader() on a miss.
+
+        Args:
+            key: Grid cell key from cell().
+            loader (callable): Returns (value, ttl_seconds); value is None on failure.
+            wait_timeout (float): How long a coalesced caller waits for the in-flight fetch.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    cache_events.inc(cache='weather', result='hit')
+                    return entry[1]
+                del self._entries[key]
+
+            flight = self._in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._in_flight[key] = _InFlight()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+        cache_events.inc(cache='weather', result='miss' if leader else 'coalesced')
+
+        if not leader:
+            flight.event.wait(wait_timeout)
+            return flight.value
+
+        value = None
+        try:
+            value, ttl_seconds = loader()
+        finally:
+            with self._lock:
+                if value is not None:
+                    self._entries[key] = (time.monotonic() + ttl_seconds, value)
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+                        self.evictions += 1
+                del self._in_flight[key]
+            flight.value = value
+            flight.event.set()
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "grid_degrees": self.grid_degrees,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "hit_ratio": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+            }
+
+
+weather_cache = WeatherCache()
+weather_snapshots = WeatherSnapshotStore()
+
+
+def _fetch_forecast(lat: float, lon: float, session=None):
+    """
+    Calls the 5 Day / 3 Hour Forecast API and reduces it to
+    (temperature, humidity, total_rainfall). Returns None on error.
+    """
+    # We set units to 'metric' for Celsius and mm.
+    params = {"lat": lat, "lon": lon, "appid": API_KEY, "units": "metric"}
+
+    try:
+        with stage('weather_fetch'):
+            response = (session or _session).get(FORECAST_URL, params=params, timeout=REQUEST_TIMEOUT)
+            response.raise_for_status()  # Raise HTTPError for bad responses
+            data = response.json()
+
+        # Current temperature and humidity from the first forecast entry as a proxy,
+        # total 5-day rainfall as the sum of 'rain.3h' over all entries
+        entries = data['list']
+        current = entries[0]['main']
+        total_rainfall = sum(entry['rain'].get('3h', 0) for entry in entries if 'rain' in entry)
+        return current['temp'], current['humidity'], total_rainfall
+    except requests.exceptions.RequestException as e:
+        upstream_errors.inc(service='openweathermap')
+        # Only the host and status: the exception text holds the full URL, API key included
+        status = e.response.status_code if e.response is not None else None
+        logger.warning("Error during API call to 5 Day / 3 Hour Forecast API at %s: %s (status %s)",
+                       urlparse(FORECAST_URL).netloc, type(e).__name__, status)
+        return None
+    except (KeyError, IndexError, ValueError) as e:
+        upstream_errors.inc(service='openweathermap')
+        logger.warning("Error parsing weather data: missing key %s. API response format may have changed or data is unavailable.", e)
+        return None
+
+
+_upstream_retry_at = {}  # (cell_lat, cell_lon) -> monotonic time before which the upstream is skipped
+_stats = {"snapshot_hits": 0, "upstream_fetches": 0, "stale_served": 0}
+
+
+def _load_cell(cell_lat, cell_lon):
+    """
+    Loader for a weather cache miss: the stored snapshot while it is younger than the
+    cache TTL, else the upstream (unless it failed for this cell in the last
+    WEATHER_RETRY_SECONDS), else a snapshot up to WEATHER_MAX_STALENESS old.
+    Returns (value, ttl_seconds).
+    """
+    latest = weather_snapshots.latest(cell_lat, cell_lon)
+    age = time.time() - latest[0] if latest is not None else None
+    if latest is not None and age < weather_cache.ttl_seconds:
+        _stats["snapshot_hits"] += 1
+        cache_events.inc(cache='weather_snapshot', result='hit')
+        return latest[1], weather_cache.ttl_seconds - age
+
+    now = time.monotonic()
+    if now >= _upstream_retry_at.get((cell_lat, cell_lon), 0.0):
+        _stats["upstream_fetches"] += 1
+        value = _fetch_forecast(cell_lat, cell_lon)
+        if value is not None:
+            _upstream_retry_at.pop((cell_lat, cell_lon), None)
+            weather_snapshots.put(cell_lat, cell_lon, value)
+            return value, weather_cache.ttl_seconds
+        if len(_upstream_retry_at) >= weather_cache.max_entries:
+            for cell in [cell for cell, retry_at in list(_upstream_retry_at.items()) if retry_at <= now]:
+                _upstream_retry_at.pop(cell, None)
+        _upstream_retry_at[(cell_lat, cell_lon)] = now + WEATHER_RETRY_SECONDS
+
+    if latest is not None and age < WEATHER_MAX_STALENESS:
+        _stats["stale_served"] += 1
+        cache_events.inc(cache='weather_snapshot', result='stale')
+        return latest[1], WEATHER_STALE_TTL
+    cache_events.inc(cache='weather_snapshot', result='miss')
+    return None, 0
+
+
+def _cell_center(lat, lon):
+    """The weather cache key and the rounded grid cell center of a coordinate."""
+    key = weather_cache.cell(float(lat), float(lon))
+    cell_lat, cell_lon = weather_cache.cell_center(key)
+    return key, round(cell_lat, 4), round(cell_lon, 4)
+
 
 def get_weather_data(lat: float, lon: float):
     """
     Fetches the current temperature and 5-day rainfall forecast from the free OpenWeatherMap API.
-    
+    Results are cached per grid cell (see WeatherCache) and stored as snapshots (see
+    weather_snapshots.py), so nearby coordinates within the TTL are answered without an
+    upstream call, and a recent stored forecast is served while the upstream is down.
+
     Args:
         lat (float): Latitude of the location.
         lon (float): Longitude of the location.
-    
+
     Returns:
-        tuple: A tuple containing the current temperature (float, in Celsius) and 
-               the total 5-day rainfall (float, in mm).
-               Returns (None, None) on error.
+        tuple: A tuple containing the current temperature (float, in Celsius),
+               humidity (%) and the total 5-day rainfall (float, in mm).
+               Returns (None, None, None) on error.
     """
-    # Using the free 5 Day / 3 Hour Forecast API endpoint.
-    # We set units to 'metric' for Celsius and mm.
-    WEATHER_URL = f"https://api.openweathermap.org/data/2.5/forecast?lat={lat}&lon={lon}&appid={API_KEY}&units=metric"
-    
-    try:
-        response = requests.get(WEATHER_URL)
-        response.raise_for_status()  # Raise HTTPError for bad responses
-        data = response.json()
-        
-        # Get current temperature from the first forecast entry as a proxy
-        current_temp = data['list'][0]['main']['temp']
-        current_humidity = data['list'][0]['main']['humidity']
-        
-        # Calculate total 5-day rainfall by summing up 'rain.3h' for each entry
-        total_rainfall = 0
-        if 'list' in data:
-            for entry in data['list']:
-                total_rainfall += entry.get('rain', {}).get('3h', 0)
-        
-        return current_temp, current_humidity, total_rainfall
-    except requests.exceptions.RequestException as e:
-        print(f"Error during API call to 5 Day / 3 Hour Forecast API: {e}")
-        return None, None, None
-    except KeyError as e:
-        print(f"Error parsing weather data: Missing key {e}. API response format may have changed or data is unavailable.")
+    weather_refresher.ensure_running()
+    key, cell_lat, cell_lon = _cell_center(lat, lon)
+    result = weather_cache.get_or_load(
+        key,
+        lambda: _load_cell(cell_lat, cell_lon),
+        wait_timeout=sum(REQUEST_TIMEOUT),
+    )
+    if result is None:
         return None, None, None
-# Save this code as 'app.py' in your crop_api folder
-
-from flask import Flask, request, jsonify
-from crop_recommender import get_final_recommendation
-from weather_service import get_weather_data # Correctly import the function
-
-app = Flask(__name__)
-
-# This is the API endpoint your Flutter app will call
-@app.route('/recommendations', methods=['POST'])
-def recommendations():
-    data = request.json
-    
-    # Print to confirm that a request has been received
-    print("Received a request for recommendations.")
-    
-    lat = data.get('latitude')
-    lon = data.get('longitude')
-    
-    if not lat or not lon:
-        return jsonify({"error": "Latitude and longitude are required."}), 400
-    
-    # Call the get_weather_data function directly
-    temp, humidity, rainfall = get_weather_data(lat, lon)
-    
-    # These would come from a different input screen
-    district = 'Ahmednagar'
-    season = 'kharif'
-    
-    # Call the crop recommender with dummy inputs
-    final_recs = get_final_recommendation(district, season, temp, rainfall)
-    
-    return jsonify(final_recs.to_dict(orient='records'))
-
-if __name__ == '__main__':
-    # This will expose your API to the local network
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    return result
+
+
+def get_last_known_weather(lat: float, lon: float):
+    """
+    The newest stored (temperature, humidity, rainfall) for a coordinate's cell if it
+    is at most WEATHER_MAX_STALENESS old, else None. Never calls the upstream, so it
+    is the fallback when get_weather_data misses its deadline.
+    """
+    _, cell_lat, cell_lon = _cell_center(lat, lon)
+    latest = weather_snapshots.latest(cell_lat, cell_lon)
+    if latest is None or time.time() - latest[0] >= WEATHER_MAX_STALENESS:
+        return None
+    _stats["stale_served"] += 1
+    cache_events.inc(cache='weather_snapshot', result='stale')
+    return latest[1]
+
+
+# The refresher has its own session, so it never holds a connection request handlers wait for
+_refresh_session = _make_session()
+weather_refresher = ForecastRefresher(
+    sorted({_cell_center(lat, lon)[1:] for lat, lon in load_refresh_cells()}),
+    lambda lat, lon: _fetch_forecast(lat, lon, session=_refresh_session),
+    weather_snapshots,
+)
+
+
+def get_weather_cache_stats():
+    """Hit/miss counters and occupancy of the weather cache, the snapshot store and the refresher."""
+    stats = weather_cache.stats()
+    stats.update(_stats)
+    stats["snapshots"] = weather_snapshots.stats()
+    stats["refresher"] = weather_refresher.status()
+    return stats
+
+
 # Example usage of the function
 if __name__ == "__main__":
     # Example coordinates for Borivali, Mumbai, Maharashtra, India
     latitude = 19.23
     longitude = 72.86
-    
+
     temp, humidity, rain = get_weather_data(latitude, longitude)
-    
+
     if temp is not None and rain is not None:
         print(f"Current Weather for Borivali, Mumbai:")
         print(f"Temperature: {temp:.2f}°C")
@@ -0,0 +1,262 @@
+# Local store of aggregated weather forecasts, and the background refresher filling it
+#
+# A forecast is reduced to the three features the recommenders use (temperature,
+# humidity and 5-day rainfall) and kept as one row per (grid cell, fetch time) in a
+# SQLite file shared by all gunicorn workers. Reading the latest snapshot of a cell is
+# an indexed lookup, and older snapshots stay available for WEATHER_SNAPSHOT_RETENTION
+# seconds, so a request can still be answered from the last known forecast while the
+# upstream API is slow or down.
+#
+# With WEATHER_REFRESH_CELLS set, a background thread re-fetches a fixed list of cells
+# every WEATHER_REFRESH_INTERVAL seconds:
+#
+#   WEATHER_REFRESH_CELLS=districts        every district centroid in datasets/district-centroids.csv
+#   WEATHER_REFRESH_CELLS=/path/cells.csv  a CSV with latitude and longitude columns
+#
+# Every worker starts the thread on its first weather lookup, and an exclusive lock on
+# the store file elects one of them to do the refreshing; the others only take over
+# if it exits. Threads are never started in the gunicorn master, which forks workers.
+
+import fcntl
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# --- Base Directory ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# --- Settings ---
+WEATHER_SNAPSHOT_PATH = os.environ.get("WEATHER_SNAPSHOT_PATH", os.path.join(BASE_DIR, 'weather_snapshots.sqlite3'))
+# Snapshots older than this are deleted by the refresher
+WEATHER_SNAPSHOT_RETENTION = float(os.environ.get("WEATHER_SNAPSHOT_RETENTION", 7 * 24 * 60 * 60))
+# 'districts', a CSV path, or empty to disable the refresher
+WEATHER_REFRESH_CELLS = os.environ.get("WEATHER_REFRESH_CELLS", "")
+WEATHER_REFRESH_INTERVAL = float(os.environ.get("WEATHER_REFRESH_INTERVAL", 30 * 60))
+# Upper bound on upstream calls per minute made by the refresher (free tier allows 60)
+WEATHER_REFRESH_RATE = float(os.environ.get("WEATHER_REFRESH_RATE", 50))
+# A refresh pass stops early after this many failures in a row (upstream down)
+WEATHER_REFRESH_MAX_FAILURES = 3
+centroids_path = os.path.join(BASE_DIR, 'datasets', 'district-centroids.csv')
+
+
+class WeatherSnapshotStore:
+    """
+    Time-indexed SQLite store of (temperature, humidity, rainfall) per coordinate. The
+    value columns have no type, so numbers come back exactly as the upstream sent them.
+    Coordinates are rounded to 4 decimals for the key, so pass grid cell centers.
+    Each process opens its own connection, so it is safe to use after a gunicorn fork.
+    """
+
+    def __init__(self, path=WEATHER_SNAPSHOT_PATH, retention_seconds=WEATHER_SNAPSHOT_RETENTION):
+        self.path = path
+        self.retention_seconds = retention_seconds
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    def _connection(self):
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS weather_snapshot ("
+                " lat_key REAL NOT NULL, lon_key REAL NOT NULL, fetched_at REAL NOT NULL,"
+                " temperature, humidity, rainfall,"
+                " PRIMARY KEY (lat_key, lon_key, fetched_at)) WITHOUT ROWID"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS weather_snapshot_fetched_at ON weather_snapshot (fetched_at)")
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    @staticmethod
+    def key(lat, lon):
+        return round(float(lat), 4), round(float(lon), 4)
+
+    def latest(self, lat, lon):
+        """The newest snapshot of a coordinate as (fetched_at, (temperature, humidity, rainfall)), or None."""
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT fetched_at, temperature, humidity, rainfall FROM weather_snapshot"
+                " WHERE lat_key = ? AND lon_key = ? ORDER BY fetched_at DESC LIMIT 1",
+                self.key(lat, lon),
+            ).fetchone()
+        return (row[0], row[1:]) if row else None
+
+    def put(self, lat, lon, values, fetched_at=None):
+        """Adds a (temperature, humidity, rainfall) snapshot, timestamped now by default."""
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO weather_snapshot VALUES (?, ?, ?, ?, ?, ?)",
+                (*self.key(lat, lon), time.time() if fetched_at is None else fetched_at, *values),
+            )
+            conn.commit()
+
+    def prune(self):
+        """Deletes snapshots older than the retention period. Returns the number deleted."""
+        with self._lock:
+            conn = self._connection()
+            deleted = conn.execute("DELETE FROM weather_snapshot WHERE fetched_at < ?",
+                                   (time.time() - self.retention_seconds,)).rowcount
+            conn.commit()
+        return deleted
+
+    def clear(self):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM weather_snapshot")
+            conn.commit()
+
+    def stats(self):
+        with self._lock:
+            snapshots, cells, oldest, newest = self._connection().execute(
+                "SELECT COUNT(*), COUNT(DISTINCT lat_key || ',' || lon_key), MIN(fetched_at), MAX(fetched_at)"
+                " FROM weather_snapshot"
+            ).fetchone()
+        now = time.time()
+        return {
+            "path": self.path,
+            "snapshots": snapshots,
+            "cells": cells,
+            "oldest_age_seconds": now - oldest if oldest is not None else None,
+            "newest_age_seconds": now - newest if newest is not None else None,
+            "retention_seconds": self.retention_seconds,
+        }
+
+
+def load_refresh_cells(spec=WEATHER_REFRESH_CELLS):
+    """The (lat, lon) list named by WEATHER_REFRESH_CELLS; empty when unset."""
+    if not spec:
+        return []
+    df = pd.read_csv(centroids_path if spec == 'districts' else spec)
+    return list(zip(df['latitude'].astype(float), df['longitude'].astype(float)))
+
+
+class ForecastRefresher:
+    """
+    Background thread that fetches every cell in turn, at most rate_per_minute calls per
+    minute, stores the aggregates and prunes old snapshots, then sleeps for interval
+    seconds. Cells whose newest snapshot is less than one interval old are skipped, so
+    a restarted worker does not repeat a pass that just ran.
+
+    Args:
+        cells (list): (lat, lon) grid cell centers to keep fresh.
+        fetch (callable): fetch(lat, lon) -> (temperature, humidity, rainfall) or None.
+        store (WeatherSnapshotStore): Where snapshots are written.
+        interval (float): Seconds between passes.
+        rate_per_minute (float): Upstream call budget.
+    """
+
+    def __init__(self, cells, fetch, store, interval=WEATHER_REFRESH_INTERVAL, rate_per_minute=WEATHER_REFRESH_RATE):
+        self.cells = cells
+        self.fetch = fetch
+        self.store = store
+        self.interval = interval
+        self.min_spacing = 60.0 / rate_per_minute if rate_per_minute > 0 else 0.0
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._lock_file = None
+        self._start_lock = threading.Lock()
+        self.passes = 0
+        self.refreshed = 0
+        self.failed = 0
+        self.last_pass_at = None
+        self.last_pass_seconds = None
+
+    def ensure_running(self):
+        """Starts the thread in this process unless it already runs here. Cheap to call per request."""
+        if self._pid == os.getpid() or not self.cells:
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._stop.clear()
+            self._lock_file = None
+            self._thread = threading.Thread(target=self._run, name='forecast-refresher', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join()
+
+    def _is_leader(self):
+        """Takes (or keeps) the exclusive lock on the store; only its holder refreshes."""
+        if self._lock_file is not None:
+            return True
+        lock_file = open(f"{self.store.path}.refresh.lock", 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        logger.info("Weather refresher running in process %s for %d cells", os.getpid(), len(self.cells))
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self._is_leader():
+                    self.refresh_once()
+            except Exception:
+                logger.exception("Weather refresh pass failed")
+            self._stop.wait(self.interval)
+
+    def refresh_once(self):
+        """One pass over the cells. Returns the number of cells refreshed."""
+        started = time.monotonic()
+        refreshed = failures_in_row = 0
+        next_call = 0.0
+        for lat, lon in self.cells:
+            if self._stop.is_set():
+                break
+            latest = self.store.latest(lat, lon)
+            if latest is not None and time.time() - latest[0] < self.interval:
+                continue
+            delay = next_call - time.monotonic()
+            if delay > 0 and self._stop.wait(delay):
+                break
+            next_call = time.monotonic() + self.min_spacing
+
+            values = self.fetch(lat, lon)
+            if values is None:
+                self.failed += 1
+                failures_in_row += 1
+                if failures_in_row >= WEATHER_REFRESH_MAX_FAILURES:
+                    logger.warning("Weather refresh pass stopped after %d failures in a row", failures_in_row)
+                    break
+                continue
+            failures_in_row = 0
+            self.store.put(lat, lon, values)
+            refreshed += 1
+
+        pruned = self.store.prune()
+        self.refreshed += refreshed
+        self.passes += 1
+        self.last_pass_at = time.time()
+        self.last_pass_seconds = time.monotonic() - started
+        logger.info("Weather refresh pass: %d of %d cells refreshed, %d old snapshots pruned in %.1fs",
+                    refreshed, len(self.cells), pruned, self.last_pass_seconds)
+        return refreshed
+
+    def status(self):
+        return {
+            "cells": len(self.cells),
+            "interval_seconds": self.interval,
+            "running_in_this_process": self._pid == os.getpid() and self._thread is not None and self._thread.is_alive(),
+            "refreshing_in_this_process": self._lock_file is not None,
+            "passes": self.passes,
+            "refreshed": self.refreshed,
+            "failed": self.failed,
+            "last_pass_at": self.last_pass_at,
+            "last_pass_seconds": self.last_pass_seconds,
+        }
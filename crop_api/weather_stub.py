@@ -0,0 +1,105 @@
+# Local stand-in for the OpenWeatherMap 5 Day / 3 Hour Forecast API
+#
+# Serves /forecast with the same JSON shape as the real endpoint (40 entries with
+# main.temp, main.humidity and rain.3h), with configurable latency and failures.
+# Used by the benchmarks and load test, and handy for running the app offline:
+#
+#   python weather_stub.py --port 8099
+#   OPENWEATHER_FORECAST_URL=http://127.0.0.1:8099/forecast python app.py
+
+import argparse
+import json
+import math
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def forecast_payload(lat, lon, entries=40):
+    """Deterministic forecast for a coordinate, varying smoothly with location."""
+    base_temp = 18 + 12 * abs(math.sin(math.radians(lat * 3)))
+    rain = max(0.0, 4 * math.sin(math.radians(lon * 7)))
+    return {
+        "cod": "200",
+        "cnt": entries,
+        "list": [
+            {
+                "dt": 1700000000 + i * 3 * 3600,
+                "main": {"temp": round(base_temp + 3 * math.sin(i / 4), 2), "humidity": 60 + (i % 5) * 4},
+                **({"rain": {"3h": round(rain * (i % 3), 2)}} if rain and i % 3 else {}),
+            }
+            for i in range(entries)
+        ],
+    }
+
+
+class WeatherStubServer:
+    """
+    Threaded stub server. Runs in a background thread until stop() is called.
+
+    Args:
+        host (str): Interface to bind.
+        port (int): Port to bind; 0 picks a free port.
+        latency (float): Seconds to sleep before answering each request.
+        fail (bool): Answer every request with HTTP 503.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, fail=False):
+        self.latency = latency
+        self.fail = fail
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.requests += 1
+                if stub.latency:
+                    time.sleep(stub.latency)
+                url = urlparse(self.path)
+                if stub.fail or url.path.rstrip('/') != '/forecast':
+                    self.send_error(503 if stub.fail else 404)
+                    return
+                query = parse_qs(url.query)
+                body = json.dumps(forecast_payload(float(query['lat'][0]), float(query['lon'][0]))).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def forecast_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/forecast"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a local OpenWeatherMap forecast stub.")
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--latency', type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = WeatherStubServer(port=args.port, latency=args.latency).start()
+    print(f"Serving forecast stub at {server.forecast_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,309 @@
+# Incremental yield statistics for the season stage of the recommender
+#
+# Average yields per (district, season, crop) are kept as running sums and counts.
+# They start from season-wise-crop.csv and grow with observations appended to an
+# NDJSON log (one {"district", "season", "crop", "yield"} object per line):
+#
+#   - Ingesting appends to the log under an exclusive file lock. Every process, i.e.
+#     every gunicorn worker, tails the log (checking at most every
+#     YIELD_REFRESH_INTERVAL seconds) and applies new lines in O(1) each, so all
+#     workers converge on the same statistics.
+#   - Readers see the ranked top 5 per (district, season) through `view`, a dict that
+#     is rebuilt for the touched groups and swapped in by a single assignment, so a
+#     reader sees either all or none of a batch of observations.
+#   - The sums, counts and log offset are snapshotted to disk every
+#     YIELD_SNAPSHOT_EVERY observations. A restart loads the snapshot and only replays
+#     the log beyond it, instead of re-reading every observation.
+#
+# A snapshot is only used with the season file it was built on and the same log file
+# (inode); otherwise the statistics are rebuilt from the CSV and the whole log. After
+# folding the logged observations into season-wise-crop.csv, move the log away.
+
+import fcntl
+import gzip
+import heapq
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# --- Base Directory ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# --- Settings ---
+observations_path = os.environ.get("YIELD_OBSERVATIONS_PATH",
+                                   os.path.join(BASE_DIR, 'datasets', 'yield-observations.ndjson'))
+snapshot_path = os.environ.get("YIELD_SNAPSHOT_PATH", os.path.join(BASE_DIR, 'yield_stats_snapshot.json.gz'))
+# Seconds between checks of the log for other processes' appends
+YIELD_REFRESH_INTERVAL = float(os.environ.get("YIELD_REFRESH_INTERVAL", 0.5))
+# Logged observations applied between snapshots
+YIELD_SNAPSHOT_EVERY = int(os.environ.get("YIELD_SNAPSHOT_EVERY", 500))
+# Largest accepted yield (tonnes/hectare); the season file tops out around 35
+YIELD_MAX = float(os.environ.get("YIELD_MAX", 100))
+# Crops kept in the ranked view of each (district, season)
+TOP_N = 5
+
+SNAPSHOT_FORMAT = 1
+
+
+def _ranked(crops, n=TOP_N):
+    """Top n of {crop: [sum, count]} as a DataFrame of crop and mean yield, best first."""
+    best = heapq.nsmallest(n, ((-total / count, crop) for crop, (total, count) in crops.items()))
+    return pd.DataFrame({'crop': [crop for _, crop in best], 'score': [-score for score, _ in best]})
+
+
+def parse_observation(record, crop_mapping=None):
+    """
+    Validates one observation and returns (district, season, crop, yield).
+    Raises ValueError when a field is missing or the yield is not a number between 0
+    and YIELD_MAX. The log is append-only, so an implausible value accepted here would
+    skew its district's averages for good.
+    """
+    if not isinstance(record, dict):
+        raise ValueError("an observation must be an object")
+    try:
+        district, season, crop = (str(record[field]).strip() for field in ('district', 'season', 'crop'))
+        if isinstance(record['yield'], bool):
+            raise TypeError("got a boolean")
+        value = float(record['yield'])
+    except KeyError as e:
+        raise ValueError(f"missing field {e}") from e
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"yield must be a number ({e})") from e
+    if not (district and season and crop):
+        raise ValueError("district, season and crop must not be empty")
+    if not math.isfinite(value) or not 0 <= value <= YIELD_MAX:
+        raise ValueError(f"yield must be a number between 0 and {YIELD_MAX:g}")
+    if crop_mapping:
+        crop = crop_mapping.get(crop, crop)
+    return district, season, crop, value
+
+
+class YieldStats:
+    """
+    Running yield sums and counts with a ranked, atomically published top-5 view.
+
+    Args:
+        groups (dict): (district, season) -> {crop: [sum, count]}. Owned by this object.
+        base_sha256 (str): sha256 of the season file the groups started from.
+        log_path (str): Observation log to tail.
+        log_offset (int): Bytes of the log already included in groups.
+        observations (int): Logged observations already included in groups.
+        crop_mapping (dict): Crop name standardization applied to logged observations.
+    """
+
+    def __init__(self, groups, base_sha256, log_path=observations_path, log_offset=0, observations=0,
+                 crop_mapping=None, snapshot_path=snapshot_path):
+        self._groups = groups
+        self._lock = threading.Lock()
+        self.base_sha256 = base_sha256
+        self.log_path = log_path
+        self.log_offset = log_offset
+        self.log_inode = None
+        self.observations = observations
+        self.crop_mapping = crop_mapping or {}
+        self.snapshot_path = snapshot_path
+        self._snapshot_observations = observations
+        self.rejected = 0
+        self._next_check = 0.0
+        self.view = {key: _ranked(crops) for key, crops in groups.items()}
+
+    # --- Construction ---
+    @classmethod
+    def from_frame(cls, df_season, base_sha256, **kwargs):
+        """Groups from a season table with district_name, season, crop_name and yield columns."""
+        grouped = df_season.groupby(['district_name', 'season', 'crop_name'], sort=True)['yield'].agg(['sum', 'count'])
+        groups = {}
+        for (district, season, crop), total, count in zip(grouped.index, grouped['sum'].tolist(),
+                                                          grouped['count'].tolist()):
+            groups.setdefault((district, season), {})[crop] = [total, count]
+        return cls(groups, base_sha256, **kwargs)
+
+    @classmethod
+    def load(cls, df_season, base_sha256, log_path=observations_path, snapshot_path=snapshot_path, crop_mapping=None):
+        """
+        Statistics from the snapshot when it belongs to this season file and log,
+        otherwise from df_season. Either way the log is then replayed from where the
+        starting point left off.
+        """
+        kwargs = dict(log_path=log_path, crop_mapping=crop_mapping, snapshot_path=snapshot_path)
+        stats = cls._from_snapshot(base_sha256, **kwargs) or cls.from_frame(df_season, base_sha256, **kwargs)
+        stats.refresh(force=True)
+        return stats
+
+    @classmethod
+    def _from_snapshot(cls, base_sha256, log_path, snapshot_path, crop_mapping):
+        try:
+            with gzip.open(snapshot_path, 'rt', encoding='utf-8') as f:
+                snapshot = json.load(f)
+            log_stat = os.stat(log_path)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring yield snapshot %s: %s", snapshot_path, e)
+            return None
+
+        if (snapshot.get('format') != SNAPSHOT_FORMAT or snapshot.get('base_sha256') != base_sha256
+                or snapshot.get('log_inode') != log_stat.st_ino or snapshot.get('log_offset', 0) > log_stat.st_size):
+            logger.info("Yield snapshot does not match the season file or observation log; rebuilding.")
+            return None
+
+        groups = {}
+        for district, season, crop, total, count in snapshot['groups']:
+            groups.setdefault((district, season), {})[crop] = [total, count]
+        stats = cls(groups, base_sha256, log_path=log_path, log_offset=snapshot['log_offset'],
+                    observations=snapshot['observations'], crop_mapping=crop_mapping, snapshot_path=snapshot_path)
+        stats.log_inode = log_stat.st_ino
+        return stats
+
+    # --- Ingestion ---
+    def append(self, records):
+        """
+        Validates records and appends them to the observation log, then applies every
+        new line of the log (including other processes' appends).
+
+        Returns:
+            tuple: (number of records appended, list of (index, error) for rejected ones)
+        """
+        lines, errors = [], []
+        for i, record in enumerate(records):
+            try:
+                district, season, crop, value = parse_observation(record)
+            except ValueError as e:
+                errors.append((i, str(e)))
+                continue
+            lines.append(json.dumps({"district": district, "season": season, "crop": crop, "yield": value,
+                                     "observed_at": record.get('observed_at'), "received_at": time.time()}) + '\n')
+
+        if lines:
+            with open(self.log_path, 'a', encoding='utf-8') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    f.write(''.join(lines))
+                    f.flush()
+                    os.fsync(f.fileno())
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+        self.refresh(force=True)
+        return len(lines), errors
+
+    def refresh(self, force=False):
+        """
+        Applies log lines appended since the last check and publishes the touched
+        groups. Without force the log is looked at most every YIELD_REFRESH_INTERVAL
+        seconds, and a check that finds nothing new is one stat call.
+        Returns the log offset.
+        """
+        now = time.monotonic()
+        if not force and now < self._next_check:
+            return self.log_offset
+        self._next_check = now + YIELD_REFRESH_INTERVAL
+        try:
+            log_stat = os.stat(self.log_path)
+        except FileNotFoundError:
+            return self.log_offset
+        if log_stat.st_size == self.log_offset and log_stat.st_ino == self.log_inode:
+            return self.log_offset
+
+        with self._lock:
+            if (self.log_inode is not None and log_stat.st_ino != self.log_inode) or log_stat.st_size < self.log_offset:
+                logger.warning("%s was replaced or truncated; reload the datasets to rebuild the yield statistics.",
+                               self.log_path)
+                self.log_inode = log_stat.st_ino
+                self.log_offset = log_stat.st_size
+                return self.log_offset
+            self.log_inode = log_stat.st_ino
+
+            with open(self.log_path, 'rb') as f:
+                f.seek(self.log_offset)
+                data = f.read()
+            # A line still being written by another process is picked up next time
+            complete = data[:data.rfind(b'\n') + 1]
+            touched = set()
+            for line in complete.splitlines():
+                self._apply(line, touched)
+            self.log_offset += len(complete)
+
+            if touched:
+                view = dict(self.view)
+                for key in touched:
+                    view[key] = _ranked(self._groups[key])
+                self.view = view
+            # Taken under the lock, so only one caller writes each due snapshot
+            due = self.observations - self._snapshot_observations >= YIELD_SNAPSHOT_EVERY
+            snapshot = self._snapshot() if due else None
+        if snapshot is not None:
+            self._write_snapshot(snapshot, self.snapshot_path)
+        return self.log_offset
+
+    def _apply(self, line, touched):
+        """Adds one logged observation to its running sum and count: O(1)."""
+        try:
+            district, season, crop, value = parse_observation(json.loads(line), self.crop_mapping)
+        except ValueError as e:
+            self.rejected += 1
+            logger.warning("Skipping yield observation %r: %s", line[:200], e)
+            return
+        key = (district, season)
+        totals = self._groups.setdefault(key, {}).setdefault(crop, [0.0, 0])
+        totals[0] += value
+        totals[1] += 1
+        self.observations += 1
+        touched.add(key)
+
+    # --- Reading ---
+    def top(self, district, season, n=TOP_N):
+        """Ranked crops of a (district, season) as a DataFrame of crop and score, or None."""
+        if n <= TOP_N:
+            ranked = self.view.get((district, season))
+            # Published frames are never modified, so the full top 5 is returned as is
+            return ranked if ranked is None or n >= len(ranked) else ranked.head(n)
+        with self._lock:
+            crops = self._groups.get((district, season))
+            return _ranked(crops, n) if crops is not None else None
+
+    # --- Snapshots ---
+    def save_snapshot(self, path=None):
+        """Writes the sums, counts and log position atomically."""
+        with self._lock:
+            snapshot = self._snapshot()
+        self._write_snapshot(snapshot, path or self.snapshot_path)
+
+    def _snapshot(self):
+        """The current state as a JSON-serializable dict. Call with the lock held."""
+        self._snapshot_observations = self.observations
+        return {
+            "format": SNAPSHOT_FORMAT,
+            "created_at": time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            "base_sha256": self.base_sha256,
+            "log_inode": self.log_inode,
+            "log_offset": self.log_offset,
+            "observations": self.observations,
+            "groups": [[district, season, crop, total, count]
+                       for (district, season), crops in self._groups.items()
+                       for crop, (total, count) in crops.items()],
+        }
+
+    @staticmethod
+    def _write_snapshot(snapshot, path):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("Could not write yield snapshot %s: %s", path, e)
+
+    def status(self):
+        return {
+            "observations": self.observations,
+            "rejected": self.rejected,
+            "log_offset": self.log_offset,
+            "groups": len(self.view),
+        }